@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
+from backend.caching import bump_order_version
 from backend.models import (
     Order,
     OrderItem,
@@ -78,15 +79,20 @@ class OrderAdmin(admin.ModelAdmin):
     def confirm_orders(self, request, queryset):
         """Массовое подтверждение заказов"""
 
+        # update() не отправляет сигналы, версии заказов увеличиваем сами
+        user_ids = set(queryset.values_list('user_id', flat=True))
         count = queryset.update(state='confirmed')
+        bump_order_version(*user_ids)
         self.message_user(request, f'Подтверждено заказов: {count}')
 
     @admin.action(description='Отправить заказы')
     def send_orders(self, request, queryset):
         """Массовое изменение статуса + отправка писем"""
 
-        order_ids = [order.id for order in queryset]
+        orders = list(queryset.values_list('id', 'user_id'))
         count = queryset.update(state='sent')
+        bump_order_version(*{user_id for _, user_id in orders})
+        order_ids = [order_id for order_id, _ in orders]
         send_email.delay(order_ids)
         self.message_user(request, f'Отправлено заказов: {count}')
 
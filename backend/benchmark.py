@@ -0,0 +1,346 @@
+"""Синтетические прайс-листы и замеры производительности импорта
+и сериализации каталога"""
+
+import json
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+
+from django.core.files import File
+from django.db import connection
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from backend.catalog import PARAMETER_ORDERING
+from backend.models import (
+    CatalogEntry,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.serializers import (
+    CATALOG_ENTRY_VALUES,
+    CatalogEntrySerializer,
+    ProductInfoSerializer,
+)
+from backend.storage import spool_price_file
+from backend.tasks import partner_import
+from procure.celery import app as celery_app
+from users.models import User
+
+BENCHMARK_EMAIL_DOMAIN = 'benchmark.local'
+BENCHMARK_PRODUCT_PREFIX = 'Bench'
+
+CATEGORIES = {
+    224: ('Смартфоны', {
+        'Диагональ (дюйм)': ['5.8', '6.1', '6.5', '6.7'],
+        'Разрешение (пикс)': ['2340x1080', '2532x1170', '2778x1284'],
+        'Встроенная память (Гб)': ['64', '128', '256', '512'],
+        'Цвет': ['черный', 'белый', 'синий', 'золотой'],
+    }),
+    15: ('Аксессуары', {
+        'Тип разъема': ['USB-C', 'Lightning', 'microUSB'],
+        'Длина (м)': ['0.5', '1', '2'],
+        'Цвет': ['черный', 'белый'],
+    }),
+    1: ('Flash-накопители', {
+        'Объем (Гб)': ['16', '32', '64', '128'],
+        'Интерфейс': ['USB 2.0', 'USB 3.0', 'USB 3.1'],
+    }),
+    5: ('Телевизоры', {
+        'Диагональ (дюйм)': ['43', '50', '55', '65'],
+        'Разрешение (пикс)': ['1920x1080', '3840x2160'],
+        'Smart TV': ['да', 'нет'],
+    }),
+    7: ('Ноутбуки', {
+        'Диагональ (дюйм)': ['13.3', '14', '15.6', '16'],
+        'Оперативная память (Гб)': ['8', '16', '32'],
+        'Процессор': ['Core i5', 'Core i7', 'Ryzen 5', 'Ryzen 7'],
+        'Цвет': ['серый', 'серебристый'],
+    }),
+}
+BRANDS = ['Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Sony', 'LG', 'Asus']
+
+
+def generate_goods(count, seed=0, revision=0):
+    """
+    Генератор синтетических товаров прайс-листа.
+    На каждые 4 товара приходится один продукт, так что часть
+    продуктов делят несколько позиций, как у реальных поставщиков.
+    Args:
+        count: число товаров
+        seed: зерно генератора случайных чисел
+        revision: номер ревизии, меняет цену и остаток у 10% товаров
+    """
+
+    rng = random.Random(seed)
+    category_ids = list(CATEGORIES)
+
+    for index in range(count):
+        category_id = category_ids[index % len(category_ids)]
+        name, parameters = CATEGORIES[category_id]
+        price = rng.randrange(500, 200000, 10)
+        quantity = rng.randrange(0, 100)
+        if revision and index % 10 == revision % 10:
+            price += 10 * revision
+            quantity += revision
+
+        yield {
+            'id': index + 1,
+            'category': category_id,
+            'model': f'{BENCHMARK_PRODUCT_PREFIX}-{index // 4:07d}',
+            'name': (
+                f'{BENCHMARK_PRODUCT_PREFIX} {name} '
+                f'{rng.choice(BRANDS)} {index // 4}'
+            ),
+            'price': price,
+            'price_rrc': price + price // 5,
+            'quantity': quantity,
+            'parameters': {
+                parameter: rng.choice(values)
+                for parameter, values in parameters.items()
+            },
+        }
+
+
+def write_price_list(fileobj, count, fmt='yaml', seed=0, revision=0,
+                     shop='Benchmark Shop'):
+    """
+    Потоково пишет синтетический прайс-лист в бинарный файл.
+    Документ не собирается в памяти, поэтому годится и для 1M товаров.
+    """
+
+    categories = [
+        {'id': category_id, 'name': name}
+        for category_id, (name, _) in CATEGORIES.items()
+    ]
+    goods = generate_goods(count, seed, revision)
+
+    def dump(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    if fmt == 'json':
+        fileobj.write(
+            f'{{"shop": {dump(shop)}, "categories": {dump(categories)}, '
+            f'"goods": ['.encode('utf-8')
+        )
+        for index, good in enumerate(goods):
+            prefix = ',\n' if index else '\n'
+            fileobj.write((prefix + dump(good)).encode('utf-8'))
+        fileobj.write(b'\n]}\n')
+        return
+
+    # JSON-строки и числа являются корректными скалярами YAML
+    lines = [f'shop: {dump(shop)}', 'categories:']
+    lines.extend(
+        f'  - id: {c["id"]}\n    name: {dump(c["name"])}' for c in categories
+    )
+    lines.append('goods:')
+    fileobj.write(('\n'.join(lines) + '\n').encode('utf-8'))
+    for good in goods:
+        parameters = good.pop('parameters')
+        item = '\n'.join(
+            f'    {key}: {dump(value)}' for key, value in good.items()
+        ).replace('    ', '  - ', 1)
+        params = '\n'.join(
+            f'      {dump(key)}: {dump(value)}'
+            for key, value in parameters.items()
+        )
+        fileobj.write(
+            f'{item}\n    parameters:\n{params}\n'.encode('utf-8')
+        )
+
+
+@contextmanager
+def count_queries():
+    """Считает SQL-запросы без сохранения их текста"""
+
+    counter = {'queries': 0}
+
+    def wrapper(execute, sql, params, many, context):
+        counter['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+def read_memory_kb(field):
+    """Значение поля VmRSS/VmHWM из /proc/self/status в КБ (Linux)"""
+
+    try:
+        with open('/proc/self/status', encoding='ascii') as status:
+            for line in status:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+@contextmanager
+def measure_memory():
+    """
+    Память одного прогона: пиковый RSS и прирост RSS.
+    ru_maxrss - максимум за всю жизнь процесса, поэтому перед
+    прогоном пиковое значение VmHWM сбрасывается через
+    /proc/self/clear_refs. Если сброс недоступен, пик не
+    сообщается, чтобы не выдавать максимум прошлых прогонов.
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as refs:
+            refs.write('5')
+        reset = True
+    except OSError:
+        reset = False
+
+    memory = {'peak_rss_kb': None, 'rss_delta_kb': None}
+    before = read_memory_kb('VmRSS')
+    yield memory
+    after = read_memory_kb('VmRSS')
+    if reset:
+        memory['peak_rss_kb'] = read_memory_kb('VmHWM')
+    if before is not None and after is not None:
+        memory['rss_delta_kb'] = after - before
+
+
+def get_benchmark_user(count):
+    """Отдельный магазин для каждого размера прайса"""
+
+    user, created = User.objects.get_or_create(
+        email=f'bench-{count}@{BENCHMARK_EMAIL_DOMAIN}',
+        defaults={'username': f'bench-{count}', 'type': 'shop'}
+    )
+    return user
+
+
+def cleanup_benchmark_data():
+    """Удаляет магазины, пользователей и продукты бенчмарка"""
+
+    users = User.objects.filter(email__endswith=f'@{BENCHMARK_EMAIL_DOMAIN}')
+    Shop.objects.filter(user__in=users).delete()
+    users.delete()
+    Product.objects.filter(
+        name__startswith=f'{BENCHMARK_PRODUCT_PREFIX} ',
+        product_infos__isnull=True
+    ).delete()
+
+
+def run_import(count, fmt='yaml', mode='incremental', parallel=False,
+               revision=0, seed=0):
+    """
+    Генерирует прайс и прогоняет partner_import целиком:
+    сохранение в хранилище, разбор, запись в БД.
+    Returns:
+        dict: метрики прогона
+    """
+
+    user = get_benchmark_user(count)
+
+    started = time.perf_counter()
+    with NamedTemporaryFile(suffix=f'.{fmt}') as tmp:
+        write_price_list(tmp, count, fmt, seed, revision)
+        file_bytes = tmp.tell()
+        tmp.seek(0)
+        generate_seconds = time.perf_counter() - started
+        source = spool_price_file(File(tmp, name=f'benchmark.{fmt}'))
+
+    eager = celery_app.conf.task_always_eager
+    celery_app.conf.task_always_eager = True
+    try:
+        with measure_memory() as memory, count_queries() as counter:
+            started = time.perf_counter()
+            report = partner_import.apply(
+                args=(source, user.id),
+                kwargs={'mode': mode, 'parallel': parallel},
+                task_id=str(uuid.uuid4())
+            ).get()
+            wall_seconds = time.perf_counter() - started
+    finally:
+        celery_app.conf.task_always_eager = eager
+
+    return {
+        'goods': count,
+        'format': fmt,
+        'mode': mode,
+        'parallel': parallel,
+        'revision': revision,
+        'file_bytes': file_bytes,
+        'generate_seconds': round(generate_seconds, 3),
+        'wall_seconds': round(wall_seconds, 3),
+        'queries': counter['queries'],
+        'rows_per_second': round(count / wall_seconds, 1),
+        'peak_rss_kb': memory['peak_rss_kb'],
+        'rss_delta_kb': memory['rss_delta_kb'],
+        'report': report,
+    }
+
+
+def time_per_call_ms(func, repeat):
+    """Среднее время вызова func в миллисекундах"""
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - started) * 1000 / repeat, 3)
+
+
+def run_serialization(count=1000, page_size=50, repeat=50):
+    """
+    Замер сериализации одной страницы каталога тремя способами:
+    nested - ProductInfoSerializer по ProductInfo с select_related
+    и prefetch параметров (путь до витрины и быстрого режима),
+    model - CatalogEntrySerializer по экземплярам CatalogEntry,
+    flat - быстрый режим по строкам values().
+    Страницы выбираются заранее, замеряется только сериализация.
+    Каталог из count товаров импортируется, если его ещё нет.
+    Returns:
+        dict: метрики прогона
+    """
+
+    user = get_benchmark_user(count)
+    if not ProductInfo.objects.filter(shop__user=user).exists():
+        run_import(count, fmt='json')
+
+    ids = list(CatalogEntry.objects.filter(shop__user=user).order_by(
+        'pk'
+    ).values_list('pk', flat=True)[:page_size])
+    entries = CatalogEntry.objects.filter(pk__in=ids).order_by('pk')
+    infos = list(ProductInfo.objects.filter(id__in=ids).select_related(
+        'product__category', 'shop'
+    ).prefetch_related(
+        Prefetch(
+            'product_parameters',
+            queryset=ProductParameter.objects.select_related(
+                'parameter'
+            ).order_by(*PARAMETER_ORDERING)
+        )
+    ).order_by('id'))
+    instances = list(entries)
+    rows = list(entries.values(*CATALOG_ENTRY_VALUES))
+
+    modes = {
+        'nested': lambda: ProductInfoSerializer(infos, many=True).data,
+        'model': lambda: CatalogEntrySerializer(instances, many=True).data,
+        'flat': lambda: CatalogEntrySerializer(rows, many=True).data,
+    }
+    rendered = {
+        JSONRenderer().render(serialize()) for serialize in modes.values()
+    }
+    timings = {
+        mode: time_per_call_ms(serialize, repeat)
+        for mode, serialize in modes.items()
+    }
+
+    return {
+        'goods': count,
+        'page_size': len(ids),
+        'repeat': repeat,
+        'ms_per_page': timings,
+        'speedup': round(timings['nested'] / max(timings['flat'], 0.001), 1),
+        'identical': len(rendered) == 1,
+    }
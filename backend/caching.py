@@ -0,0 +1,305 @@
+"""Кэш готовых ответов и условные GET каталога и заказов по версиям"""
+
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from backend.services import redis_client
+
+CATALOG_VERSIONS_KEY = 'catalog_cache:versions'
+ORDER_VERSIONS_KEY = 'order_cache:versions'
+GLOBAL_VERSION = 'global'
+SHARED_VERSION = 'shared'
+CACHE_LOCK_SECONDS = 10
+CACHE_WAIT_SECONDS = 2
+CACHE_WAIT_STEP = 0.05
+ORDER_SHOPS_TIMEOUT = 24 * 3600
+
+
+def shop_version(shop_id):
+    """Поле версии магазина в CATALOG_VERSIONS_KEY"""
+
+    return f"shop:{shop_id}"
+
+
+def version_seed():
+    """
+    Начальное значение счётчика версии, которого нет в Redis:
+    время в микросекундах. Если Redis очищен или ключ вытеснен,
+    счётчик начинается заново с большего значения и не повторяет
+    уже выданные версии.
+    """
+
+    return time.time_ns() // 1000
+
+
+def catalog_version(shop_id):
+    """
+    Версия каталога магазина: растёт при каждом изменении его
+    товаров, параметров, продуктов, категорий и самого магазина.
+    Хранится только в Redis, строка магазина в БД не обновляется.
+    """
+
+    field = shop_version(shop_id)
+    pipe = redis_client.pipeline()
+    pipe.hsetnx(CATALOG_VERSIONS_KEY, field, version_seed())
+    pipe.hget(CATALOG_VERSIONS_KEY, field)
+    return int(pipe.execute()[1])
+
+
+def bump_catalog_versions(*shop_ids):
+    """
+    Инвалидирует закэшированные ответы каталога после фиксации
+    транзакции. Без shop_ids - изменение общих данных (продукты,
+    категории, фасеты), которое затрагивает все магазины.
+    Любое изменение увеличивает и глобальную версию.
+    """
+
+    fields = [GLOBAL_VERSION]
+    fields.extend(shop_version(shop_id) for shop_id in shop_ids)
+    if not shop_ids:
+        fields.append(SHARED_VERSION)
+
+    def bump():
+        seed = version_seed()
+        pipe = redis_client.pipeline()
+        for field in fields:
+            pipe.hsetnx(CATALOG_VERSIONS_KEY, field, seed)
+            pipe.hincrby(CATALOG_VERSIONS_KEY, field, 1)
+        pipe.execute()
+
+    transaction.on_commit(bump)
+
+
+def bump_order_version(*user_ids):
+    """Инвалидирует ETag заказов пользователей после фиксации транзакции"""
+
+    def bump():
+        seed = version_seed()
+        pipe = redis_client.pipeline()
+        for user_id in set(user_ids):
+            pipe.hsetnx(ORDER_VERSIONS_KEY, user_id, seed)
+            pipe.hincrby(ORDER_VERSIONS_KEY, user_id, 1)
+        pipe.execute()
+
+    transaction.on_commit(bump)
+
+
+def read_versions(fields):
+    """Текущие версии полей fields одним HMGET"""
+
+    values = redis_client.hmget(CATALOG_VERSIONS_KEY, fields)
+    return dict(zip(fields, (value or '0' for value in values)))
+
+
+def response_cache_key(view, request, kwargs):
+    """Ключ ответа: представление, формат, адрес и нормализованный запрос"""
+
+    params = urlencode(sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    ))
+    raw = '|'.join([
+        type(view).__name__,
+        request.accepted_renderer.format,
+        request.scheme,
+        request.get_host(),
+        urlencode(sorted(kwargs.items())),
+        params,
+    ])
+    return f"catalog_response:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def cache_catalog_response(dependencies):
+    """
+    Кэширует отрендеренный ответ GET-обработчика каталога.
+    Попадание отдаёт готовые байты без ORM и сериализаторов,
+    если версии, от которых зависит ответ, не изменились.
+    Кэшируется только JSON: HTML BrowsableAPI содержит имя
+    пользователя и CSRF-токен и не должен уходить другим.
+    При промахе ответ строит один запрос под блокировкой,
+    остальные ждут его до CACHE_WAIT_SECONDS.
+    Args:
+        dependencies: функция (request, kwargs, data) -> список
+            полей версий, от которых зависит ответ
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            timeout = settings.CATALOG_CACHE_TIMEOUT
+            if not timeout or request.accepted_renderer.format != 'json':
+                return handler(view, request, *args, **kwargs)
+
+            key = response_cache_key(view, request, kwargs)
+            lock_key = f"{key}:lock"
+            entry = cached_entry(key)
+            locked = entry is None and cache.add(
+                lock_key, 1, CACHE_LOCK_SECONDS
+            )
+            if entry is None and not locked:
+                deadline = time.monotonic() + CACHE_WAIT_SECONDS
+                while entry is None and time.monotonic() < deadline:
+                    time.sleep(CACHE_WAIT_STEP)
+                    entry = cached_entry(key)
+            if entry is not None:
+                response = HttpResponse(
+                    entry['content'], content_type=entry['content_type']
+                )
+                response['X-Cache'] = 'HIT'
+                return response
+
+            try:
+                before = read_versions([GLOBAL_VERSION])[GLOBAL_VERSION]
+                response = view.finalize_response(
+                    request, handler(view, request, *args, **kwargs),
+                    *args, **kwargs
+                )
+                response.render()
+                fields = (
+                    dependencies(request, kwargs, response.data)
+                    if response.status_code == 200 else None
+                )
+                if fields:
+                    versions = read_versions([GLOBAL_VERSION, *fields])
+                    # Каталог менялся во время рендера - не кэшируем
+                    if versions[GLOBAL_VERSION] == before:
+                        cache.set(key, {
+                            'versions': {
+                                field: versions[field] for field in fields
+                            },
+                            'content': response.content,
+                            'content_type': response['Content-Type'],
+                        }, timeout)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+    return decorator
+
+
+def cached_entry(key):
+    """Запись кэша, если её версии актуальны"""
+
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if read_versions(list(entry['versions'])) != entry['versions']:
+        return None
+    return entry
+
+
+def list_dependencies(request, kwargs, data):
+    """Список зависит от магазина из фильтра shop или от всего каталога"""
+
+    shop_id = request.query_params.get('shop', '')
+    if shop_id.isdigit() and len(request.query_params.getlist('shop')) == 1:
+        return [shop_version(int(shop_id)), SHARED_VERSION]
+    return [GLOBAL_VERSION]
+
+
+def conditional_get(etag_func):
+    """
+    Условный GET по ETag, вычисленному из версий до выполнения
+    запроса к БД и сериализации. Совпадение с If-None-Match - 304.
+    Args:
+        etag_func: функция (view, request, kwargs) -> ETag или None,
+            если валидатор построить нельзя
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            etag = etag_func(view, request, kwargs)
+            if etag is None:
+                return handler(view, request, *args, **kwargs)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+            return response
+
+        return wrapper
+    return decorator
+
+
+def etag_matches(request, etag):
+    """ETag совпадает с If-None-Match запроса"""
+
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    return etag in if_none_match or '*' in if_none_match
+
+
+def not_modified(etag):
+    """Ответ 304 с текущим ETag"""
+
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def make_etag(*parts):
+    """Строгий ETag из частей валидатора"""
+
+    raw = '|'.join(str(part) for part in parts)
+    return f'"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def list_etag(view, request, kwargs):
+    """ETag списка товаров: запрос и версии из list_dependencies"""
+
+    versions = read_versions(list_dependencies(request, kwargs, None))
+    return make_etag(
+        response_cache_key(view, request, kwargs), sorted(versions.items())
+    )
+
+
+def order_shop_ids(user_id, order_version):
+    """
+    Магазины товаров в заказах пользователя. Набор меняется только
+    вместе с версией заказов, поэтому кэшируется по ней.
+    """
+
+    key = f"{ORDER_VERSIONS_KEY}:shops:{user_id}:{order_version}"
+    shop_ids = cache.get(key)
+    if shop_ids is None:
+        # models импортирует caching
+        from backend.models import OrderItem
+
+        shop_ids = sorted(set(OrderItem.objects.filter(
+            order__user_id=user_id
+        ).values_list('product_info__shop_id', flat=True)))
+        cache.set(key, shop_ids, ORDER_SHOPS_TIMEOUT)
+    return shop_ids
+
+
+def order_etag(view, request, kwargs):
+    """
+    ETag заказов пользователя: версия его заказов, версии магазинов
+    из заказов и общая версия (в заказах текущие названия и цены
+    товаров). Изменения в других магазинах ETag не меняют.
+    """
+
+    user_id = request.user.id
+    order_version = redis_client.hget(ORDER_VERSIONS_KEY, user_id) or '0'
+    fields = [shop_version(shop_id) for shop_id in order_shop_ids(
+        user_id, order_version
+    )]
+    versions = read_versions(fields + [SHARED_VERSION])
+    return make_etag(
+        response_cache_key(view, request, kwargs), user_id,
+        order_version, sorted(versions.items())
+    )
@@ -0,0 +1,130 @@
+"""Денормализованная витрина каталога CatalogEntry"""
+
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import CatalogEntry, ProductInfo, ProductParameter
+from backend.search import refresh_search_vectors
+
+CATALOG_REFRESH_BATCH_SIZE = 1000
+
+# Поле CatalogEntry - поле ProductInfo, из которого оно берётся
+ENTRY_SOURCES = {
+    'product_info_id': 'id',
+    'shop_id': 'shop_id',
+    'product_id': 'product_id',
+    'category_id': 'product__category_id',
+    'external_id': 'external_id',
+    'model': 'model',
+    'product_name': 'product__name',
+    'product_description': 'product__description',
+    'category_name': 'product__category__name',
+    'shop_name': 'shop__name',
+    'shop_state': 'shop__state',
+    'quantity': 'quantity',
+    'price': 'price',
+    'price_rrc': 'price_rrc',
+}
+ENTRY_UPDATE_FIELDS = [
+    'shop', 'product_id', 'category_id', 'external_id', 'model',
+    'product_name', 'product_description', 'category_name', 'shop_name',
+    'shop_state', 'quantity', 'price', 'price_rrc', 'parameters',
+    'updated_at',
+]
+# Поля ProductInfo, изменение которых переносится в витрину без пересборки
+STOCK_FIELDS = {'quantity', 'price', 'price_rrc', 'updated_at'}
+# Порядок параметров в строке витрины не зависит от порядка вставки
+PARAMETER_ORDERING = ('parameter__name', 'id')
+
+
+def refresh_catalog_entries(
+    info_ids=None, product_ids=None, category_ids=None, shop_ids=None,
+    parameter_ids=None
+):
+    """
+    Пересобирает строки витрины для товаров, продуктов, категорий,
+    магазинов или товаров с параметрами parameter_ids.
+    Без аргументов - весь каталог. Строки пишутся
+    upsert-ом пакетами по CATALOG_REFRESH_BATCH_SIZE, поисковый
+    вектор пересчитывается для тех же пакетов. Удалённые товары
+    уходят из витрины каскадом.
+    Returns:
+        int: число пересобранных строк
+    """
+
+    lookups = {
+        'product_id__in': product_ids,
+        'product__category_id__in': category_ids,
+        'shop_id__in': shop_ids,
+        'product_parameters__parameter_id__in': parameter_ids,
+    }
+    infos = ProductInfo.objects.order_by('id')
+    if info_ids is None and all(ids is None for ids in lookups.values()):
+        ids = list(infos.values_list('id', flat=True))
+    else:
+        ids = list(info_ids or [])
+        condition = Q()
+        for lookup, values in lookups.items():
+            if values:
+                condition |= Q(**{lookup: list(values)})
+        if condition:
+            ids.extend(
+                infos.filter(condition).distinct().values_list(
+                    'id', flat=True
+                )
+            )
+
+    refreshed = 0
+    for start in range(0, len(ids), CATALOG_REFRESH_BATCH_SIZE):
+        refreshed += write_entries(
+            ids[start:start + CATALOG_REFRESH_BATCH_SIZE]
+        )
+    return refreshed
+
+
+def write_entries(info_ids):
+    """Upsert строк витрины для одного пакета товаров"""
+
+    parameters = {}
+    for info_id, name, value in ProductParameter.objects.filter(
+        product_info_id__in=info_ids
+    ).order_by(*PARAMETER_ORDERING).values_list(
+        'product_info_id', 'parameter__name', 'value'
+    ):
+        parameters.setdefault(info_id, []).append(
+            {'parameter': name, 'value': value}
+        )
+
+    entries = CatalogEntry.objects.bulk_create(
+        [
+            CatalogEntry(
+                parameters=parameters.get(row[0], []),
+                **dict(zip(ENTRY_SOURCES, row))
+            )
+            for row in ProductInfo.objects.filter(
+                id__in=info_ids
+            ).values_list(*ENTRY_SOURCES.values())
+        ],
+        update_conflicts=True,
+        unique_fields=['product_info'],
+        update_fields=ENTRY_UPDATE_FIELDS,
+    )
+    refresh_search_vectors([entry.product_info_id for entry in entries])
+    return len(entries)
+
+
+def sync_catalog_entry(info, update_fields=None):
+    """
+    Переносит сохранение ProductInfo в витрину. Смена остатка
+    или цены (оформление заказа, админка) - один UPDATE строки
+    витрины, иначе строка пересобирается целиком.
+    """
+
+    if update_fields and set(update_fields) <= STOCK_FIELDS:
+        updated = CatalogEntry.objects.filter(pk=info.pk).update(
+            quantity=info.quantity, price=info.price,
+            price_rrc=info.price_rrc, updated_at=timezone.now()
+        )
+        if updated:
+            return
+    refresh_catalog_entries([info.pk])
@@ -0,0 +1,162 @@
+"""Лента изменений каталога для синхронизации внешних систем"""
+
+import base64
+from datetime import datetime, timedelta
+from heapq import merge
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import ProductInfo, ProductInfoTombstone, ProductParameter
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+CHANGE_ORDER = {UPSERT: 0, DELETE: 1}
+
+
+class CursorExpired(Exception):
+    """Курсор старше срока хранения удалений, нужна полная выгрузка"""
+
+
+def encode_cursor(position):
+    """Непрозрачный курсор из позиции (время, тип, id)"""
+
+    changed_at, op, row_id = position
+    raw = f"{changed_at.isoformat()}|{op}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Позиция (время, тип, id) из курсора.
+    Raises:
+        ValueError: курсор повреждён
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        changed_at, op, row_id = raw.split('|')
+        position = datetime.fromisoformat(changed_at), op, int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Неверный курсор: {cursor}") from e
+    if op not in CHANGE_ORDER or position[0].tzinfo is None:
+        raise ValueError(f"Неверный курсор: {cursor}")
+    return position
+
+
+def after(field, position, op):
+    """Условие keyset-пагинации: строки после позиции курсора"""
+
+    if position is None:
+        return Q()
+    changed_at, cursor_op, row_id = position
+    if CHANGE_ORDER[op] > CHANGE_ORDER[cursor_op]:
+        return Q(**{f'{field}__gte': changed_at})
+    if CHANGE_ORDER[op] < CHANGE_ORDER[cursor_op]:
+        return Q(**{f'{field}__gt': changed_at})
+    return Q(**{f'{field}__gt': changed_at}) | Q(
+        **{field: changed_at, 'id__gt': row_id}
+    )
+
+
+def changes_since(cursor=None, shop_id=None, limit=None):
+    """
+    Изменения товаров после курсора в порядке (время, тип, id):
+    созданные и изменённые товары (upsert) и удалённые (delete).
+    Отдаются только изменения старше CHANGES_SAFETY_LAG_SECONDS:
+    updated_at ставится до фиксации транзакции, и строка долгой
+    транзакции иначе могла бы стать видна уже после того, как курсор
+    клиента ушёл дальше её времени.
+    Args:
+        cursor: курсор из прошлого ответа или None для полной ленты
+        shop_id: ограничить одним магазином
+        limit: размер страницы, по умолчанию CHANGES_PAGE_SIZE
+    Returns:
+        dict: results, next_cursor, has_more
+    """
+
+    limit = limit or settings.CHANGES_PAGE_SIZE
+    position = decode_cursor(cursor) if cursor else None
+    horizon = timezone.now() - timedelta(days=settings.CHANGES_RETENTION_DAYS)
+    if position and position[0] < horizon:
+        raise CursorExpired(
+            'Курсор старше срока хранения удалений, выполните полный экспорт'
+        )
+
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.CHANGES_SAFETY_LAG_SECONDS
+    )
+    infos = ProductInfo.objects.filter(
+        after('updated_at', position, UPSERT), updated_at__lt=cutoff
+    )
+    tombstones = ProductInfoTombstone.objects.filter(
+        after('deleted_at', position, DELETE), deleted_at__lt=cutoff
+    )
+    if shop_id is not None:
+        infos = infos.filter(shop_id=shop_id)
+        tombstones = tombstones.filter(shop_id=shop_id)
+
+    upserts = [
+        ((row['updated_at'], UPSERT, row['id']), row)
+        for row in infos.order_by('updated_at', 'id').values(
+            'id', 'shop_id', 'external_id', 'product_id', 'product__name',
+            'product__category_id', 'model', 'price', 'price_rrc',
+            'quantity', 'updated_at'
+        )[:limit + 1]
+    ]
+    deletes = [
+        ((row['deleted_at'], DELETE, row['id']), row)
+        for row in tombstones.order_by('deleted_at', 'id').values(
+            'id', 'product_info_id', 'shop_id', 'external_id', 'deleted_at'
+        )[:limit + 1]
+    ]
+
+    page = list(merge(
+        upserts, deletes,
+        key=lambda item: (item[0][0], CHANGE_ORDER[item[0][1]], item[0][2])
+    ))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    parameters = {}
+    for info_id, name, value in ProductParameter.objects.filter(
+        product_info_id__in=[
+            row['id'] for (_, op, _), row in page if op == UPSERT
+        ]
+    ).values_list('product_info_id', 'parameter__name', 'value'):
+        parameters.setdefault(info_id, {})[name] = value
+
+    results = []
+    for (changed_at, op, _), row in page:
+        if op == UPSERT:
+            results.append({
+                'op': UPSERT,
+                'id': row['id'],
+                'shop': row['shop_id'],
+                'external_id': row['external_id'],
+                'product': row['product_id'],
+                'name': row['product__name'],
+                'category': row['product__category_id'],
+                'model': row['model'],
+                'price': row['price'],
+                'price_rrc': row['price_rrc'],
+                'quantity': row['quantity'],
+                'parameters': parameters.get(row['id'], {}),
+                'changed_at': changed_at,
+            })
+        else:
+            results.append({
+                'op': DELETE,
+                'id': row['product_info_id'],
+                'shop': row['shop_id'],
+                'external_id': row['external_id'],
+                'changed_at': changed_at,
+            })
+
+    return {
+        'results': results,
+        'next_cursor': encode_cursor(page[-1][0]) if page else cursor,
+        'has_more': has_more,
+    }
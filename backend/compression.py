@@ -0,0 +1,91 @@
+"""Сжатие прайс-листов и экспортов (gzip, zstd)"""
+
+import gzip
+import io
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd недоступен, остаются gzip и без сжатия
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+COMPRESSION_EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def available_compressions():
+    """Поддерживаемые варианты сжатия"""
+
+    return [
+        name for name in COMPRESSION_EXTENSIONS
+        if name != 'zstd' or zstandard is not None
+    ]
+
+
+def detect_compression(fileobj):
+    """Определяет сжатие по сигнатуре в начале файла"""
+
+    head = fileobj.read(len(ZSTD_MAGIC))
+    fileobj.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return 'none'
+
+
+def open_decompressed(fileobj, compression):
+    """
+    Бинарный поток распакованных данных с начала fileobj.
+    Закрытие потока не закрывает fileobj, поэтому для
+    повторного прохода достаточно открыть поток заново.
+    """
+
+    fileobj.seek(0)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('Сжатие zstd не поддерживается: нет zstandard')
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(
+                fileobj, closefd=False
+            )
+        )
+    return fileobj
+
+
+def open_compressed_text(path, compression):
+    """Текстовый файл на запись со сжатием compression"""
+
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError('Сжатие zstd не поддерживается: нет zstandard')
+        return io.TextIOWrapper(
+            zstandard.ZstdCompressor().stream_writer(open(path, 'wb')),
+            encoding='utf-8', newline=''
+        )
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def iter_compressed(chunks, compression):
+    """Сжимает поток байтовых фрагментов на лету"""
+
+    if compression == 'none':
+        yield from chunks
+        return
+    if compression == 'gzip':
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    elif zstandard is None:
+        raise ValueError('Сжатие zstd не поддерживается: нет zstandard')
+    else:
+        compressor = zstandard.ZstdCompressor().compressobj()
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
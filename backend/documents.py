@@ -0,0 +1,67 @@
+"""Кэшированные документы карточек товаров"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.models import CatalogEntry
+from backend.serializers import CATALOG_ENTRY_VALUES, flat_catalog_entry
+
+
+def document_key(pk):
+    """Ключ документа карточки товара в кэше"""
+
+    return f"product_document:{pk}"
+
+
+def document_version(pk):
+    """
+    Версия документа карточки - updated_at строки витрины.
+    Строка пересобирается при изменении товара, его параметров,
+    продукта, категории и магазина, поэтому изменения других
+    товаров магазина документ не задевают.
+    Returns:
+        str: версия или None, если товара нет
+    """
+
+    updated_at = CatalogEntry.objects.filter(pk=pk).values_list(
+        'updated_at', flat=True
+    ).first()
+    if updated_at is None:
+        return None
+    return f"{pk}|{updated_at.isoformat()}"
+
+
+def build_document(pk):
+    """Данные карточки товара из одной строки витрины"""
+
+    row = CatalogEntry.objects.filter(pk=pk).values(
+        *CATALOG_ENTRY_VALUES
+    ).first()
+    if row is None:
+        return None
+    return flat_catalog_entry(row)
+
+
+def product_document(pk, version):
+    """
+    Документ карточки товара из кэша, если его версия совпадает
+    с version, иначе строится заново и кэшируется.
+    Args:
+        pk: id ProductInfo
+        version: результат document_version
+    Returns:
+        dict: данные в формате CatalogEntrySerializer или None
+    """
+
+    timeout = settings.CATALOG_CACHE_TIMEOUT
+    if timeout:
+        entry = cache.get(document_key(pk))
+        if entry is not None and entry['version'] == version:
+            return entry['data']
+
+    data = build_document(pk)
+    if timeout and data is not None:
+        cache.set(
+            document_key(pk), {'version': version, 'data': data}, timeout
+        )
+    return data
@@ -0,0 +1,331 @@
+"""Потоковый экспорт каталога магазина"""
+
+import csv
+import io
+import json
+import os
+import time
+
+import yaml
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min
+
+from backend.caching import catalog_version
+from backend.compression import COMPRESSION_EXTENSIONS
+from backend.importer import chunked
+from backend.models import CatalogEntry
+from backend.parsers import CSV_PARAMETER_PREFIX
+from backend.services import redis_client
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    'json': '.json', 'ndjson': '.ndjson', 'csv': '.csv', 'yaml': '.yaml'
+}
+EXPORT_STALE_KEY = 'export_stale:{}'
+PARAMETER_NAMES_SQL = """
+    SELECT DISTINCT parameter->>'parameter' AS name
+    FROM backend_catalogentry AS entry,
+        jsonb_array_elements(entry.parameters) AS parameter
+    WHERE entry.shop_id = %s
+    ORDER BY name
+"""
+CSV_COLUMNS = [
+    'shop', 'id', 'name', 'category', 'category_name', 'model',
+    'price', 'price_rrc', 'quantity'
+]
+
+
+def export_version(shop):
+    """
+    Версия экспорта: версия импорта из БД и счётчик каталога из Redis.
+    Первая часть хранится в БД и растёт с каждым импортом, вторая
+    не повторяется после очистки Redis (см. version_seed), поэтому
+    старый файл или ETag не выдаются за новую версию.
+    """
+
+    return f"{shop.import_version}.{catalog_version(shop.id)}"
+
+
+def export_path(shop, version, fmt, compression):
+    """
+    Путь экспорта относительно MEDIA_ROOT для текущей версии каталога.
+    Повторный экспорт той же версии попадает в тот же файл.
+    """
+
+    return (
+        f"exports/{shop.id}/catalog_v{version}"
+        f"{EXPORT_FORMATS[fmt]}{COMPRESSION_EXTENSIONS[compression]}"
+    )
+
+
+def export_etag(shop, version, fmt, compression):
+    """ETag экспорта: содержимое определяется версией каталога"""
+
+    return f'"{shop.id}-{version}-{fmt}-{compression}"'
+
+
+def export_url(path):
+    """Ссылка на скачивание экспорта"""
+
+    return f"{settings.EXTERNAL_URL}{path}"
+
+
+def find_cached_export(shop, version, fmt, compression):
+    """Путь готового экспорта версии version или None"""
+
+    path = export_path(shop, version, fmt, compression)
+    if os.path.exists(os.path.join(settings.MEDIA_ROOT, path)):
+        return path
+    return None
+
+
+def collect_stale_exports(shop_id, version=None):
+    """
+    Удаляет экспорты прошлых версий каталога магазина через
+    EXPORT_RETENTION_SECONDS после того, как версия устарела, чтобы
+    уже выданные ссылки продолжали работать в течение этого срока.
+    Момент устаревания файла запоминается в Redis при первой
+    проверке после смены версии: mtime - это время экспорта,
+    а не время, когда файл перестал быть актуальным.
+    Args:
+        shop_id: ID магазина
+        version: текущая версия экспорта, None - магазин удалён
+    Returns:
+        int: число удалённых файлов
+    """
+
+    directory = os.path.join(settings.MEDIA_ROOT, f"exports/{shop_id}")
+    current = f"catalog_v{version}." if version is not None else None
+    key = EXPORT_STALE_KEY.format(shop_id)
+    now = time.time()
+    expired = now - settings.EXPORT_RETENTION_SECONDS
+    stale_since = redis_client.hgetall(key)
+
+    removed = 0
+    pipe = redis_client.pipeline()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if current and entry.name.startswith(current):
+                continue
+            since = stale_since.pop(entry.name, None)
+            if float(since or now) <= expired:
+                os.remove(entry.path)
+                pipe.hdel(key, entry.name)
+                removed += 1
+            elif since is None:
+                pipe.hset(key, entry.name, now)
+    if stale_since:
+        # Файлов уже нет
+        pipe.hdel(key, *stale_since)
+    pipe.execute()
+    return removed
+
+
+def dump_json(value, level=0):
+    """json.dumps(indent=2) с отступом вложенности level пробелов"""
+
+    text = json.dumps(value, ensure_ascii=False, indent=2)
+    return text.replace('\n', '\n' + ' ' * level)
+
+
+def dump_yaml(value):
+    """Блочный YAML в порядке ключей, читаемый partner_import"""
+
+    return yaml.safe_dump(value, allow_unicode=True, sort_keys=False)
+
+
+class CatalogExporter:
+    """
+    Экспорт каталога магазина в формате прайс-листа.
+    Товары с параметрами читаются из витрины CatalogEntry частями
+    по chunk_size, документ пишется в поток по мере чтения
+    и целиком в памяти не хранится.
+    Форматы: json (совпадает с json.dump(..., indent=2)),
+    ndjson, csv и yaml, все читаются обратно PriceListReader.
+    """
+
+    GOOD_FIELDS = (
+        'external_id', 'product_name', 'category_id', 'model',
+        'price', 'price_rrc', 'quantity', 'parameters'
+    )
+
+    def __init__(self, shop, chunk_size=EXPORT_CHUNK_SIZE):
+        self.shop = shop
+        self.chunk_size = chunk_size
+        self.goods_count = 0
+
+    def header(self):
+        """Поля документа перед categories"""
+
+        return {
+            'shop': self.shop.name,
+            'import_version': self.shop.import_version,
+            'imported_at': (
+                self.shop.imported_at.isoformat()
+                if self.shop.imported_at else None
+            ),
+        }
+
+    def categories(self):
+        """Категории товаров магазина в порядке первого упоминания"""
+
+        for category_id, name, _ in CatalogEntry.objects.filter(
+            shop=self.shop
+        ).values_list('category_id', 'category_name').annotate(
+            first_info=Min('product_info')
+        ).order_by('first_info').iterator():
+            yield {'id': category_id, 'name': name}
+
+    def goods(self):
+        """Товары магазина по возрастанию id, частями по chunk_size"""
+
+        rows = CatalogEntry.objects.filter(shop=self.shop).order_by(
+            'product_info'
+        ).values_list(*self.GOOD_FIELDS).iterator(chunk_size=self.chunk_size)
+
+        for (
+            external_id, name, category_id, model,
+            price, price_rrc, quantity, parameters
+        ) in rows:
+            self.goods_count += 1
+            yield {
+                'id': external_id,
+                'name': name,
+                'category': category_id,
+                'model': model,
+                'price': price,
+                'price_rrc': price_rrc,
+                'quantity': quantity,
+                'parameters': {
+                    item['parameter']: item['value'] for item in parameters
+                },
+            }
+
+    def iter_format(self, fmt):
+        """Генератор фрагментов документа в формате fmt"""
+
+        return {
+            'json': self.iter_json,
+            'ndjson': self.iter_ndjson,
+            'csv': self.iter_csv,
+            'yaml': self.iter_yaml,
+        }[fmt]()
+
+    def iter_json(self):
+        """Генератор фрагментов JSON документа"""
+
+        yield '{'
+        for key, value in self.header().items():
+            yield f'\n  {dump_json(key)}: {dump_json(value)},'
+
+        yield from self.iter_list('categories', self.categories())
+        yield ','
+        yield from self.iter_list('goods', self.goods())
+        yield '\n}'
+
+    def iter_list(self, key, items):
+        """Фрагменты списка key верхнего уровня"""
+
+        yield f'\n  {dump_json(key)}: ['
+        empty = True
+        for item in items:
+            yield ('\n    ' if empty else ',\n    ') + dump_json(item, 4)
+            empty = False
+        yield ']' if empty else '\n  ]'
+
+    def iter_ndjson(self):
+        """Шапка с категориями в первой строке, далее товар на строку"""
+
+        header = dict(self.header(), categories=list(self.categories()))
+        yield json.dumps(header, ensure_ascii=False) + '\n'
+        for good in self.goods():
+            yield json.dumps(good, ensure_ascii=False) + '\n'
+
+    def parameter_names(self):
+        """
+        Имена параметров товаров магазина из строк витрины, как и
+        сами значения. На PostgreSQL - DISTINCT по jsonb_array_elements,
+        на других СУБД - отдельный проход по параметрам строк.
+        """
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(PARAMETER_NAMES_SQL, [self.shop.id])
+                return [name for name, in cursor.fetchall()]
+
+        names = set()
+        for parameters in CatalogEntry.objects.filter(
+            shop=self.shop
+        ).values_list('parameters', flat=True).iterator(
+            chunk_size=self.chunk_size
+        ):
+            names.update(item['parameter'] for item in parameters)
+        return sorted(names)
+
+    def iter_csv(self):
+        """Плоская таблица, параметры в колонках param:<имя>"""
+
+        categories = {
+            category['id']: category['name']
+            for category in self.categories()
+        }
+        parameters = self.parameter_names()
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(CSV_COLUMNS + [
+            CSV_PARAMETER_PREFIX + name for name in parameters
+        ])
+
+        for good in self.goods():
+            writer.writerow([
+                self.shop.name, good['id'], good['name'], good['category'],
+                categories.get(good['category'], ''), good['model'],
+                good['price'], good['price_rrc'], good['quantity'],
+            ] + [good['parameters'].get(name, '') for name in parameters])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def iter_yaml(self):
+        """YAML в формате static/shop.yaml, товары выводятся частями"""
+
+        yield dump_yaml(self.header())
+        categories = list(self.categories())
+        yield dump_yaml({'categories': categories})
+
+        empty = True
+        for chunk in chunked(self.goods(), self.chunk_size):
+            yield ('goods:\n' if empty else '') + dump_yaml(chunk)
+            empty = False
+        if empty:
+            yield 'goods: []\n'
+
+    def iter_bytes(self, fmt, buffer_size=EXPORT_BUFFER_SIZE):
+        """Документ в UTF-8 блоками около buffer_size байт"""
+
+        buffer, size = [], 0
+        for fragment in self.iter_format(fmt):
+            data = fragment.encode('utf-8')
+            buffer.append(data)
+            size += len(data)
+            if size >= buffer_size:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b''.join(buffer)
+
+    def write(self, fileobj, fmt='json'):
+        """
+        Пишет документ в текстовый файл.
+        Returns:
+            int: число выгруженных товаров
+        """
+
+        for fragment in self.iter_format(fmt):
+            fileobj.write(fragment)
+        return self.goods_count
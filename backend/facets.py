@@ -0,0 +1,148 @@
+"""Фасетные фильтры каталога по параметрам товаров"""
+
+import re
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from rest_framework.filters import BaseFilterBackend
+
+from backend.caching import bump_catalog_versions
+from backend.models import CategoryFacet, Parameter, ProductParameter
+
+PARAM_QUERY_RE = re.compile(r'^param\[(.+)\]$')
+
+
+def refresh_category_facets(category_ids):
+    """
+    Пересчитывает сводку CategoryFacet для категорий.
+    Пишутся только отличия: новые значения, изменённые
+    счётчики и исчезнувшие значения. Новые значения пишутся
+    upsert-ом: параллельный пересчёт той же категории мог уже
+    вставить строку, которую select_for_update здесь не увидел.
+    Returns:
+        dict: created, updated, deleted
+    """
+
+    stats = {'created': 0, 'updated': 0, 'deleted': 0}
+    for category_id in category_ids:
+        counts = {
+            (row['parameter_id'], row['value']): row['count']
+            for row in ProductParameter.objects.filter(
+                product_info__product__category_id=category_id
+            ).values('parameter_id', 'value').annotate(
+                count=Count('id')
+            ).order_by()
+        }
+
+        with transaction.atomic():
+            changed, missing = [], []
+            for facet in CategoryFacet.objects.filter(
+                category_id=category_id
+            ).select_for_update():
+                count = counts.pop((facet.parameter_id, facet.value), None)
+                if count is None:
+                    missing.append(facet.id)
+                elif count != facet.count:
+                    facet.count = count
+                    changed.append(facet)
+
+            CategoryFacet.objects.filter(id__in=missing).delete()
+            CategoryFacet.objects.bulk_update(changed, ['count'])
+            CategoryFacet.objects.bulk_create(
+                [
+                    CategoryFacet(
+                        category_id=category_id, parameter_id=parameter_id,
+                        value=value, count=count
+                    )
+                    for (parameter_id, value), count in counts.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['category', 'parameter', 'value'],
+                update_fields=['count'],
+            )
+
+        stats['created'] += len(counts)
+        stats['updated'] += len(changed)
+        stats['deleted'] += len(missing)
+    if any(stats.values()):
+        bump_catalog_versions()
+    return stats
+
+
+def facet_summary(category_id):
+    """
+    Значения параметров категории с числом товаров.
+    Returns:
+        dict: {имя параметра: {значение: число товаров}}
+    """
+
+    summary = {}
+    for name, value, count in CategoryFacet.objects.filter(
+        category_id=category_id
+    ).order_by('parameter__name', '-count', 'value').values_list(
+        'parameter__name', 'value', 'count'
+    ):
+        summary.setdefault(name, {})[value] = count
+    return summary
+
+
+def parse_param_filters(query_params):
+    """
+    Фильтры вида param[Цвет]=черный из параметров запроса.
+    Несколько значений одного параметра объединяются через ИЛИ.
+    Returns:
+        dict: {имя параметра: [значения]}
+    """
+
+    filters = {}
+    for key in query_params:
+        match = PARAM_QUERY_RE.match(key)
+        if match:
+            values = [value for value in query_params.getlist(key) if value]
+            if values:
+                filters[match.group(1)] = values
+    return filters
+
+
+class ParameterFacetFilter(BaseFilterBackend):
+    """
+    Фильтрация товаров по значениям параметров param[<имя>].
+    Каждый параметр - отдельный EXISTS по индексу
+    product_parameter_value.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        filters = parse_param_filters(request.query_params)
+        if not filters:
+            return queryset
+
+        parameter_ids = {}
+        for parameter_id, name in Parameter.objects.filter(
+            name__in=filters
+        ).values_list('id', 'name'):
+            parameter_ids.setdefault(name, []).append(parameter_id)
+
+        for name, values in filters.items():
+            if name not in parameter_ids:
+                return queryset.none()
+            queryset = queryset.filter(Exists(
+                ProductParameter.objects.filter(
+                    product_info=OuterRef('pk'),
+                    parameter_id__in=parameter_ids[name],
+                    value__in=values
+                )
+            ))
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': 'param', 'required': False, 'in': 'query',
+                'style': 'deepObject', 'explode': True,
+                'description': 'Значения параметров: param[Цвет]=черный',
+                'schema': {
+                    'type': 'object',
+                    'additionalProperties': {'type': 'string'},
+                },
+            },
+        ]
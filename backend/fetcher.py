@@ -0,0 +1,138 @@
+"""Загрузка прайс-листов поставщиков по URL"""
+
+import hashlib
+from tempfile import SpooledTemporaryFile
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.parsers import READ_CHUNK_SIZE
+from backend.services import redis_client
+from backend.storage import SPOOL_MEMORY_BYTES
+
+FETCH_TIMEOUT = (5, 30)
+VALIDATORS_EXPIRY_SECONDS = 30 * 24 * 3600
+
+
+class PriceListTooLarge(Exception):
+    """Прайс-лист превышает IMPORT_MAX_DOWNLOAD_BYTES"""
+
+
+def build_session():
+    """Сессия с пулом соединений и экспоненциальными повторами"""
+
+    retry = Retry(
+        total=settings.IMPORT_FETCH_RETRIES,
+        backoff_factor=settings.IMPORT_FETCH_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=10, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = build_session()
+
+
+def load_validators(user_id, url):
+    """ETag/Last-Modified последней успешной загрузки url магазином"""
+
+    validators = redis_client.hgetall(f"price_source:{user_id}")
+    if validators.get('url') != url:
+        return {}
+    return validators
+
+
+def save_validators(user_id, validators):
+    """Запоминает валидаторы после успешного импорта"""
+
+    if not validators or not (
+        validators.get('etag') or validators.get('last_modified')
+    ):
+        return
+
+    key = f"price_source:{user_id}"
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping={
+        field: value for field, value in validators.items() if value
+    })
+    pipe.expire(key, VALIDATORS_EXPIRY_SECONDS)
+    pipe.execute()
+
+
+def conditional_get(url, validators):
+    """GET с If-None-Match/If-Modified-Since через общую сессию"""
+
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    response = session.get(
+        url, headers=headers, timeout=FETCH_TIMEOUT, stream=True
+    )
+    response.raise_for_status()
+    return response
+
+
+def fetch_price_list(url, validators=None):
+    """
+    Условная потоковая загрузка прайс-листа во временный файл.
+    Сначала пробует внутренний адрес, затем исходный URL.
+    Args:
+        url: адрес прайс-листа
+        validators: результат load_validators для If-None-Match
+    Returns:
+        tuple | None: (файл, sha256, валидаторы) или None при 304
+    """
+
+    validators = validators or {}
+    internal_url = url
+    if settings.EXTERNAL_URL and settings.INTERNAL_URL:
+        internal_url = url.replace(
+            settings.EXTERNAL_URL, settings.INTERNAL_URL
+        )
+
+    try:
+        response = conditional_get(internal_url, validators)
+    except requests.exceptions.RequestException:
+        if internal_url == url:
+            raise
+        response = conditional_get(url, validators)
+
+    with response:
+        if response.status_code == 304:
+            return None
+
+        limit = settings.IMPORT_MAX_DOWNLOAD_BYTES
+        declared = int(response.headers.get('Content-Length') or 0)
+        if declared > limit:
+            raise PriceListTooLarge(
+                f"Прайс {declared} байт больше лимита {limit}"
+            )
+
+        price_file = SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+            size += len(chunk)
+            if size > limit:
+                price_file.close()
+                raise PriceListTooLarge(f"Прайс больше лимита {limit} байт")
+            price_file.write(chunk)
+            digest.update(chunk)
+        price_file.seek(0)
+
+        return price_file, digest.hexdigest(), {
+            'url': url,
+            'etag': response.headers.get('ETag', ''),
+            'last_modified': response.headers.get('Last-Modified', ''),
+        }
@@ -0,0 +1,46 @@
+"""Фильтры каталога товаров"""
+
+import django_filters
+
+from backend.models import CatalogEntry
+
+
+class CatalogEntryFilter(django_filters.FilterSet):
+    """
+    Фильтры списка товаров по строкам витрины CatalogEntry.
+    Частые сочетания обслуживаются её индексами: shop + in_stock
+    с сортировкой по цене - catalog_entry_stock_shop_price,
+    in_stock по цене - catalog_entry_stock_price, shop по цене -
+    catalog_entry_shop_price.
+    """
+
+    min_price = django_filters.NumberFilter(
+        field_name='price', lookup_expr='gte', label='Цена от'
+    )
+    max_price = django_filters.NumberFilter(
+        field_name='price', lookup_expr='lte', label='Цена до'
+    )
+    in_stock = django_filters.BooleanFilter(
+        method='filter_in_stock', label='Только в наличии'
+    )
+    category = django_filters.NumberFilter(
+        field_name='category_id', label='Категория'
+    )
+    active_shop = django_filters.BooleanFilter(
+        method='filter_active_shop', label='Только активные магазины'
+    )
+
+    class Meta:
+        model = CatalogEntry
+        fields = ['price', 'quantity', 'shop']
+
+    def filter_in_stock(self, queryset, name, value):
+        # Условие совпадает с условием частичных индексов quantity > 0
+        if value:
+            return queryset.filter(quantity__gt=0)
+        return queryset
+
+    def filter_active_shop(self, queryset, name, value):
+        if value:
+            return queryset.filter(shop_state='active')
+        return queryset
@@ -0,0 +1,402 @@
+"""Пакетный импорт прайс-листов поставщиков"""
+
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from backend.caching import bump_catalog_versions
+from backend.catalog import refresh_catalog_entries
+from backend.models import (
+    Category,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size"""
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def unique_goods(goods):
+    """
+    Убирает дубли товаров пакета по ключу unique_product_info:
+    продукт (имя) и external_id. Побеждает последняя запись,
+    как при upsert в режиме полной перезаписи.
+    """
+
+    return list({(good['name'], good['id']): good for good in goods}.values())
+
+
+def info_key(product_id, external_id):
+    """Ключ товара магазина по unique_product_info для множества сверки"""
+
+    return f'{product_id}:{external_id}'
+
+
+class CatalogImporter:
+    """
+    Пакетная запись прайс-листа магазина в БД.
+    Категории, продукты и имена параметров разрешаются несколькими
+    запросами на пакет, ProductInfo и ProductParameter пишутся
+    через bulk_create с обработкой конфликтов уникальности.
+    Строки витрины CatalogEntry пересобираются для записанных
+    товаров каждого пакета.
+    """
+
+    INFO_FIELDS = ['product_id', 'model', 'price', 'price_rrc', 'quantity']
+
+    def __init__(self, shop, batch_size=None, progress=None):
+        self.shop = shop
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.progress = progress
+        self.created_count = 0
+        self.summary = {
+            'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0
+        }
+        self._parameter_ids = {}
+        self._seen_ids = set()
+
+    def import_categories(self, categories):
+        """Создаёт недостающие категории и привязывает их к магазину"""
+
+        names = {c['id']: c['name'] for c in categories}
+        if not names:
+            return
+
+        existing = set(
+            Category.objects.filter(id__in=names).values_list('id', flat=True)
+        )
+        Category.objects.bulk_create(
+            [
+                Category(id=cat_id, name=name)
+                for cat_id, name in names.items()
+                if cat_id not in existing
+            ],
+            batch_size=self.batch_size
+        )
+
+        Through = Category.shops.through
+        linked = set(
+            Through.objects.filter(
+                shop_id=self.shop.id, category_id__in=names
+            ).values_list('category_id', flat=True)
+        )
+        Through.objects.bulk_create(
+            [
+                Through(category_id=cat_id, shop_id=self.shop.id)
+                for cat_id in names
+                if cat_id not in linked
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+
+    def import_goods(self, goods):
+        """Записывает товары пакетами по batch_size"""
+
+        for batch in chunked(goods, self.batch_size):
+            self.write_batch(batch)
+            self.report_rows(len(batch))
+
+    def sync_goods(self, goods, delete_missing=True):
+        """
+        Инкрементальная синхронизация каталога по ключу
+        unique_product_info (product, shop, external_id).
+        Неизменённые товары не затрагиваются, исчезнувшие удаляются.
+        Для частей параллельного импорта удаление отключается.
+        """
+
+        for batch in chunked(goods, self.batch_size):
+            self.sync_batch(batch)
+            self.report_rows(len(batch))
+        if delete_missing:
+            if self.progress:
+                self.progress.phase('reconcile')
+            self.delete_missing()
+        return self.summary
+
+    def replace_goods(self, goods):
+        """Полная перезапись каталога магазина"""
+
+        self.summary['deleted'] = ProductInfo.objects.filter(
+            shop=self.shop
+        ).delete()[1].get(ProductInfo._meta.label, 0)
+        self.import_goods(goods)
+        self.summary['inserted'] = self.created_count
+        return self.summary
+
+    def write_batch(self, goods):
+        """Upsert одного пакета товаров с параметрами"""
+
+        goods = unique_goods(goods)
+        product_ids = self.resolve_products(goods)
+        parameter_ids = self.resolve_parameters(goods)
+
+        infos = ProductInfo.objects.bulk_create(
+            [
+                ProductInfo(
+                    product_id=product_ids[good['name']],
+                    shop_id=self.shop.id,
+                    external_id=good['id'],
+                    model=good.get('model', ''),
+                    price=good['price'],
+                    price_rrc=good['price_rrc'],
+                    quantity=good['quantity'],
+                )
+                for good in goods
+            ],
+            update_conflicts=True,
+            unique_fields=['product', 'shop', 'external_id'],
+            update_fields=[
+                'model', 'price', 'price_rrc', 'quantity', 'updated_at'
+            ],
+        )
+
+        self.upsert_parameters([
+            ProductParameter(
+                product_info_id=info.id,
+                parameter_id=parameter_ids[name],
+                value=str(value)
+            )
+            for info, good in zip(infos, goods)
+            for name, value in good.get('parameters', {}).items()
+        ])
+        refresh_catalog_entries([info.id for info in infos])
+
+        self.created_count += len(infos)
+        return infos
+
+    def report_rows(self, count):
+        """Передаёт число обработанных строк в ImportProgress"""
+
+        if self.progress:
+            self.progress.add_rows(count)
+
+    def sync_batch(self, goods):
+        """Сравнивает пакет с БД и пишет только отличия"""
+
+        goods = unique_goods(goods)
+        product_ids = self.resolve_products(goods)
+        parameter_ids = self.resolve_parameters(goods)
+
+        existing = {
+            (info.product_id, info.external_id): info
+            for info in ProductInfo.objects.filter(
+                shop=self.shop,
+                external_id__in={good['id'] for good in goods}
+            ).only('id', 'external_id', *self.INFO_FIELDS)
+        }
+
+        current_params = {}
+        for pp_id, info_id, parameter_id, value in (
+            ProductParameter.objects.filter(
+                product_info_id__in=[info.id for info in existing.values()]
+            ).values_list('id', 'product_info_id', 'parameter_id', 'value')
+        ):
+            current_params.setdefault(info_id, {})[parameter_id] = (
+                pp_id, value
+            )
+
+        new_goods, new_infos, changed_infos = [], [], []
+        upserts, removed = [], []
+        now = timezone.now()
+
+        for good in goods:
+            values = {
+                'product_id': product_ids[good['name']],
+                'model': good.get('model', ''),
+                'price': good['price'],
+                'price_rrc': good['price_rrc'],
+                'quantity': good['quantity'],
+            }
+            params = {
+                parameter_ids[name]: str(value)
+                for name, value in good.get('parameters', {}).items()
+            }
+            info = existing.get((values['product_id'], good['id']))
+
+            if info is None:
+                new_goods.append(params)
+                new_infos.append(ProductInfo(
+                    shop_id=self.shop.id, external_id=good['id'], **values
+                ))
+                continue
+
+            self._seen_ids.add(info.id)
+            fields_changed = any(
+                getattr(info, field) != value
+                for field, value in values.items()
+            )
+            if fields_changed:
+                for field, value in values.items():
+                    setattr(info, field, value)
+
+            current = current_params.get(info.id, {})
+            params_changed = False
+            for parameter_id, value in params.items():
+                if current.get(parameter_id, (None, None))[1] != value:
+                    upserts.append(ProductParameter(
+                        product_info_id=info.id,
+                        parameter_id=parameter_id,
+                        value=value
+                    ))
+                    params_changed = True
+            for parameter_id, (pp_id, _) in current.items():
+                if parameter_id not in params:
+                    removed.append(pp_id)
+                    params_changed = True
+
+            if fields_changed or params_changed:
+                # updated_at отмечает и смену параметров для ленты изменений
+                info.updated_at = now
+                changed_infos.append(info)
+                self.summary['updated'] += 1
+            else:
+                self.summary['unchanged'] += 1
+
+        created = ProductInfo.objects.bulk_create(
+            new_infos, batch_size=self.batch_size
+        )
+        for info, params in zip(created, new_goods):
+            self._seen_ids.add(info.id)
+            upserts.extend(
+                ProductParameter(
+                    product_info_id=info.id,
+                    parameter_id=parameter_id,
+                    value=value
+                )
+                for parameter_id, value in params.items()
+            )
+        self.summary['inserted'] += len(created)
+
+        ProductInfo.objects.bulk_update(
+            changed_infos, self.INFO_FIELDS + ['updated_at'],
+            batch_size=self.batch_size
+        )
+        if removed:
+            ProductParameter.objects.filter(id__in=removed).delete()
+        self.upsert_parameters(upserts)
+        refresh_catalog_entries(
+            [info.id for info in created] + [info.id for info in changed_infos]
+        )
+
+    def delete_missing(self):
+        """Удаляет товары магазина, которых не было в прайс-листе"""
+
+        missing = [
+            info_id
+            for info_id in ProductInfo.objects.filter(
+                shop=self.shop
+            ).values_list('id', flat=True).iterator()
+            if info_id not in self._seen_ids
+        ]
+        for chunk in chunked(missing, self.batch_size):
+            ProductInfo.objects.filter(id__in=chunk).delete()
+        self.summary['deleted'] += len(missing)
+
+    def delete_unlisted(self, listed):
+        """
+        Удаляет товары, отсутствующие в прайс-листе.
+        Args:
+            listed: функция, по списку ключей info_key возвращающая
+                список флагов присутствия в прайс-листе
+        """
+
+        rows = ProductInfo.objects.filter(shop=self.shop).values_list(
+            'id', 'product_id', 'external_id'
+        ).iterator(chunk_size=self.batch_size)
+
+        missing = []
+        for chunk in chunked(rows, self.batch_size):
+            flags = listed([
+                info_key(product_id, external_id)
+                for _, product_id, external_id in chunk
+            ])
+            missing.extend(
+                info_id
+                for (info_id, _, _), present in zip(chunk, flags)
+                if not present
+            )
+        for chunk in chunked(missing, self.batch_size):
+            ProductInfo.objects.filter(id__in=chunk).delete()
+        self.summary['deleted'] += len(missing)
+
+    def mark_imported(self, checksum):
+        """Запоминает контрольную сумму прайса и увеличивает версии"""
+
+        Shop.objects.filter(id=self.shop.id).update(
+            import_checksum=checksum,
+            import_version=F('import_version') + 1,
+            imported_at=timezone.now()
+        )
+        bump_catalog_versions(self.shop.id)
+
+    def upsert_parameters(self, parameters):
+        """Upsert значений параметров по unique_product_parameter"""
+
+        ProductParameter.objects.bulk_create(
+            parameters,
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['product_info', 'parameter'],
+            update_fields=['value'],
+        )
+
+    def resolve_products(self, goods):
+        """
+        Возвращает {name: product_id}, создавая недостающие продукты.
+        Как и get_or_create, при дублях по имени берётся первый продукт.
+        """
+
+        categories = {}
+        for good in goods:
+            categories.setdefault(good['name'], good['category'])
+
+        product_ids = {}
+        for name, product_id in Product.objects.filter(
+            name__in=categories
+        ).order_by('-id').values_list('name', 'id'):
+            product_ids[name] = product_id
+
+        created = Product.objects.bulk_create([
+            Product(name=name, category_id=category_id)
+            for name, category_id in categories.items()
+            if name not in product_ids
+        ])
+        product_ids.update((product.name, product.id) for product in created)
+        return product_ids
+
+    def resolve_parameters(self, goods):
+        """Возвращает {name: parameter_id}, кэшируя имена между пакетами"""
+
+        names = {
+            name
+            for good in goods
+            for name in good.get('parameters', {})
+            if name not in self._parameter_ids
+        }
+        if names:
+            for name, parameter_id in Parameter.objects.filter(
+                name__in=names
+            ).order_by('-id').values_list('name', 'id'):
+                self._parameter_ids[name] = parameter_id
+
+            created = Parameter.objects.bulk_create([
+                Parameter(name=name)
+                for name in names
+                if name not in self._parameter_ids
+            ])
+            self._parameter_ids.update((p.name, p.id) for p in created)
+        return self._parameter_ids
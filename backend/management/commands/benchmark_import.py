@@ -0,0 +1,83 @@
+"""Бенчмарк импорта прайс-листов на синтетических данных"""
+
+import json
+import platform
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from backend.benchmark import cleanup_benchmark_data, run_import
+
+
+class Command(BaseCommand):
+    """
+    Прогоняет partner_import на синтетических прайсах разного размера
+    и пишет JSON-отчёт: время, число запросов, пиковый RSS
+    и прирост RSS за прогон, строк/с.
+    Для каждого размера выполняется первичный импорт и повторный
+    с изменёнными ценами у 10% товаров.
+    Пример: python manage.py benchmark_import --sizes 1000 10000
+    """
+
+    help = 'Бенчмарк импорта прайс-листов на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int,
+            default=[1000, 10000, 100000, 1000000],
+            help='Число товаров в прайсах'
+        )
+        parser.add_argument(
+            '--format', choices=['yaml', 'json'], default='yaml'
+        )
+        parser.add_argument(
+            '--mode', choices=['incremental', 'replace'],
+            default='incremental'
+        )
+        parser.add_argument(
+            '--parallel', action='store_true',
+            help='Импорт частями через chord (eager)'
+        )
+        parser.add_argument(
+            '--output', help='Файл для JSON-отчёта (по умолчанию stdout)'
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не удалять данные бенчмарка после прогона'
+        )
+
+    def handle(self, *args, **options):
+        cleanup_benchmark_data()
+
+        results = []
+        try:
+            for size in options['sizes']:
+                for revision in (0, 1):
+                    result = run_import(
+                        size, options['format'], options['mode'],
+                        options['parallel'], revision
+                    )
+                    results.append(result)
+                    self.stderr.write(
+                        f"{size} товаров, ревизия {revision}: "
+                        f"{result['wall_seconds']} с, "
+                        f"{result['queries']} запросов, "
+                        f"{result['rows_per_second']} строк/с"
+                    )
+        finally:
+            if not options['keep']:
+                cleanup_benchmark_data()
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'results': results,
+        }
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(content + '\n')
+        else:
+            self.stdout.write(content)
@@ -0,0 +1,73 @@
+"""Бенчмарк сериализации страницы каталога"""
+
+import json
+import platform
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from backend.benchmark import cleanup_benchmark_data, run_serialization
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает время сериализации страницы каталога: вложенный
+    ProductInfoSerializer, CatalogEntrySerializer по экземплярам
+    и быстрый режим по строкам values(). Пишет JSON-отчёт.
+    Пример: python manage.py benchmark_serialization --page-size 50
+    """
+
+    help = 'Бенчмарк сериализации страницы каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--goods', type=int, default=1000,
+            help='Число товаров в синтетическом каталоге'
+        )
+        parser.add_argument(
+            '--page-size', type=int, default=50,
+            help='Число товаров на странице'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Число повторов замера'
+        )
+        parser.add_argument(
+            '--output', help='Файл для JSON-отчёта (по умолчанию stdout)'
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не удалять данные бенчмарка после прогона'
+        )
+
+    def handle(self, *args, **options):
+        cleanup_benchmark_data()
+
+        try:
+            result = run_serialization(
+                options['goods'], options['page_size'], options['repeat']
+            )
+        finally:
+            if not options['keep']:
+                cleanup_benchmark_data()
+
+        timings = result['ms_per_page']
+        self.stderr.write(
+            f"{result['page_size']} товаров на странице: "
+            f"nested {timings['nested']} мс, model {timings['model']} мс, "
+            f"flat {timings['flat']} мс (x{result['speedup']})"
+        )
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'result': result,
+        }
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(content + '\n')
+        else:
+            self.stdout.write(content)
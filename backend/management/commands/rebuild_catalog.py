@@ -0,0 +1,26 @@
+"""Полная пересборка витрины каталога"""
+
+from django.core.management.base import BaseCommand
+
+from backend.catalog import refresh_catalog_entries
+
+
+class Command(BaseCommand):
+    """
+    Пересобирает строки CatalogEntry и поисковые векторы для всего
+    каталога или магазинов из --shops. Нужна после правок данных
+    в обход ORM (SQL, update() без сигналов).
+    Пример: python manage.py rebuild_catalog --shops 1 2
+    """
+
+    help = 'Пересборка витрины каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shops', nargs='+', type=int,
+            help='ID магазинов, по умолчанию весь каталог'
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_catalog_entries(shop_ids=options['shops'])
+        self.stdout.write(f'Пересобрано строк: {count}')
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_product_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='import_checksum',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Контрольная сумма последнего импорта'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='import_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия импорта'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='imported_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего импорта'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_shop_import_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductInfoTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_info_id', models.PositiveIntegerField(verbose_name='ИД товара')),
+                ('shop_id', models.PositiveIntegerField(verbose_name='ИД магазина')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Удалён')),
+            ],
+            options={
+                'verbose_name': 'Удалённый товар',
+                'verbose_name_plural': 'Список удалённых товаров',
+            },
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменён'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['updated_at', 'id'], name='product_info_changes'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfotombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='product_info_tombstones'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_productinfo_updated_at_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['price', 'id'], name='product_info_price_id'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['quantity', 'id'], name='product_info_quantity_id'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='product_info_search'
+)
+
+FILL_SEARCH_VECTOR = """
+    UPDATE backend_productinfo AS info SET search_vector = (
+        SELECT
+            setweight(to_tsvector('russian', product.name), 'A')
+            || setweight(to_tsvector('english', product.name), 'A')
+            || setweight(to_tsvector('simple', info.model), 'A')
+            || setweight(to_tsvector('russian', coalesce((
+                SELECT string_agg(parameter.value, ' ')
+                FROM backend_productparameter AS parameter
+                WHERE parameter.product_info_id = info.id
+            ), '')), 'B')
+            || setweight(to_tsvector('russian', product.description), 'C')
+            || setweight(to_tsvector('english', product.description), 'C')
+        FROM backend_product AS product
+        WHERE product.id = info.product_id
+    )
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """GIN-индекс и заполнение вектора - только на PostgreSQL"""
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    schema_editor.execute(FILL_SEARCH_VECTOR)
+    schema_editor.add_index(ProductInfo, SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    schema_editor.remove_index(ProductInfo, SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_productinfo_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='productinfo',
+                    index=SEARCH_INDEX,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+    ]
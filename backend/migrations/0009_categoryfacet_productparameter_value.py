@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_productinfo_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Число товаров')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.category', verbose_name='Категория')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр')),
+            ],
+            options={
+                'verbose_name': 'Фасет категории',
+                'verbose_name_plural': 'Фасеты категорий',
+                'constraints': [models.UniqueConstraint(fields=('category', 'parameter', 'value'), name='unique_category_facet')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value'], name='product_parameter_value'),
+        ),
+    ]
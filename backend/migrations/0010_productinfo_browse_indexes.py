@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-17 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_categoryfacet_productparameter_value'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'price', 'id'], name='product_info_shop_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['shop', 'price', 'id'], name='product_info_stock_shop_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['price', 'id'], name='product_info_stock_price'),
+        ),
+    ]
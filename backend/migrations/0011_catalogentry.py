@@ -0,0 +1,193 @@
+# Generated by Django 6.0.1 on 2026-10-17 21:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+FILL_BATCH_SIZE = 1000
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='catalog_entry_search'
+)
+OLD_SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='product_info_search'
+)
+
+FILL_SEARCH_VECTOR = """
+    UPDATE backend_catalogentry AS entry SET search_vector = (
+        setweight(to_tsvector('russian', entry.product_name), 'A')
+        || setweight(to_tsvector('english', entry.product_name), 'A')
+        || setweight(to_tsvector('simple', entry.model), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(parameter->>'value', ' ')
+            FROM jsonb_array_elements(entry.parameters) AS parameter
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', entry.product_description), 'C')
+        || setweight(to_tsvector('english', entry.product_description), 'C')
+    )
+"""
+
+
+def fill_catalog(apps, schema_editor):
+    """Строки витрины для всех товаров"""
+
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+
+    ids = list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), FILL_BATCH_SIZE):
+        batch = ids[start:start + FILL_BATCH_SIZE]
+        parameters = {}
+        for info_id, name, value in ProductParameter.objects.filter(
+            product_info_id__in=batch
+        ).order_by('parameter__name', 'id').values_list(
+            'product_info_id', 'parameter__name', 'value'
+        ):
+            parameters.setdefault(info_id, []).append(
+                {'parameter': name, 'value': value}
+            )
+        CatalogEntry.objects.bulk_create([
+            CatalogEntry(
+                product_info_id=info.id, shop_id=info.shop_id,
+                product_id=info.product_id,
+                category_id=info.product.category_id,
+                external_id=info.external_id, model=info.model,
+                product_name=info.product.name,
+                product_description=info.product.description,
+                category_name=info.product.category.name,
+                shop_name=info.shop.name, shop_state=info.shop.state,
+                quantity=info.quantity, price=info.price,
+                price_rrc=info.price_rrc,
+                parameters=parameters.get(info.id, []),
+            )
+            for info in ProductInfo.objects.filter(id__in=batch).select_related(
+                'product__category', 'shop'
+            )
+        ])
+
+
+def create_search_index(apps, schema_editor):
+    """GIN-индекс и заполнение вектора - только на PostgreSQL"""
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    schema_editor.execute(FILL_SEARCH_VECTOR)
+    schema_editor.add_index(CatalogEntry, SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+    schema_editor.remove_index(CatalogEntry, SEARCH_INDEX)
+
+
+def restore_old_search_index(apps, schema_editor):
+    """Откат: GIN-индекс ProductInfo - только на PostgreSQL"""
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    schema_editor.add_index(ProductInfo, OLD_SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_productinfo_browse_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo', verbose_name='Товар')),
+                ('product_id', models.PositiveIntegerField(verbose_name='ИД продукта')),
+                ('category_id', models.PositiveIntegerField(verbose_name='ИД категории')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('product_name', models.CharField(max_length=80, verbose_name='Название продукта')),
+                ('product_description', models.TextField(blank=True, default='', verbose_name='Описание продукта')),
+                ('category_name', models.CharField(max_length=40, verbose_name='Название категории')),
+                ('shop_name', models.CharField(max_length=50, verbose_name='Название магазина')),
+                ('shop_state', models.CharField(max_length=10, verbose_name='Статус магазина')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(default=list, verbose_name='Параметры')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Строка каталога',
+                'verbose_name_plural': 'Витрина каталога',
+                'indexes': [
+                    models.Index(fields=['price', 'product_info'], name='catalog_entry_price'),
+                    models.Index(fields=['quantity', 'product_info'], name='catalog_entry_quantity'),
+                    models.Index(fields=['category_id', 'product_info'], name='catalog_entry_category'),
+                    models.Index(fields=['shop', 'price', 'product_info'], name='catalog_entry_shop_price'),
+                    models.Index(condition=models.Q(('quantity__gt', 0)), fields=['shop', 'price', 'product_info'], name='catalog_entry_stock_shop_price'),
+                    models.Index(condition=models.Q(('quantity__gt', 0)), fields=['price', 'product_info'], name='catalog_entry_stock_price'),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_catalog, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='catalogentry',
+                    index=SEARCH_INDEX,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_price_id',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_quantity_id',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_shop_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_stock_shop_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_stock_price',
+        ),
+        # GIN-индекс product_info_search есть только на PostgreSQL
+        # и удаляется там вместе с колонкой
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='productinfo',
+                    name='product_info_search',
+                ),
+                migrations.RemoveField(
+                    model_name='productinfo',
+                    name='search_vector',
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(
+                    migrations.RunPython.noop, restore_old_search_index
+                ),
+                migrations.RemoveField(
+                    model_name='productinfo',
+                    name='search_vector',
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 14:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_catalogentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='catalogentry',
+            name='shop',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.shop', verbose_name='Магазин'),
+        ),
+    ]
@@ -1,9 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import RegexValidator
 from django.db import models
+from django.utils import timezone
 
 from imagekit.models import ProcessedImageField
 from imagekit.processors import Adjust, ResizeToFill
 
+from backend.caching import bump_catalog_versions, bump_order_version
 from users.models import User
 
 STATE_CHOICES = (
@@ -33,6 +40,16 @@ class Shop(models.Model):
         default='active',
         verbose_name='Статус заказов'
     )
+    import_checksum = models.CharField(
+        max_length=64, blank=True, default='',
+        verbose_name='Контрольная сумма последнего импорта'
+    )
+    import_version = models.PositiveIntegerField(
+        default=0, verbose_name='Версия импорта'
+    )
+    imported_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Дата последнего импорта'
+    )
 
     class Meta:
         verbose_name = 'Магазин'
@@ -91,6 +108,52 @@ class Product(models.Model):
         return self.name
 
 
+class ProductInfoQuerySet(models.QuerySet):
+    """QuerySet товаров, фиксирующий удаления для ленты изменений"""
+
+    TOMBSTONE_BATCH_SIZE = 1000
+
+    def write_tombstones(self):
+        """
+        Сохраняет надгробия ProductInfoTombstone пачками, удаляет
+        устаревшие и возвращает магазины удаляемых товаров.
+        """
+
+        rows = self.order_by().values_list('id', 'shop_id', 'external_id')
+        shop_ids = set()
+        batch = []
+        for info_id, shop_id, external_id in rows.iterator(
+            chunk_size=self.TOMBSTONE_BATCH_SIZE
+        ):
+            shop_ids.add(shop_id)
+            batch.append(ProductInfoTombstone(
+                product_info_id=info_id,
+                shop_id=shop_id,
+                external_id=external_id
+            ))
+            if len(batch) >= self.TOMBSTONE_BATCH_SIZE:
+                ProductInfoTombstone.objects.bulk_create(batch)
+                batch = []
+        ProductInfoTombstone.objects.bulk_create(batch)
+        ProductInfoTombstone.objects.filter(
+            deleted_at__lt=timezone.now() - timedelta(
+                days=settings.CHANGES_RETENTION_DAYS
+            )
+        ).delete()
+        return shop_ids
+
+    def delete(self):
+        """
+        Удаляет товары, сохраняя надгробия. Версия каталога
+        поднимается один раз на магазин, а не на каждую строку.
+        """
+
+        shop_ids = self.write_tombstones()
+        result = super().delete()
+        bump_catalog_versions(*shop_ids)
+        return result
+
+
 class ProductInfo(models.Model):
     """Информация о продукте в конкретном магазине"""
 
@@ -113,6 +176,11 @@ class ProductInfo(models.Model):
     price_rrc = models.PositiveIntegerField(
         verbose_name='Рекомендуемая розничная цена'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Изменён'
+    )
+
+    objects = ProductInfoQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -123,6 +191,41 @@ class ProductInfo(models.Model):
                 name='unique_product_info'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['updated_at', 'id'], name='product_info_changes'
+            ),
+        ]
+
+    def delete(self, *args, **kwargs):
+        ProductInfoTombstone.objects.create(
+            product_info_id=self.id,
+            shop_id=self.shop_id,
+            external_id=self.external_id
+        )
+        result = super().delete(*args, **kwargs)
+        bump_catalog_versions(self.shop_id)
+        return result
+
+
+class ProductInfoTombstone(models.Model):
+    """Удалённый товар магазина для ленты изменений"""
+
+    product_info_id = models.PositiveIntegerField(verbose_name='ИД товара')
+    shop_id = models.PositiveIntegerField(verbose_name='ИД магазина')
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    deleted_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Удалён'
+    )
+
+    class Meta:
+        verbose_name = 'Удалённый товар'
+        verbose_name_plural = "Список удалённых товаров"
+        indexes = [
+            models.Index(
+                fields=['deleted_at', 'id'], name='product_info_tombstones'
+            ),
+        ]
 
 
 class Parameter(models.Model):
@@ -163,6 +266,126 @@ class ProductParameter(models.Model):
                 name='unique_product_parameter'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['parameter', 'value'], name='product_parameter_value'
+            ),
+        ]
+
+
+class CategoryFacet(models.Model):
+    """
+    Сводка значений параметров по категории: число товаров
+    с каждым значением. Пересчитывается после импорта прайса
+    и отдаётся в каталоге вместо GROUP BY на каждый запрос.
+    """
+
+    category = models.ForeignKey(
+        Category, verbose_name='Категория',
+        related_name='facets', on_delete=models.CASCADE
+    )
+    parameter = models.ForeignKey(
+        Parameter, verbose_name='Параметр',
+        related_name='facets', on_delete=models.CASCADE
+    )
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    count = models.PositiveIntegerField(verbose_name='Число товаров')
+
+    class Meta:
+        verbose_name = 'Фасет категории'
+        verbose_name_plural = "Фасеты категорий"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category', 'parameter', 'value'],
+                name='unique_category_facet'
+            ),
+        ]
+
+
+class CatalogEntry(models.Model):
+    """
+    Денормализованная строка каталога: одно предложение магазина
+    со всеми данными для чтения. Список, карточка, поиск и экспорт
+    читают только эту таблицу, её строки пересобирает
+    backend.catalog при импорте и изменении товаров, параметров,
+    продуктов, категорий и магазинов.
+    """
+
+    product_info = models.OneToOneField(
+        ProductInfo, verbose_name='Товар', primary_key=True,
+        related_name='catalog_entry', on_delete=models.CASCADE
+    )
+    # Выборки по магазину идут по catalog_entry_shop_price (shop - первое
+    # поле), отдельный индекс FK планировщик предпочитал ему с сортировкой
+    shop = models.ForeignKey(
+        Shop, verbose_name='Магазин', db_index=False,
+        related_name='catalog_entries', on_delete=models.CASCADE
+    )
+    product_id = models.PositiveIntegerField(verbose_name='ИД продукта')
+    category_id = models.PositiveIntegerField(verbose_name='ИД категории')
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    product_name = models.CharField(
+        max_length=80, verbose_name='Название продукта'
+    )
+    product_description = models.TextField(
+        blank=True, default='', verbose_name='Описание продукта'
+    )
+    category_name = models.CharField(
+        max_length=40, verbose_name='Название категории'
+    )
+    shop_name = models.CharField(
+        max_length=50, verbose_name='Название магазина'
+    )
+    shop_state = models.CharField(
+        max_length=10, verbose_name='Статус магазина'
+    )
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(
+        verbose_name='Рекомендуемая розничная цена'
+    )
+    parameters = models.JSONField(
+        default=list, verbose_name='Параметры'
+    )
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name='Поисковый вектор'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Обновлена'
+    )
+
+    class Meta:
+        verbose_name = 'Строка каталога'
+        verbose_name_plural = "Витрина каталога"
+        indexes = [
+            models.Index(
+                fields=['price', 'product_info'], name='catalog_entry_price'
+            ),
+            models.Index(
+                fields=['quantity', 'product_info'],
+                name='catalog_entry_quantity'
+            ),
+            models.Index(
+                fields=['category_id', 'product_info'],
+                name='catalog_entry_category'
+            ),
+            GinIndex(fields=['search_vector'], name='catalog_entry_search'),
+            models.Index(
+                fields=['shop', 'price', 'product_info'],
+                name='catalog_entry_shop_price'
+            ),
+            models.Index(
+                fields=['shop', 'price', 'product_info'],
+                condition=models.Q(quantity__gt=0),
+                name='catalog_entry_stock_shop_price'
+            ),
+            models.Index(
+                fields=['price', 'product_info'],
+                condition=models.Q(quantity__gt=0),
+                name='catalog_entry_stock_price'
+            ),
+        ]
 
 
 class Contact(models.Model):
@@ -252,6 +475,20 @@ class Order(models.Model):
         )
 
 
+class OrderItemQuerySet(models.QuerySet):
+    """QuerySet позиций, инвалидирующий ETag заказов при удалении"""
+
+    def delete(self):
+        """Удаляет позиции, версия заказов - один раз на покупателя"""
+
+        user_ids = set(
+            self.order_by().values_list('order__user_id', flat=True)
+        )
+        result = super().delete()
+        bump_order_version(*user_ids)
+        return result
+
+
 class OrderItem(models.Model):
     """Позиция в заказе"""
 
@@ -267,6 +504,8 @@ class OrderItem(models.Model):
     )
     quantity = models.PositiveIntegerField(verbose_name='Количество')
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Заказанная позиция'
         verbose_name_plural = "Список заказанных позиций"
@@ -276,3 +515,8 @@ class OrderItem(models.Model):
                 name='unique_order_item'
             ),
         ]
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_order_version(self.order.user_id)
+        return result
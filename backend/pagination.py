@@ -0,0 +1,225 @@
+"""Keyset (курсорная) пагинация каталога"""
+
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк по плану запроса PostgreSQL (EXPLAIN),
+    без COUNT(*). На других СУБД - точный count().
+    """
+
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу сортировки вместо OFFSET и COUNT(*).
+    Сортировка задаётся параметром ordering из ORDERINGS и всегда
+    заканчивается первичным ключом, поэтому позиция строки однозначна,
+    а каждая страница - это диапазонный проход по составному индексу.
+    Общее число строк - только по запросу: count=approx или exact.
+    Результаты полнотекстового поиска (аннотация rank) по умолчанию
+    идут по убыванию релевантности.
+    Если у представления задан page_values, страница читается
+    через values() - словарями, без создания экземпляров моделей.
+    """
+
+    ORDERINGS = {
+        'id': ('pk',),
+        '-id': ('-pk',),
+        'price': ('price', 'pk'),
+        '-price': ('-price', '-pk'),
+        'quantity': ('quantity', 'pk'),
+        '-quantity': ('-quantity', '-pk'),
+        'rank': ('-rank', 'pk'),
+    }
+    default_ordering = 'id'
+    ranked_ordering = 'rank'
+    ordering_query_param = 'ordering'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_size_query_param = 'limit'
+    max_page_size = 200
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE
+        value = request.query_params.get(self.page_size_query_param)
+        if value and value.isdigit() and int(value) > 0:
+            page_size = min(int(value), self.max_page_size)
+        return page_size
+
+    def get_ordering(self, request, queryset):
+        ranked = 'rank' in queryset.query.annotations
+        ordering = request.query_params.get(self.ordering_query_param)
+        if (
+            ordering not in self.ORDERINGS
+            or ordering == self.ranked_ordering and not ranked
+        ):
+            ordering = (
+                self.ranked_ordering if ranked else self.default_ordering
+            )
+        return ordering
+
+    def encode_cursor(self, ordering, values):
+        raw = json.dumps([ordering, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, ordering):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            cursor_ordering, values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode())
+            )
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            cursor_ordering != ordering
+            or not isinstance(values, list)
+            or len(values) != len(self.ORDERINGS[ordering])
+            or not all(
+                isinstance(value, (int, float))
+                and not isinstance(value, bool)
+                for value in values
+            )
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def keyset_filter(self, fields, values):
+        """
+        Строки строго после позиции values для сортировки fields.
+        Для (price, id): price >= p AND (price > p OR id > i),
+        первое условие задаёт начало прохода по индексу.
+        """
+
+        condition = None
+        for field, value in reversed(list(zip(fields, values))):
+            name = field.lstrip('-')
+            op = 'lt' if field.startswith('-') else 'gt'
+            after = Q(**{f'{name}__{op}': value})
+            if condition is None:
+                condition = after
+            else:
+                start = Q(**{f'{name}__{op}e': value})
+                condition = start & (after | condition)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset)
+        fields = self.ORDERINGS[self.ordering]
+
+        self.count = None
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'approx':
+            self.count = estimate_count(queryset)
+        elif count_mode == 'exact':
+            self.count = queryset.count()
+        self.count_mode = count_mode
+
+        values = self.decode_cursor(request, self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(fields, values))
+
+        names = [field.lstrip('-') for field in fields]
+        queryset = queryset.order_by(*fields)
+        page_values = getattr(view, 'page_values', None)
+        if page_values:
+            queryset = queryset.values(*dict.fromkeys([*page_values, *names]))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last_values = None
+        if page:
+            last = page[-1]
+            self.last_values = [
+                last[name] if page_values else getattr(last, name)
+                for name in names
+            ]
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.ordering, self.last_values)
+        )
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_approximate'] = (
+                self.count_mode == 'approx'
+                and connection.vendor == 'postgresql'
+            )
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param, 'required': False,
+                'in': 'query', 'schema': {'type': 'string'},
+            },
+            {
+                'name': self.ordering_query_param, 'required': False,
+                'in': 'query',
+                'schema': {'type': 'string', 'enum': list(self.ORDERINGS)},
+            },
+            {
+                'name': self.page_size_query_param, 'required': False,
+                'in': 'query', 'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param, 'required': False,
+                'in': 'query',
+                'schema': {'type': 'string', 'enum': ['approx', 'exact']},
+            },
+        ]
@@ -0,0 +1,339 @@
+"""Потоковое чтение прайс-листов поставщиков (JSON/NDJSON/CSV/YAML)"""
+
+import codecs
+import csv
+import json
+
+import yaml
+
+from backend.compression import detect_compression, open_decompressed
+
+READ_CHUNK_SIZE = 64 * 1024
+NDJSON_HEADER_LIMIT = 1024 * 1024
+STREAMED_KEYS = ('categories', 'goods')
+JSON_WHITESPACE = ' \t\r\n'
+CSV_PARAMETER_PREFIX = 'param:'
+CSV_INT_FIELDS = ('id', 'category', 'price', 'price_rrc', 'quantity')
+
+
+def detect_format(stream):
+    """
+    Определяет формат по первой непустой строке:
+    '{' и законченный JSON объект без goods - NDJSON,
+    иначе '{' - JSON, 'shop,' - CSV, остальное - YAML.
+    """
+
+    line = b''
+    for _ in range(100):
+        line = stream.readline(NDJSON_HEADER_LIMIT)
+        if line.strip() or not line:
+            break
+    head = line.lstrip(codecs.BOM_UTF8).lstrip()
+
+    if head.startswith(b'{'):
+        if not line.endswith(b'\n'):
+            return 'json'
+        try:
+            header = json.loads(line.decode('utf-8-sig'))
+        except ValueError:
+            return 'json'
+        if isinstance(header, dict) and 'goods' not in header:
+            return 'ndjson'
+        return 'json'
+    if head.startswith(b'shop,'):
+        return 'csv'
+    return 'yaml'
+
+
+def iter_text_lines(stream):
+    """
+    Строки бинарного потока, разделённые только b'\\n', каждая
+    декодируется из UTF-8 отдельно (BOM в начале отбрасывается).
+    Итерация по str режет строки ещё и на U+2028, U+2029, U+0085,
+    которые в JSON и CSV допустимы внутри значений. Перевод строки
+    остаётся в конце строки, как при open(..., newline='').
+    """
+
+    first = True
+    for line in stream:
+        if first:
+            line = line.removeprefix(codecs.BOM_UTF8)
+            first = False
+        yield line.decode('utf-8')
+
+
+class JsonScanner:
+    """Инкрементальный разбор JSON поверх скользящего буфера"""
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            while (
+                self.pos < len(self.buffer)
+                and self.buffer[self.pos] in JSON_WHITESPACE
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(
+                f"Ошибка JSON: ожидался '{char}', получено '{found}'"
+            )
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            if end == len(self.buffer) and not self.eof:
+                # Число на границе буфера может быть обрезано
+                self.fill()
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_events(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    События верхнего уровня JSON документа:
+    ('key', имя), затем ('item', элемент) для потоковых массивов
+    или ('value', значение) для остальных ключей.
+    """
+
+    scanner = JsonScanner(stream, chunk_size)
+    scanner.expect('{')
+    if scanner.peek() == '}':
+        return
+
+    while True:
+        key = scanner.value()
+        scanner.expect(':')
+        yield 'key', key
+
+        if key in STREAMED_KEYS and scanner.peek() == '[':
+            scanner.expect('[')
+            if scanner.peek() == ']':
+                scanner.expect(']')
+            else:
+                while True:
+                    yield 'item', scanner.value()
+                    if scanner.peek() == ']':
+                        scanner.expect(']')
+                        break
+                    scanner.expect(',')
+        else:
+            yield 'value', scanner.value()
+
+        if scanner.peek() == '}':
+            return
+        scanner.expect(',')
+
+
+def iter_yaml_events(stream):
+    """События верхнего уровня YAML документа, аналогично iter_json_events"""
+
+    loader = yaml.SafeLoader(stream)
+
+    def construct():
+        node = loader.compose_node(None, None)
+        data = loader.construct_object(node, deep=True)
+        loader.constructed_objects = {}
+        loader.recursive_objects = {}
+        return data
+
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError('Ошибка YAML: ожидался словарь верхнего уровня')
+        loader.get_event()
+
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = construct()
+            yield 'key', key
+
+            if (
+                key in STREAMED_KEYS
+                and loader.check_event(yaml.SequenceStartEvent)
+            ):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield 'item', construct()
+                loader.get_event()
+            else:
+                yield 'value', construct()
+    finally:
+        loader.dispose()
+
+
+def iter_ndjson_events(stream):
+    """
+    События NDJSON документа: первая строка - шапка (shop,
+    categories, ...), каждая следующая строка - товар.
+    """
+
+    lines = (line for line in stream if line.strip())
+    header = next(lines, None)
+    if header is None:
+        return
+    for key, value in json.loads(header).items():
+        yield 'key', key
+        yield 'value', value
+
+    yield 'key', 'goods'
+    for line in lines:
+        yield 'item', json.loads(line)
+
+
+def csv_good(row):
+    """Товар из строки CSV, параметры в колонках param:<имя>"""
+
+    good = {
+        field: int(row[field]) if field in CSV_INT_FIELDS else row[field]
+        for field in ('id', 'name', 'category', 'model',
+                      'price', 'price_rrc', 'quantity')
+    }
+    good['parameters'] = {
+        column[len(CSV_PARAMETER_PREFIX):]: value
+        for column, value in row.items()
+        if column.startswith(CSV_PARAMETER_PREFIX) and value != ''
+    }
+    return good
+
+
+def iter_csv_events(stream):
+    """События CSV: все строки - товары ключа goods"""
+
+    yield 'key', 'goods'
+    for row in csv.DictReader(stream):
+        yield 'item', csv_good(row)
+
+
+class PriceListReader:
+    """
+    Потоковое чтение прайс-листа из бинарного файла с seek().
+    Поддерживаются JSON, NDJSON, CSV и YAML, в том числе сжатые
+    gzip или zstd (определяется по сигнатуре файла).
+    Шапка (shop, categories) читается сразу, товары отдаются
+    генератором goods() без загрузки документа в память.
+    Если goods в файле идут раньше шапки (и всегда для CSV,
+    где категории собираются по строкам), товары читаются
+    вторым проходом с начала файла.
+    """
+
+    def __init__(self, fileobj, chunk_size=READ_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.compression = detect_compression(fileobj)
+        self.format = detect_format(self._open())
+        self.shop = None
+        self.categories = []
+        self._events = None
+        self._first_good = None
+        self._rewind = False
+        if self.format == 'csv':
+            self._read_csv_header()
+        else:
+            self._read_header()
+
+    def _open(self):
+        return open_decompressed(self.fileobj, self.compression)
+
+    def _iter_events(self):
+        stream = self._open()
+        if self.format == 'yaml':
+            return iter_yaml_events(stream)
+
+        if self.format == 'json':
+            return iter_json_events(
+                codecs.getreader('utf-8-sig')(stream), self.chunk_size
+            )
+        if self.format == 'ndjson':
+            return iter_ndjson_events(iter_text_lines(stream))
+        return iter_csv_events(iter_text_lines(stream))
+
+    def _read_csv_header(self):
+        categories = {}
+        for row in csv.DictReader(iter_text_lines(self._open())):
+            if self.shop is None:
+                self.shop = row['shop']
+            categories.setdefault(int(row['category']), row['category_name'])
+
+        if self.shop is None:
+            raise ValueError('В прайс-листе отсутствует поле shop')
+        self.categories = [
+            {'id': category_id, 'name': name}
+            for category_id, name in categories.items()
+        ]
+        self._rewind = True
+
+    def _read_header(self):
+        events = self._iter_events()
+        seen = set()
+        key = None
+
+        for kind, value in events:
+            if kind == 'key':
+                key = value
+                seen.add(key)
+            elif key == 'shop':
+                self.shop = value
+            elif key == 'categories':
+                if kind == 'item':
+                    self.categories.append(value)
+                else:
+                    self.categories.extend(value or [])
+            elif key == 'goods' and kind == 'item':
+                if self.shop is not None and 'categories' in seen:
+                    self._events = events
+                    self._first_good = value
+                    break
+                self._rewind = True
+
+        if self.shop is None:
+            raise ValueError('В прайс-листе отсутствует поле shop')
+
+    def goods(self):
+        """Генератор товаров в порядке следования в файле"""
+
+        if self._events is not None:
+            events, self._events = self._events, None
+            yield self._first_good
+            for kind, value in events:
+                if kind == 'key':
+                    break
+                yield value
+        elif self._rewind:
+            key = None
+            for kind, value in self._iter_events():
+                if kind == 'key':
+                    key = value
+                elif key == 'goods' and kind == 'item':
+                    yield value
@@ -0,0 +1,109 @@
+"""Полнотекстовый поиск по каталогу (PostgreSQL)"""
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+from rest_framework.filters import BaseFilterBackend
+
+SEARCH_CONFIGS = ('simple', 'russian', 'english')
+SEARCH_REFRESH_BATCH_SIZE = 1000
+
+# Название и модель - вес A, параметры - B, описание - C.
+# Название и описание индексируются со стеммингом русского и
+# английского, модель - без стемминга, чтобы артикулы искались как есть.
+# Все данные берутся из строки витрины CatalogEntry без соединений.
+SEARCH_VECTOR_SQL = """
+    UPDATE backend_catalogentry AS entry SET search_vector = (
+        setweight(to_tsvector('russian', entry.product_name), 'A')
+        || setweight(to_tsvector('english', entry.product_name), 'A')
+        || setweight(to_tsvector('simple', entry.model), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(parameter->>'value', ' ')
+            FROM jsonb_array_elements(entry.parameters) AS parameter
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', entry.product_description), 'C')
+        || setweight(to_tsvector('english', entry.product_description), 'C')
+    )
+"""
+
+
+def search_enabled():
+    """Полнотекстовый поиск доступен только на PostgreSQL"""
+
+    return connection.vendor == 'postgresql'
+
+
+def refresh_search_vectors(info_ids=None):
+    """
+    Пересчитывает search_vector строк витрины одним UPDATE на пакет.
+    Без аргументов пересчитывает весь каталог.
+    Args:
+        info_ids: id ProductInfo строк CatalogEntry
+    """
+
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        if info_ids is None:
+            cursor.execute(SEARCH_VECTOR_SQL)
+            return
+        info_ids = list(info_ids)
+        for start in range(0, len(info_ids), SEARCH_REFRESH_BATCH_SIZE):
+            cursor.execute(
+                f'{SEARCH_VECTOR_SQL} WHERE entry.product_info_id = ANY(%s)',
+                [info_ids[start:start + SEARCH_REFRESH_BATCH_SIZE]]
+            )
+
+
+def search_query(text):
+    """Запрос websearch_to_tsquery во всех конфигурациях SEARCH_CONFIGS"""
+
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(text, config=config, search_type='websearch')
+        query = part if query is None else query | part
+    return query
+
+
+def search_products(queryset, text):
+    """
+    Строки витрины, подходящие под запрос text, с аннотацией rank.
+    На PostgreSQL - поиск по GIN-индексу search_vector с ранжированием
+    ts_rank, на других СУБД - ICONTAINS по названию и модели.
+    """
+
+    if not search_enabled():
+        return queryset.filter(
+            Q(product_name__icontains=text) | Q(model__icontains=text)
+        ).annotate(rank=Value(1.0, output_field=FloatField()))
+
+    query = search_query(text)
+    # ts_rank возвращает real, приводим к double precision,
+    # чтобы значение в курсоре пагинации сравнивалось точно
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+    )
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск по параметру q, сортировка по релевантности"""
+
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_products(queryset, text)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param, 'required': False,
+                'in': 'query',
+                'description': 'Полнотекстовый поиск по названию, модели, '
+                               'описанию и параметрам',
+                'schema': {'type': 'string'},
+            },
+        ]
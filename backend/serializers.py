@@ -4,7 +4,10 @@ from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
+from backend.compression import available_compressions
+from backend.exporter import EXPORT_FORMATS
 from backend.models import (
+    CatalogEntry,
     Contact,
     Order,
     OrderItem,
@@ -20,6 +23,12 @@ class PartnerUpdateSerializer(serializers.Serializer):
 
     url = serializers.URLField(required=False)
     price_file = serializers.FileField(required=False)
+    mode = serializers.ChoiceField(
+        choices=['incremental', 'replace'],
+        default='incremental'
+    )
+    parallel = serializers.BooleanField(default=False)
+    force = serializers.BooleanField(default=False)
 
     def validate(self, data):
         if not (data.get('url') or data.get('price_file')):
@@ -27,6 +36,19 @@ class PartnerUpdateSerializer(serializers.Serializer):
         return data
 
 
+class PartnerExportSerializer(serializers.Serializer):
+    """Сериализатор параметров экспорта прайса"""
+
+    format = serializers.ChoiceField(
+        choices=list(EXPORT_FORMATS),
+        default='json'
+    )
+    compression = serializers.ChoiceField(
+        choices=available_compressions(),
+        default='none'
+    )
+
+
 class ContactSerializer(serializers.ModelSerializer):
     """Сериализатор контактной информации"""
 
@@ -138,6 +160,100 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         return obj.quantity > 0
 
 
+# Поля CatalogEntry для быстрого режима CatalogEntrySerializer
+CATALOG_ENTRY_VALUES = (
+    'product_info_id', 'model', 'external_id', 'quantity', 'price',
+    'price_rrc', 'product_id', 'product_name', 'product_description',
+    'category_name', 'shop_id', 'shop_name', 'parameters',
+)
+
+
+def catalog_entry_parameters(parameters):
+    """
+    Параметры строки витрины с ключами в порядке
+    ProductParameterSerializer: jsonb хранит ключи объекта
+    в своём порядке (по длине), а не в порядке записи
+    """
+
+    return [
+        {'parameter': item['parameter'], 'value': item['value']}
+        for item in parameters
+    ]
+
+
+def flat_catalog_entry(row):
+    """
+    Строка values(*CATALOG_ENTRY_VALUES) витрины в формате
+    CatalogEntrySerializer, без полей DRF и экземпляра модели
+    """
+
+    return {
+        'id': row['product_info_id'],
+        'model': row['model'],
+        'external_id': row['external_id'],
+        'quantity': row['quantity'],
+        'price': row['price'],
+        'price_rrc': row['price_rrc'],
+        'in_stock': row['quantity'] > 0,
+        'product': {
+            'id': row['product_id'],
+            'name': row['product_name'],
+            'description': row['product_description'],
+            'category_name': row['category_name'],
+        },
+        'shop': {'id': row['shop_id'], 'name': row['shop_name']},
+        'parameters': catalog_entry_parameters(row['parameters']),
+    }
+
+
+class CatalogEntrySerializer(serializers.ModelSerializer):
+    """
+    Строка витрины каталога в формате ProductInfoSerializer.
+    Все поля берутся из одной строки CatalogEntry.
+    Быстрый режим: строки values(*CATALOG_ENTRY_VALUES) вместо
+    экземпляров собираются flat_catalog_entry в тот же JSON.
+    """
+
+    id = serializers.IntegerField(source='product_info_id')
+    in_stock = SerializerMethodField()
+    product = SerializerMethodField()
+    shop = SerializerMethodField()
+    parameters = SerializerMethodField()
+
+    class Meta:
+        model = CatalogEntry
+        fields = [
+            'id', 'model', 'external_id', 'quantity', 'price', 'price_rrc',
+            'in_stock', 'product', 'shop', 'parameters'
+        ]
+
+    def to_representation(self, instance):
+        if isinstance(instance, dict):
+            return flat_catalog_entry(instance)
+        return super().to_representation(instance)
+
+    @extend_schema_field(bool)
+    def get_in_stock(self, obj):
+        return obj.quantity > 0
+
+    @extend_schema_field(ProductSerializer)
+    def get_product(self, obj):
+        return {
+            'id': obj.product_id,
+            'name': obj.product_name,
+            'description': obj.product_description,
+            'category_name': obj.category_name,
+        }
+
+    @extend_schema_field(ShopSerializer)
+    def get_shop(self, obj):
+        return {'id': obj.shop_id, 'name': obj.shop_name}
+
+    @extend_schema_field(ProductParameterSerializer(many=True))
+    def get_parameters(self, obj):
+        return catalog_entry_parameters(obj.parameters)
+
+
 class BasketSerializer(serializers.Serializer):
     """Сериализатор корзины"""
 
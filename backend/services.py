@@ -1,9 +1,21 @@
-"""Сервис корзины на базе Redis"""
+"""Сервисы на базе Redis: корзина, импорт прайсов, подсказки"""
+
+import re
+import time
+import uuid
 
 import redis
 from django.conf import settings
+from redis.exceptions import WatchError
 
 BASKET_EXPIRY_SECONDS = 7 * 24 * 3600
+IMPORT_PROGRESS_EXPIRY_SECONDS = 7 * 24 * 3600
+IMPORT_LATEST_EXPIRY_SECONDS = 24 * 3600
+SUGGEST_LOCK_SECONDS = 3600
+SUGGEST_BATCH_SIZE = 1000
+SUGGEST_MIN_SIMILARITY = 0.5
+# Триграммы, встречающиеся в большем числе терминов, не объединяются
+SUGGEST_MAX_TRIGRAM_TERMS = 5000
 
 redis_pool = redis.ConnectionPool(
     host=settings.REDIS_HOST,
@@ -59,3 +71,514 @@ class BasketService:
 
         key = BasketService._get_key(user_id)
         redis_client.delete(key)
+
+
+class ImportProgress:
+    """
+    Прогресс импорта прайс-листа в Redis.
+    Фазы: download, parse, write, reconcile, done.
+    Активные импорты хранятся в sorted set по времени старта.
+    """
+
+    ACTIVE_KEY = 'import_progress:active'
+    FLOAT_FIELDS = ('started_at', 'updated_at', 'finished_at')
+    INT_FIELDS = ('user_id', 'rows', 'errors')
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.key = f"import_progress:{task_id}"
+
+    def start(self, user_id, phase):
+        """Регистрирует новый импорт"""
+
+        now = time.time()
+        pipe = redis_client.pipeline()
+        pipe.hset(self.key, mapping={
+            'task_id': self.task_id,
+            'user_id': user_id,
+            'status': 'running',
+            'phase': phase,
+            'rows': 0,
+            'errors': 0,
+            'started_at': now,
+            'updated_at': now,
+        })
+        pipe.expire(self.key, IMPORT_PROGRESS_EXPIRY_SECONDS)
+        pipe.zadd(self.ACTIVE_KEY, {self.task_id: now})
+        pipe.execute()
+
+    def update(self, **fields):
+        """Обновляет поля прогресса (phase, shop и т.д.)"""
+
+        fields['updated_at'] = time.time()
+        redis_client.hset(self.key, mapping=fields)
+
+    def phase(self, phase):
+        """Переводит импорт в новую фазу"""
+
+        self.update(phase=phase)
+
+    def add_rows(self, count):
+        """Увеличивает счётчик обработанных строк"""
+
+        pipe = redis_client.pipeline()
+        pipe.hincrby(self.key, 'rows', count)
+        pipe.hset(self.key, 'updated_at', time.time())
+        pipe.execute()
+
+    def finish(self, result):
+        """Отмечает успешное завершение импорта"""
+
+        self.update(
+            status='done', phase='done', result=result,
+            finished_at=time.time()
+        )
+        redis_client.zrem(self.ACTIVE_KEY, self.task_id)
+
+    def fail(self, error):
+        """Отмечает импорт как завершившийся ошибкой"""
+
+        redis_client.hincrby(self.key, 'errors', 1)
+        self.update(
+            status='failed', last_error=error, finished_at=time.time()
+        )
+        redis_client.zrem(self.ACTIVE_KEY, self.task_id)
+
+    @classmethod
+    def get(cls, task_id):
+        """
+        Возвращает прогресс импорта с расчётом скорости
+        Returns:
+            dict | None: состояние импорта или None, если не найден
+        """
+
+        data = redis_client.hgetall(f"import_progress:{task_id}")
+        return cls._decode(data)
+
+    @classmethod
+    def active(cls):
+        """Список выполняющихся импортов, от самых старых"""
+
+        task_ids = redis_client.zrange(cls.ACTIVE_KEY, 0, -1)
+        pipe = redis_client.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(f"import_progress:{task_id}")
+
+        result, expired = [], []
+        for task_id, data in zip(task_ids, pipe.execute()):
+            if data:
+                result.append(cls._decode(data))
+            else:
+                expired.append(task_id)
+        if expired:
+            redis_client.zrem(cls.ACTIVE_KEY, *expired)
+        return result
+
+    @classmethod
+    def _decode(cls, data):
+        if not data:
+            return None
+
+        for field in cls.FLOAT_FIELDS:
+            if field in data:
+                data[field] = float(data[field])
+        for field in cls.INT_FIELDS:
+            if field in data:
+                data[field] = int(data[field])
+
+        now = time.time()
+        elapsed = data.get('finished_at', now) - data['started_at']
+        data['elapsed_seconds'] = round(elapsed, 3)
+        data['idle_seconds'] = round(now - data['updated_at'], 3)
+        data['rows_per_second'] = (
+            round(data['rows'] / elapsed, 1) if elapsed > 0 else 0.0
+        )
+        return data
+
+
+class ImportQueue:
+    """
+    Блокировка импорта по магазину и схема "последний побеждает".
+    Новая загрузка помечается как последняя, более старые задачи,
+    ещё ожидающие блокировку, при запуске пропускаются.
+    """
+
+    @staticmethod
+    def _lock_key(user_id):
+        return f"import_lock:{user_id}"
+
+    @staticmethod
+    def _latest_key(user_id):
+        return f"import_latest:{user_id}"
+
+    @staticmethod
+    def enqueue(user_id, task_id):
+        """Помечает задачу как последнюю загрузку магазина"""
+
+        redis_client.set(
+            ImportQueue._latest_key(user_id), task_id,
+            ex=IMPORT_LATEST_EXPIRY_SECONDS
+        )
+
+    @staticmethod
+    def is_latest(user_id, task_id):
+        """Нет ли более новой загрузки для магазина"""
+
+        latest = redis_client.get(ImportQueue._latest_key(user_id))
+        return latest is None or latest == task_id
+
+    @staticmethod
+    def acquire(user_id, task_id):
+        """Захватывает блокировку импорта магазина без ожидания"""
+
+        return bool(redis_client.set(
+            ImportQueue._lock_key(user_id), task_id,
+            nx=True, ex=settings.IMPORT_LOCK_TIMEOUT
+        ))
+
+    @staticmethod
+    def release(user_id, task_id):
+        """Снимает блокировку и отметку последней загрузки этой задачи"""
+
+        for key in (
+            ImportQueue._lock_key(user_id), ImportQueue._latest_key(user_id)
+        ):
+            _delete_if_equal(key, task_id)
+
+
+def _delete_if_equal(key, value):
+    """Удаляет ключ, только если он всё ещё хранит value"""
+
+    with redis_client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            if pipe.get(key) != value:
+                pipe.unwatch()
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.execute()
+        except WatchError:
+            pass
+
+
+class SuggestIndex:
+    """
+    Индекс подсказок по названиям и моделям товаров в Redis.
+    Префиксный поиск - ZRANGEBYLEX по sorted set из суффиксов,
+    начинающихся с каждого слова. Опечатки - по триграммам, как
+    в pg_trgm: множество терминов на триграмму, пересечение
+    считается ZUNIONSTORE. Индекс строится в новом поколении
+    ключей и переключается одной записью, запросы к БД не нужны.
+    После импорта обновляются только термины магазина: поколение
+    хранит термины каждого магазина и число магазинов на термин.
+    """
+
+    GENERATION_KEY = 'suggest:generation'
+    LOCK_KEY = 'suggest:lock'
+    REQUEST_KEY = 'suggest:requested'
+    SEPARATOR = '\t'
+
+    @staticmethod
+    def normalize(text):
+        """Нижний регистр, ё как е, одиночные пробелы"""
+
+        return re.sub(r'\s+', ' ', text.lower().replace('ё', 'е')).strip()
+
+    @staticmethod
+    def trigrams(text):
+        """Триграммы слов текста с дополнением пробелами (как pg_trgm)"""
+
+        result = set()
+        for word in re.findall(r'\w+', text):
+            padded = f'  {word} '
+            result.update(
+                padded[i:i + 3] for i in range(len(padded) - 2)
+            )
+        return result
+
+    @staticmethod
+    def _prefix_key(generation):
+        return f"suggest:{generation}:prefix"
+
+    @staticmethod
+    def _trigram_key(generation, trigram):
+        return f"suggest:{generation}:tri:{trigram}"
+
+    @staticmethod
+    def _refs_key(generation):
+        """Число магазинов с термином: hash член -> счётчик"""
+
+        return f"suggest:{generation}:refs"
+
+    @staticmethod
+    def _shop_key(generation, shop_id):
+        """Термины магазина для инкрементального обновления"""
+
+        return f"suggest:{generation}:shop:{shop_id}"
+
+    @staticmethod
+    def _keys_key(generation):
+        """Все ключи поколения, чтобы удалить его без SCAN"""
+
+        return f"suggest:{generation}:keys"
+
+    @classmethod
+    def request(cls):
+        """Отмечает, что индекс устарел и его нужно перестроить"""
+
+        redis_client.set(cls.REQUEST_KEY, 1)
+
+    @classmethod
+    def is_requested(cls):
+        return bool(redis_client.exists(cls.REQUEST_KEY))
+
+    @classmethod
+    def take_request(cls):
+        """Снимает отметку, возвращает, была ли она"""
+
+        pipe = redis_client.pipeline()
+        pipe.get(cls.REQUEST_KEY)
+        pipe.delete(cls.REQUEST_KEY)
+        return pipe.execute()[0] is not None
+
+    @classmethod
+    def acquire(cls):
+        """Блокировка перестроения индекса"""
+
+        return bool(redis_client.set(
+            cls.LOCK_KEY, 1, nx=True, ex=SUGGEST_LOCK_SECONDS
+        ))
+
+    @classmethod
+    def release(cls):
+        redis_client.delete(cls.LOCK_KEY)
+
+    @classmethod
+    def _add(cls, pipe, generation, member, keys):
+        """Добавляет член kind:text в префиксы и триграммы поколения"""
+
+        normalized = cls.normalize(member.split(':', 1)[1])
+        words = [m.start() for m in re.finditer(r'\w+', normalized)]
+        pipe.zadd(cls._prefix_key(generation), {
+            f"{normalized[start:]}{cls.SEPARATOR}{member}": 0
+            for start in words or [0]
+        })
+        for trigram in cls.trigrams(normalized):
+            key = cls._trigram_key(generation, trigram)
+            pipe.sadd(key, member)
+            keys.add(key)
+
+    @classmethod
+    def _remove(cls, pipe, generation, member):
+        """Удаляет член из префиксов и триграмм поколения"""
+
+        normalized = cls.normalize(member.split(':', 1)[1])
+        words = [m.start() for m in re.finditer(r'\w+', normalized)]
+        pipe.zrem(cls._prefix_key(generation), *(
+            f"{normalized[start:]}{cls.SEPARATOR}{member}"
+            for start in words or [0]
+        ))
+        for trigram in cls.trigrams(normalized):
+            pipe.srem(cls._trigram_key(generation, trigram), member)
+
+    @classmethod
+    def _track(cls, generation, keys):
+        """Запоминает ключи в наборе ключей поколения"""
+
+        keys = list(keys)
+        for start in range(0, len(keys), SUGGEST_BATCH_SIZE):
+            redis_client.sadd(
+                cls._keys_key(generation),
+                *keys[start:start + SUGGEST_BATCH_SIZE]
+            )
+
+    @classmethod
+    def rebuild(cls, terms):
+        """
+        Строит индекс заново и переключает на него запросы.
+        Args:
+            terms: тройки (вид, текст, ID магазина), вид - name или
+                model, без повторов; одинаковые термины подряд
+                индексируются один раз
+        Returns:
+            int: число проиндексированных терминов
+        """
+
+        generation = uuid.uuid4().hex[:12]
+        refs_key = cls._refs_key(generation)
+        keys = {cls._prefix_key(generation), refs_key}
+        count = 0
+        previous_member = None
+        pipe = redis_client.pipeline(transaction=False)
+
+        for index, (kind, text, shop_id) in enumerate(terms):
+            if not cls.normalize(text):
+                continue
+            member = f"{kind}:{text}"
+            shop_key = cls._shop_key(generation, shop_id)
+            pipe.sadd(shop_key, member)
+            pipe.hincrby(refs_key, member, 1)
+            keys.add(shop_key)
+            if member != previous_member:
+                cls._add(pipe, generation, member, keys)
+                previous_member = member
+                count += 1
+            if (index + 1) % SUGGEST_BATCH_SIZE == 0:
+                pipe.execute()
+        pipe.execute()
+        cls._track(generation, keys)
+
+        previous = redis_client.getset(cls.GENERATION_KEY, generation)
+        if previous:
+            cls._drop(previous)
+        return count
+
+    @classmethod
+    def update_shop(cls, shop_id, terms):
+        """
+        Обновляет термины одного магазина в текущем поколении:
+        добавляет новые и удаляет те, что больше нет ни у одного
+        магазина. Работа пропорциональна терминам магазина.
+        Args:
+            shop_id: ID магазина
+            terms: пары (вид, текст) магазина
+        Returns:
+            int | None: число изменённых терминов, None - поколения
+                нет или оно построено без учёта магазинов
+        """
+
+        generation = redis_client.get(cls.GENERATION_KEY)
+        if not generation or not redis_client.exists(
+            cls._keys_key(generation)
+        ):
+            return None
+
+        refs_key = cls._refs_key(generation)
+        shop_key = cls._shop_key(generation, shop_id)
+        current = {
+            f"{kind}:{text}" for kind, text in terms if cls.normalize(text)
+        }
+        indexed = redis_client.smembers(shop_key)
+        changed = [(member, 1) for member in current - indexed]
+        changed += [(member, -1) for member in indexed - current]
+
+        keys = {shop_key}
+        pipe = redis_client.pipeline(transaction=False)
+        for start in range(0, len(changed), SUGGEST_BATCH_SIZE):
+            batch = changed[start:start + SUGGEST_BATCH_SIZE]
+            for member, delta in batch:
+                pipe.hincrby(refs_key, member, delta)
+            for (member, delta), refs in zip(batch, pipe.execute()):
+                if delta > 0:
+                    pipe.sadd(shop_key, member)
+                    if refs == 1:
+                        cls._add(pipe, generation, member, keys)
+                else:
+                    pipe.srem(shop_key, member)
+                    if refs <= 0:
+                        cls._remove(pipe, generation, member)
+                        pipe.hdel(refs_key, member)
+            pipe.execute()
+        cls._track(generation, keys)
+        return len(changed)
+
+    @classmethod
+    def _drop(cls, generation):
+        """Удаляет ключи старого поколения по его набору ключей"""
+
+        keys_key = cls._keys_key(generation)
+        if redis_client.exists(keys_key):
+            keys = redis_client.sscan_iter(keys_key, count=SUGGEST_BATCH_SIZE)
+        else:
+            # Поколение, построенное до учёта ключей
+            keys = redis_client.scan_iter(
+                match=f"suggest:{generation}:*", count=SUGGEST_BATCH_SIZE
+            )
+        pipe = redis_client.pipeline(transaction=False)
+        for index, key in enumerate(keys):
+            pipe.unlink(key)
+            if (index + 1) % SUGGEST_BATCH_SIZE == 0:
+                pipe.execute()
+        pipe.unlink(keys_key)
+        pipe.execute()
+
+    @classmethod
+    def suggest(cls, text, limit=10):
+        """
+        Подсказки для начала ввода или строки с опечаткой.
+        Совпадения по началу слова, а если их нет - похожие по
+        триграммам с похожестью не ниже SUGGEST_MIN_SIMILARITY.
+        Returns:
+            list: словари с полями text и kind
+        """
+
+        query = cls.normalize(text)
+        generation = redis_client.get(cls.GENERATION_KEY)
+        if not query or not generation:
+            return []
+
+        members = []
+        for entry in redis_client.zrangebylex(
+            cls._prefix_key(generation),
+            f"[{query}", f"[{query}".encode() + b'\xff',
+            start=0, num=limit * 4
+        ):
+            member = entry.split(cls.SEPARATOR, 1)[1]
+            if member not in members:
+                members.append(member)
+            if len(members) == limit:
+                break
+
+        query_trigrams = cls.trigrams(query)
+        if not members and query_trigrams:
+            members = cls._similar(generation, query_trigrams, limit)
+
+        results = []
+        for member in members[:limit]:
+            kind, _, term = member.partition(':')
+            results.append({'text': term, 'kind': kind})
+        return results
+
+    @classmethod
+    def _similar(cls, generation, query_trigrams, limit):
+        """
+        Термины, содержащие похожие на запрос слова: доля триграмм
+        запроса, найденных в термине (как word_similarity в pg_trgm).
+        При равенстве выше термины с меньшим числом лишних триграмм.
+        Кандидаты отбираются объединением только редких триграмм
+        (не больше SUGGEST_MAX_TRIGRAM_TERMS терминов), чтобы частые
+        вроде '  с' не превращали ZUNIONSTORE в проход по всему
+        индексу. Похожесть кандидатов считается по всем триграммам.
+        """
+
+        keys = [
+            cls._trigram_key(generation, trigram)
+            for trigram in query_trigrams
+        ]
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.scard(key)
+        keys = [
+            key for key, size in zip(keys, pipe.execute())
+            if 0 < size <= SUGGEST_MAX_TRIGRAM_TERMS
+        ]
+        if not keys:
+            return []
+
+        result_key = f"suggest:{generation}:tmp:{uuid.uuid4().hex}"
+        pipe = redis_client.pipeline()
+        pipe.zunionstore(result_key, keys)
+        pipe.zrevrange(result_key, 0, limit * 10 - 1, withscores=True)
+        pipe.unlink(result_key)
+        candidates = pipe.execute()[1]
+
+        scored = []
+        for member, _ in candidates:
+            term = cls.trigrams(cls.normalize(member.split(':', 1)[1]))
+            shared = len(query_trigrams & term)
+            if shared / len(query_trigrams) < SUGGEST_MIN_SIMILARITY:
+                continue
+            similarity = shared / (len(query_trigrams) + len(term) - shared)
+            scored.append((-shared, -similarity, member))
+        return [member for _, _, member in sorted(scored)[:limit]]
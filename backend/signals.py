@@ -1,11 +1,42 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+)
 from django.dispatch import receiver
+from django.utils import timezone
 
-from backend.models import Product
-from backend.tasks import process_product_images, process_user_avatar
+from backend.caching import bump_catalog_versions, bump_order_version
+from backend.catalog import refresh_catalog_entries, sync_catalog_entry
+from backend.models import (
+    Category,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.tasks import (
+    process_product_images,
+    process_user_avatar,
+    refresh_catalog,
+)
 from users.models import User
 
 
+def refresh_catalog_after_commit(**ids):
+    """
+    Пересборка строк витрины целого магазина, продукта, категории
+    или параметра - задачей Celery после фиксации транзакции.
+    """
+
+    transaction.on_commit(lambda: refresh_catalog.delay(**ids))
+
+
 @receiver(post_save, sender=User)
 def generate_user_thumbnails(sender, instance, created, **kwargs):
     if created and instance.avatar:
@@ -16,3 +47,150 @@ def generate_user_thumbnails(sender, instance, created, **kwargs):
 def generate_product_thumbnails(sender, instance, created, **kwargs):
     if instance.image:
         process_product_images.delay(instance.id)
+
+
+@receiver(post_save, sender=Product)
+def refresh_catalog_on_product(sender, instance, created, **kwargs):
+    """
+    Название и описание продукта хранятся в строках витрины
+    и в ленте изменений его товаров.
+    """
+
+    if not created:
+        ProductInfo.objects.filter(product=instance).update(
+            updated_at=timezone.now()
+        )
+        refresh_catalog_after_commit(product_ids=[instance.id])
+
+
+@receiver(post_save, sender=Category)
+def refresh_catalog_on_category(sender, instance, created, **kwargs):
+    if not created:
+        refresh_catalog_after_commit(category_ids=[instance.id])
+
+
+@receiver(post_save, sender=ProductInfo)
+def bump_catalog_on_product_info(sender, instance, update_fields, **kwargs):
+    """Цена или остаток изменены поштучно (заказ, админка)"""
+
+    bump_catalog_versions(instance.shop_id)
+    sync_catalog_entry(instance, update_fields)
+
+
+@receiver(post_save, sender=ProductParameter)
+def bump_catalog_on_parameter(sender, instance, **kwargs):
+    ProductInfo.objects.filter(id=instance.product_info_id).update(
+        updated_at=timezone.now()
+    )
+    bump_catalog_versions(instance.product_info.shop_id)
+    refresh_catalog_entries([instance.product_info_id])
+
+
+@receiver(post_delete, sender=ProductParameter)
+def bump_catalog_on_parameter_delete(sender, instance, origin=None,
+                                     **kwargs):
+    """
+    Строку витрины пересобираем, только если удалялось само значение
+    (инлайн админки). При удалении товара строка уходит каскадом,
+    при удалении параметра строки пересобирает refresh_catalog,
+    а импорт удаляет значения QuerySet-ом и пересобирает их сам.
+    """
+
+    if isinstance(origin, ProductParameter):
+        bump_catalog_on_parameter(sender, instance)
+
+
+@receiver(post_save, sender=Parameter)
+def refresh_catalog_on_parameter_rename(sender, instance, created, **kwargs):
+    """Название параметра хранится в строках витрины его товаров"""
+
+    if not created:
+        ProductInfo.objects.filter(
+            product_parameters__parameter=instance
+        ).update(updated_at=timezone.now())
+        bump_catalog_versions()
+        refresh_catalog_after_commit(parameter_ids=[instance.id])
+
+
+@receiver(pre_delete, sender=Parameter)
+def refresh_catalog_on_parameter_delete(sender, instance, **kwargs):
+    """Товары запоминаются до того, как значения удалятся каскадом"""
+
+    infos = ProductInfo.objects.filter(product_parameters__parameter=instance)
+    info_ids = list(infos.values_list('id', flat=True))
+    if info_ids:
+        infos.update(updated_at=timezone.now())
+        bump_catalog_versions()
+        refresh_catalog_after_commit(info_ids=info_ids)
+
+
+@receiver(pre_delete, sender=Shop)
+@receiver(pre_delete, sender=Product)
+def write_tombstones_on_cascade(sender, instance, **kwargs):
+    """
+    Каскадное удаление магазина или продукта не вызывает
+    ProductInfoQuerySet.delete: надгробия его товаров пишутся
+    заранее пачкой. Обработчиков удаления у ProductInfo нет, поэтому
+    каскад удаляет товары пачками, а не построчно.
+    """
+
+    bump_catalog_versions(*instance.product_infos.write_tombstones())
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def bump_catalog_on_shop(sender, instance, **kwargs):
+    """Название и статус магазина есть в ответах каталога"""
+
+    bump_catalog_versions(instance.id)
+
+
+@receiver(post_save, sender=Shop)
+def refresh_catalog_on_shop(sender, instance, created, update_fields,
+                            **kwargs):
+    if not created and (
+        update_fields is None or {'name', 'state'} & set(update_fields)
+    ):
+        refresh_catalog_after_commit(shop_ids=[instance.id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_on_shared(sender, instance, **kwargs):
+    """Продукты и категории общие для всех магазинов"""
+
+    bump_catalog_versions()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def bump_orders_on_order(sender, instance, **kwargs):
+    bump_order_version(instance.user_id)
+
+
+@receiver(post_save, sender=OrderItem)
+def bump_orders_on_item(sender, instance, **kwargs):
+    """
+    Позиции создаются вместе с заказом (оформление, инлайн админки),
+    заказ обычно уже загружен. Удаление позиций инвалидирует ETag
+    в OrderItemQuerySet.delete и OrderItem.delete, каскад от заказа -
+    обработчик заказа, от товара - версия магазина в order_etag.
+    """
+
+    if OrderItem.order.is_cached(instance):
+        user_id = instance.order.user_id
+    else:
+        user_id = Order.objects.filter(id=instance.order_id).values_list(
+            'user_id', flat=True
+        ).first()
+    bump_order_version(user_id)
+
+
+@receiver(post_migrate)
+def bump_catalog_on_migrate(sender, **kwargs):
+    """Ответы, закэшированные до миграции, больше не действительны"""
+
+    if sender.name == 'backend':
+        bump_catalog_versions()
@@ -0,0 +1,84 @@
+"""Хранилище загруженных прайс-листов до обработки в Celery"""
+
+import hashlib
+import json
+import os
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+
+def get_spool_storage():
+    """Хранилище из STORAGES, заданное PRICE_SPOOL_STORAGE"""
+
+    return storages[settings.PRICE_SPOOL_STORAGE]
+
+
+def spool_price_file(uploaded_file):
+    """
+    Сохраняет загруженный прайс в хранилище и считает sha256.
+    Args:
+        uploaded_file: UploadedFile из запроса
+    Returns:
+        dict: ссылка на файл для передачи в Celery
+    """
+
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+
+    extension = os.path.splitext(uploaded_file.name)[1].lower()[:10]
+    name = get_spool_storage().save(
+        f"{settings.PRICE_SPOOL_DIR}/{uuid.uuid4().hex}{extension}",
+        uploaded_file
+    )
+    return {
+        'spool': name,
+        'sha256': digest.hexdigest(),
+        'size': uploaded_file.size,
+    }
+
+
+def open_spooled(reference):
+    """Открывает сохранённый прайс на чтение"""
+
+    return get_spool_storage().open(reference['spool'], 'rb')
+
+
+def discard_spooled(reference):
+    """Удаляет сохранённый прайс после обработки"""
+
+    get_spool_storage().delete(reference['spool'])
+
+
+def spool_goods(goods):
+    """
+    Сохраняет часть товаров в хранилище построчно (NDJSON).
+    Используется для передачи частей параллельного импорта в Celery.
+    """
+
+    with SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) as tmp:
+        for good in goods:
+            tmp.write(json.dumps(good, ensure_ascii=False).encode('utf-8'))
+            tmp.write(b'\n')
+        tmp.seek(0)
+        name = get_spool_storage().save(
+            f"{settings.PRICE_SPOOL_DIR}/{uuid.uuid4().hex}.ndjson",
+            File(tmp)
+        )
+    return {'spool': name, 'count': len(goods)}
+
+
+def iter_spooled_goods(reference):
+    """Читает товары, сохранённые spool_goods"""
+
+    with open_spooled(reference) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -1,30 +1,55 @@
 """Celery задачи"""
 
-import json
+import hashlib
 import os
-from datetime import datetime
+import uuid
+from io import BytesIO
 
-from celery import shared_task
+import yaml
+from celery import chord, shared_task
+from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
 from django.db import transaction
-from django.db.models import Prefetch
-from requests import get
-
-from backend.models import (
-    Category,
-    Order,
-    Parameter,
-    Product,
-    ProductInfo,
-    ProductParameter,
-    Shop,
+
+from backend.catalog import refresh_catalog_entries
+from backend.compression import open_compressed_text
+from backend.exporter import (
+    CatalogExporter,
+    collect_stale_exports,
+    export_path,
+    export_url,
+    export_version,
+    find_cached_export,
+)
+from backend.facets import refresh_category_facets
+from backend.fetcher import (
+    fetch_price_list,
+    load_validators,
+    save_validators,
+)
+from backend.importer import CatalogImporter, chunked, info_key
+from backend.models import Category, Order, Product, ProductInfo, Shop
+from backend.parsers import PriceListReader
+from backend.services import (
+    ImportProgress,
+    ImportQueue,
+    SuggestIndex,
+    redis_client,
+)
+from backend.storage import (
+    discard_spooled,
+    iter_spooled_goods,
+    open_spooled,
+    spool_goods,
 )
-from backend.services import redis_client
 from users.models import User
 
 EMAIL_VERIFY_EXPIRY_SECONDS = 1800
+IMPORT_SEEN_EXPIRY_SECONDS = 24 * 3600
+IMPORT_LOCK_RETRY_SECONDS = 15
+SUGGEST_CHUNK_SIZE = 5000
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
@@ -106,89 +131,399 @@ def send_email(self, order_id):
         raise self.retry(exc=exc, countdown=60)
 
 
+def format_import_report(shop_name, email, summary):
+    """Текстовый отчёт об импорте по сводке CatalogImporter"""
+
+    total = summary['inserted'] + summary['updated'] + summary['unchanged']
+    return (
+        f"Импортировано {total} товаров для {shop_name} ({email}): "
+        f"добавлено {summary['inserted']}, обновлено {summary['updated']}, "
+        f"удалено {summary['deleted']}, без изменений {summary['unchanged']}"
+    )
+
+
+def dispatch_partitioned_import(
+    run_id, shop_user, reader, checksum, validators=None
+):
+    """
+    Разбивает goods на части по IMPORT_SHARD_SIZE и запускает
+    их импорт параллельно через chord с финальной сверкой.
+    Продукты и параметры создаются здесь, чтобы части
+    не создавали дубли одновременно.
+    """
+
+    shop, created = Shop.objects.get_or_create(
+        user=shop_user, name=reader.shop
+    )
+    importer = CatalogImporter(shop)
+    importer.import_categories(reader.categories)
+
+    seen_key = f'import_seen:{run_id}'
+    shards = []
+    for shard in chunked(reader.goods(), settings.IMPORT_SHARD_SIZE):
+        keys = set()
+        for batch in chunked(shard, importer.batch_size):
+            product_ids = importer.resolve_products(batch)
+            importer.resolve_parameters(batch)
+            keys.update(
+                info_key(product_ids[good['name']], good['id'])
+                for good in batch
+            )
+        redis_client.sadd(seen_key, *keys)
+        redis_client.expire(seen_key, IMPORT_SEEN_EXPIRY_SECONDS)
+        shards.append(spool_goods(shard))
+
+    ImportProgress(run_id).phase('write')
+    callback = reconcile_import.s(
+        shop.id, run_id, shop_user.email, checksum, validators
+    ).on_error(fail_partitioned_import.s(shop_user.id, run_id, shards))
+    try:
+        if shards:
+            result = chord(
+                import_shard.s(shop.id, shard, run_id) for shard in shards
+            )(callback)
+        else:
+            result = callback.delay([])
+    except Exception:
+        # Chord не запустился (или выполнялся синхронно и упал):
+        # блокировку снимет partner_import, части удаляем здесь
+        discard_partitioned_import(run_id, shards)
+        raise
+
+    return (
+        f"Импорт {shop.name} ({shop_user.email}) разбит на "
+        f"{len(shards)} частей, итог: {result.id}"
+    )
+
+
 @shared_task(bind=True, max_retries=3)
-def partner_import(self, source, user_id):
+def partner_import(
+    self, source, user_id, mode='incremental', parallel=False, force=False
+):
     """
-    Импорт прайс-листа партнера в базу данных
+    Импорт прайс-листа партнера в базу данных.
+    Ход импорта публикуется в ImportProgress по id задачи.
+    Импорты одного магазина идут по очереди под блокировкой
+    ImportQueue, задача пропускается, если есть загрузка новее.
     Args:
-        source: bytes (содержимое файла) ИЛИ URL string
+        source: URL string, ссылка на файл в хранилище (dict из
+            spool_price_file) ИЛИ bytes (содержимое файла)
         user_id: ID пользователя-магазина
+        mode: 'incremental' (дифф по external_id) или 'replace'
+        parallel: разбить goods на части и импортировать через chord
+            (всегда в режиме incremental)
+        force: импортировать, даже если прайс совпадает с последним
     Returns:
         str: Отчёт об импорте
     """
 
     shop_user = User.objects.get(id=user_id)
+    task_id = self.request.id
+    progress = ImportProgress(task_id)
+    if not self.request.retries:
+        progress.start(user_id, 'queued')
+
+    # Устаревшая загрузка не ждёт блокировку, а пропускается сразу
+    if not ImportQueue.is_latest(user_id, task_id):
+        if isinstance(source, dict):
+            discard_spooled(source)
+        report = "Пропущено: получена более новая загрузка прайса"
+        progress.finish(report)
+        return report
+
+    if not ImportQueue.acquire(user_id, task_id):
+        retries = settings.IMPORT_LOCK_TIMEOUT // IMPORT_LOCK_RETRY_SECONDS
+        try:
+            raise self.retry(
+                countdown=IMPORT_LOCK_RETRY_SECONDS, max_retries=retries + 1
+            )
+        except MaxRetriesExceededError:
+            if isinstance(source, dict):
+                discard_spooled(source)
+            report = "Ошибка: импорт магазина не освободил блокировку"
+            progress.fail(report)
+            return report
+
+    dispatched = False
+    try:
+        report, dispatched = run_partner_import(
+            task_id, progress, source, shop_user, mode, parallel, force
+        )
+    finally:
+        # Блокировку параллельного импорта снимает reconcile_import
+        if not dispatched:
+            ImportQueue.release(user_id, task_id)
+    return report
+
+
+def run_partner_import(
+    task_id, progress, source, shop_user, mode, parallel, force
+):
+    """
+    Импорт прайса под блокировкой магазина, см. partner_import.
+    Returns:
+        tuple: (отчёт, запущен ли параллельный импорт)
+    """
+
+    user_id = shop_user.id
+    validators = None
+    progress.phase('download' if isinstance(source, str) else 'parse')
 
     try:
-        if isinstance(source, bytes):
-            content = source.decode('utf-8')
+        if isinstance(source, dict):
+            price_file = open_spooled(source)
+            checksum = source['sha256']
+        elif isinstance(source, bytes):
+            price_file = BytesIO(source)
+            checksum = hashlib.sha256(source).hexdigest()
         else:
-            original_url = source
-            url = source.replace(settings.EXTERNAL_URL, settings.INTERNAL_URL)
-
-            try:
-                response = get(url, timeout=10)
-                response.raise_for_status()
-            except requests.exceptions.RequestException:
-                response = get(original_url, timeout=10)
-                response.raise_for_status()
+            fetched = fetch_price_list(
+                source, load_validators(user_id, source)
+            )
+            if fetched is None:
+                report = "Без изменений: источник ответил 304 Not Modified"
+                progress.finish(report)
+                return report, False
+            price_file, checksum, validators = fetched
+    except Exception as e:
+        progress.fail(str(e))
+        return f"Ошибка чтения: {str(e)}", False
 
-            content = response.content.decode('utf-8')
+    try:
+        with price_file:
+            current = Shop.objects.filter(user=shop_user).first()
+            if (
+                not force and current
+                and current.import_checksum == checksum
+            ):
+                report = (
+                    f"Без изменений: прайс {current.name} совпадает "
+                    f"с импортом версии {current.import_version}"
+                )
+                save_validators(user_id, validators)
+                progress.finish(report)
+                return report, False
+
+            progress.phase('parse')
+            reader = PriceListReader(price_file)
+            shop_name = reader.shop
+            progress.update(shop=shop_name)
+
+            if parallel:
+                return dispatch_partitioned_import(
+                    task_id, shop_user, reader, checksum, validators
+                ), True
+
+            progress.phase('write')
+            with transaction.atomic():
+                shop, created = Shop.objects.get_or_create(
+                    user=shop_user, name=shop_name
+                )
 
+                importer = CatalogImporter(shop, progress=progress)
+                importer.import_categories(reader.categories)
+                if mode == 'replace':
+                    summary = importer.replace_goods(reader.goods())
+                else:
+                    summary = importer.sync_goods(reader.goods())
+                importer.mark_imported(checksum)
+    except (KeyError, ValueError, yaml.YAMLError) as e:
+        progress.fail(str(e))
+        return f"Ошибка формата: {str(e)}", False
     except Exception as e:
-        return f"Ошибка чтения: {str(e)}"
+        progress.fail(str(e))
+        raise
+    finally:
+        if isinstance(source, dict):
+            discard_spooled(source)
+
+    save_validators(user_id, validators)
+    report = format_import_report(shop_name, shop_user.email, summary)
+    progress.finish(report)
+    refresh_shop_facets.delay(shop.id)
+    update_suggest_index.delay(shop.id)
+    return report, False
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def import_shard(self, shop_id, shard, run_id):
+    """Импорт одной части прайс-листа в отдельной короткой транзакции"""
 
     try:
-        data = json.loads(content)
-    except json.JSONDecodeError:
-        import yaml
-        data = yaml.safe_load(content)
+        shop = Shop.objects.get(id=shop_id)
+        importer = CatalogImporter(shop, progress=ImportProgress(run_id))
+        with transaction.atomic():
+            importer.sync_goods(
+                iter_spooled_goods(shard), delete_missing=False
+            )
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=60)
+
+    discard_spooled(shard)
+    return importer.summary
+
+
+@shared_task
+def reconcile_import(
+    summaries, shop_id, run_id, email, checksum, validators=None
+):
+    """
+    Завершение параллельного импорта: удаляет товары, которых
+    нет в прайс-листе, и возвращает общий отчёт.
+    """
 
-    shop_name = data['shop']
+    progress = ImportProgress(run_id)
+    progress.phase('reconcile')
+    seen_key = f'import_seen:{run_id}'
+
+    shop = Shop.objects.get(id=shop_id)
+    importer = CatalogImporter(shop)
+    for summary in summaries:
+        for key, value in summary.items():
+            importer.summary[key] += value
 
     with transaction.atomic():
-        shop, created = Shop.objects.get_or_create(
-            user=shop_user, name=shop_name,
-            defaults={'state': True}
+        importer.delete_unlisted(
+            lambda external_ids: redis_client.smismember(
+                seen_key, external_ids
+            )
         )
+        importer.mark_imported(checksum)
+    redis_client.delete(seen_key)
+    save_validators(shop.user_id, validators)
+    ImportQueue.release(shop.user_id, run_id)
 
-        ProductInfo.objects.filter(shop=shop).delete()
+    report = format_import_report(shop.name, email, importer.summary)
+    progress.finish(report)
+    refresh_shop_facets.delay(shop.id)
+    update_suggest_index.delay(shop.id)
+    return report
 
-        created_count = 0
 
-        for category_data in data['categories']:
-            category, _ = Category.objects.get_or_create(
-                id=category_data['id'],
-                defaults={'name': category_data['name']}
-            )
-            category.shops.add(shop)
+def discard_partitioned_import(run_id, shards):
+    """Удаляет сохранённые части и id товаров параллельного импорта"""
 
-        for good in data['goods']:
-            product, _ = Product.objects.get_or_create(
-                name=good['name'],
-                defaults={'category_id': good['category']}
-            )
+    for shard in shards:
+        discard_spooled(shard)
+    redis_client.delete(f'import_seen:{run_id}')
 
-            product_info = ProductInfo.objects.create(
-                product=product,
-                external_id=good['id'],
-                model=good.get('model', ''),
-                price=good['price'],
-                price_rrc=good['price_rrc'],
-                quantity=good['quantity'],
-                shop=shop
-            )
 
-            for param_name, param_value in good['parameters'].items():
-                parameter, _ = Parameter.objects.get_or_create(name=param_name)
-                ProductParameter.objects.create(
-                    product_info=product_info,
-                    parameter=parameter,
-                    value=str(param_value)
-                )
-            created_count += 1
+@shared_task
+def fail_partitioned_import(request, exc, traceback, user_id, run_id, shards):
+    """
+    Обработчик ошибки chord параллельного импорта: часть не
+    импортировалась после всех повторов или упала сверка.
+    Снимает блокировку магазина, которую иначе держал бы
+    reconcile_import до IMPORT_LOCK_TIMEOUT, и удаляет части.
+    """
+
+    discard_partitioned_import(run_id, shards)
+    ImportQueue.release(user_id, run_id)
+    ImportProgress(run_id).fail(str(exc))
+    return f"Параллельный импорт {run_id} прерван: {exc}"
+
+
+@shared_task
+def refresh_shop_facets(shop_id):
+    """Пересчитывает фасеты категорий магазина после импорта"""
+
+    stats = refresh_category_facets(list(
+        Category.objects.filter(shops=shop_id).values_list('id', flat=True)
+    ))
+    return (
+        f"Фасеты: +{stats['created']}, ~{stats['updated']}, "
+        f"-{stats['deleted']}"
+    )
+
+
+@shared_task
+def refresh_catalog(category_ids=None, shop_ids=None, parameter_ids=None,
+                    info_ids=None, product_ids=None):
+    """
+    Пересобирает строки витрины после переименования продукта,
+    категории, магазина или параметра - это могут быть все строки
+    магазина или каталога, поэтому не в обработчике сигнала.
+    """
+
+    count = refresh_catalog_entries(
+        info_ids=info_ids, product_ids=product_ids,
+        category_ids=category_ids, shop_ids=shop_ids,
+        parameter_ids=parameter_ids
+    )
+    return f"Витрина каталога: пересобрано {count} строк"
+
+
+def suggest_terms():
+    """
+    Названия продуктов и модели товаров для индекса подсказок
+    с магазином, одинаковые термины подряд.
+    """
+
+    names = ProductInfo.objects.order_by('product__name').values_list(
+        'product__name', 'shop_id'
+    ).distinct()
+    for name, shop_id in names.iterator(chunk_size=SUGGEST_CHUNK_SIZE):
+        yield 'name', name, shop_id
+
+    models = ProductInfo.objects.exclude(model='').order_by(
+        'model'
+    ).values_list('model', 'shop_id').distinct()
+    for model, shop_id in models.iterator(chunk_size=SUGGEST_CHUNK_SIZE):
+        yield 'model', model, shop_id
+
+
+def shop_suggest_terms(shop_id):
+    """Термины индекса подсказок одного магазина"""
+
+    infos = ProductInfo.objects.filter(shop_id=shop_id).order_by()
+    for name in infos.values_list('product__name', flat=True).distinct():
+        yield 'name', name
+    for model in infos.exclude(model='').values_list(
+        'model', flat=True
+    ).distinct():
+        yield 'model', model
+
+
+@shared_task
+def rebuild_suggest_index():
+    """
+    Перестраивает индекс подсказок SuggestIndex целиком.
+    Запросы, пришедшие во время перестроения, не теряются и
+    схлопываются в одно повторное перестроение.
+    """
 
-    return f"Импортировано {created_count} товаров для {shop_name} ({shop_user.email})"
+    SuggestIndex.request()
+    report = "Индекс подсказок перестраивается другой задачей"
+    while SuggestIndex.acquire():
+        try:
+            if not SuggestIndex.take_request():
+                return report
+            count = SuggestIndex.rebuild(suggest_terms())
+            report = f"Индекс подсказок перестроен: {count} терминов"
+        finally:
+            SuggestIndex.release()
+    return report
+
+
+@shared_task
+def update_suggest_index(shop_id):
+    """
+    Обновляет в индексе подсказок термины магазина после импорта.
+    Если индекса ещё нет или его держит другая задача, запрашивает
+    полное перестроение - оно учтёт и этот магазин.
+    """
+
+    if SuggestIndex.acquire():
+        try:
+            count = SuggestIndex.update_shop(
+                shop_id, shop_suggest_terms(shop_id)
+            )
+        finally:
+            SuggestIndex.release()
+        # Полное перестроение, запрошенное, пока держали блокировку
+        if count is not None and not SuggestIndex.is_requested():
+            return f"Индекс подсказок: изменено {count} терминов"
+    return rebuild_suggest_index()
 
 
 @shared_task
@@ -217,73 +552,78 @@ def send_email_verification(user_id):
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def partner_export(self, shop_id):
-    """Экспортирует товары магазина в JSON файл"""
+def partner_export(self, shop_id, fmt='json', compression='none'):
+    """
+    Экспортирует товары магазина в файл потоково.
+    Файл кэшируется по версии каталога: пока каталог не менялся,
+    повторный экспорт возвращает уже готовый файл.
+    Args:
+        shop_id: ID магазина
+        fmt: 'json', 'ndjson', 'csv' или 'yaml'
+        compression: 'none', 'gzip' или 'zstd'
+    Returns:
+        str: ссылка на файл экспорта
+    """
 
     try:
-        shop = Shop.objects.select_related('user').get(id=shop_id)
-        products = ProductInfo.objects.filter(shop=shop).select_related(
-            'product__category'
-        ).prefetch_related(
-            Prefetch('product_parameters__parameter')
-        )
-
-        export_data = {
-            'shop': shop.name,
-            'categories': [],
-            'goods': []
-        }
-
-        categories = {}
-        for product in products:
-            cat_id = product.product.category.id
-            if cat_id not in categories:
-                categories[cat_id] = {
-                    'id': cat_id,
-                    'name': product.product.category.name
-                }
-        export_data['categories'] = list(categories.values())
-
-        for product_info in products:
-            parameters = {}
-            for pp in product_info.product_parameters.all():
-                parameters[pp.parameter.name] = pp.value
-
-            good = {
-                'id': product_info.external_id,
-                'name': product_info.product.name,
-                'category': product_info.product.category.id,
-                'model': product_info.model,
-                'price': product_info.price,
-                'price_rrc': product_info.price_rrc,
-                'quantity': product_info.quantity,
-                'parameters': parameters
-            }
-            export_data['goods'].append(good)
-
-        filename = (
-            f"export_{shop.name}_"
-            f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        )
-        filepath = f"exports/{filename}"
+        shop = Shop.objects.get(id=shop_id)
+        version = export_version(shop)
+
+        filepath = find_cached_export(shop, version, fmt, compression)
+        if filepath:
+            return (
+                f"Экспорт сохранён: {export_url(filepath)} "
+                f"(из кэша, версия каталога {version})"
+            )
 
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        filepath = export_path(shop, version, fmt, compression)
         full_path = os.path.join(settings.MEDIA_ROOT, filepath)
-
-        with open(full_path, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
-
-        download_url = f"{settings.EXTERNAL_URL}{filepath}"
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        # Пишем во временный файл, чтобы не отдать недописанный экспорт
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open_compressed_text(tmp_path, compression) as f:
+                goods_count = CatalogExporter(shop).write(f, fmt)
+            os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        collect_stale_exports(shop.id, version)
 
         return (
-            f"Экспорт сохранён: {download_url} "
-            f"({len(export_data['goods'])} товаров)"
+            f"Экспорт сохранён: {export_url(filepath)} "
+            f"({goods_count} товаров, "
+            f"версия импорта {shop.import_version}, "
+            f"версия каталога {version})"
         )
 
     except Exception as exc:
         raise self.retry(exc=exc, countdown=60)
 
 
+@shared_task
+def cleanup_exports():
+    """
+    Периодическая очистка экспортов устаревших версий каталога
+    всех магазинов (CELERY_BEAT_SCHEDULE), в том числе тех,
+    которые больше не экспортируют, и удалённых магазинов.
+    """
+
+    root = os.path.join(settings.MEDIA_ROOT, 'exports')
+    if not os.path.isdir(root):
+        return "Экспорты: нечего удалять"
+
+    shop_ids = {int(name) for name in os.listdir(root) if name.isdigit()}
+    removed = 0
+    for shop in Shop.objects.filter(id__in=shop_ids):
+        removed += collect_stale_exports(shop.id, export_version(shop))
+        shop_ids.discard(shop.id)
+    for shop_id in shop_ids:
+        removed += collect_stale_exports(shop_id)
+    return f"Экспорты: удалено {removed} файлов"
+
+
 @shared_task(bind=True)
 def process_user_avatar(self, user_id):
     """Фоновая обработка аватара"""
@@ -1,23 +1,96 @@
+import csv
 import gc
+import gzip
+import json
 import os
 import tempfile
+import threading
 import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
 import django.test.client as client
+from celery.exceptions import MaxRetriesExceededError, Retry
+from django.conf import settings
+from django.contrib.admin import site
 from django.contrib.auth import get_user_model
-from django.db import connection
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Prefetch, QuerySet
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
 
+from backend.admin import OrderAdmin
+from backend.benchmark import (
+    generate_goods,
+    measure_memory,
+    read_memory_kb,
+    write_price_list,
+)
+from backend.caching import (
+    CATALOG_VERSIONS_KEY,
+    GLOBAL_VERSION,
+    bump_catalog_versions,
+    bump_order_version,
+    catalog_version,
+    read_versions,
+)
+from backend.catalog import PARAMETER_ORDERING, refresh_catalog_entries
+from backend.changes import encode_cursor
+from backend.compression import available_compressions
+from backend.documents import document_key
+from backend.exporter import (
+    CSV_COLUMNS,
+    EXPORT_FORMATS,
+    CatalogExporter,
+    export_version,
+)
+from backend.facets import facet_summary, refresh_category_facets
+from backend.filters import CatalogEntryFilter
 from backend.models import (
+    CatalogEntry,
     Category,
+    CategoryFacet,
     Contact,
     Order,
     OrderItem,
+    Parameter,
     Product,
     ProductInfo,
+    ProductInfoTombstone,
+    ProductParameter,
     Shop,
 )
+from backend.parsers import PriceListReader
+from backend.serializers import CatalogEntrySerializer, ProductInfoSerializer
+from backend.services import (
+    ImportProgress,
+    ImportQueue,
+    SuggestIndex,
+    redis_client,
+)
+from backend.storage import (
+    get_spool_storage,
+    spool_goods,
+    spool_price_file,
+)
+from backend.tasks import (
+    cleanup_exports,
+    fail_partitioned_import,
+    partner_export,
+    partner_import,
+    rebuild_suggest_index,
+    update_suggest_index,
+)
+from procure.celery import app as celery_app
 
 User = get_user_model()
 
@@ -38,31 +111,34 @@ class BackendCoreTests(TestCase):
             category=self.category
         )
 
-    @patch('backend.tasks.partner_import.delay')
-    def test_price_import_task(self, mock_task):
+    def test_price_import_task(self):
         """Тестирует загрузку прайса через Celery задачу"""
 
         yaml_data = """
-        products:
-          - name: Test Product
+        shop: TestShop
+        categories:
+          - id: 901
+            name: Тестовая категория
+        goods:
+          - id: 1
+            category: 901
+            name: Test Product
             model: TP-001
-            quantity: 10
             price: 1000
+            price_rrc: 1200
+            quantity: 10
+            parameters:
+              Цвет: черный
         """
 
-        with tempfile.NamedTemporaryFile(
-                mode='w',
-                suffix='.yaml',
-                delete=False
-        ) as f:
-            f.write(yaml_data)
-            file_path = f.name
+        result = partner_import.apply(
+            args=(yaml_data.encode('utf-8'), self.shop_owner.id)
+        ).get()
 
-        from backend.tasks import partner_import
-        partner_import.delay(file_path, self.shop.id)
-
-        mock_task.assert_called_once()
-        os.unlink(file_path)
+        self.assertIn('Импортировано 1', result)
+        info = ProductInfo.objects.get(shop=self.shop, external_id=1)
+        self.assertEqual(info.product.name, 'Test Product')
+        self.assertEqual(info.quantity, 10)
 
     def test_price_calculation(self):
         """Тестирует расчет общей стоимости товара"""
@@ -75,6 +151,2026 @@ class BackendCoreTests(TestCase):
         self.assertEqual(total, 10000)
 
 
+def make_price_list(count, shop='ImportShop'):
+    """Генерирует прайс-лист с count товарами"""
+
+    return {
+        'shop': shop,
+        'categories': [
+            {'id': 501, 'name': 'Смартфоны'},
+            {'id': 502, 'name': 'Телевизоры'},
+        ],
+        'goods': [
+            {
+                'id': i,
+                'name': f'Товар {i % 7}',
+                'category': 501 + i % 2,
+                'model': f'M-{i}',
+                'price': 1000 + i,
+                'price_rrc': 1200 + i,
+                'quantity': i % 5,
+                'parameters': {'Цвет': 'черный', 'Память': f'{i % 4}GB'},
+            }
+            for i in range(count)
+        ],
+    }
+
+
+class PartnerImportTests(TestCase):
+    """Тесты пакетного импорта прайс-листа"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='import_test', email='import@test.com', type='shop'
+        )
+
+    def run_import(self, data):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        return partner_import.apply(args=(payload, self.shop_owner.id)).get()
+
+    def test_import_creates_catalog(self):
+        """Тестирует создание товаров, параметров и категорий"""
+
+        result = self.run_import(make_price_list(20))
+
+        shop = Shop.objects.get(user=self.shop_owner)
+        self.assertIn('Импортировано 20', result)
+        self.assertEqual(shop.product_infos.count(), 20)
+        self.assertEqual(Product.objects.count(), 7)
+        self.assertEqual(
+            ProductParameter.objects.filter(
+                product_info__shop=shop
+            ).count(),
+            40
+        )
+        self.assertEqual(shop.categories.count(), 2)
+        info = shop.product_infos.get(external_id=3)
+        self.assertEqual(info.price, 1003)
+        self.assertEqual(
+            info.product_parameters.get(parameter__name='Память').value,
+            '3GB'
+        )
+
+    def test_import_queries_do_not_grow_with_rows(self):
+        """Тестирует, что число запросов зависит от пакетов, а не строк"""
+
+        with CaptureQueriesContext(connection) as small:
+            self.run_import(make_price_list(10))
+        with CaptureQueriesContext(connection) as large:
+            self.run_import(make_price_list(200))
+
+        self.assertLessEqual(len(large), len(small) + 2)
+
+    def test_incremental_import_diff(self):
+        """Тестирует обновление на месте, добавление и удаление товаров"""
+
+        data = make_price_list(10)
+        self.run_import(data)
+        shop = Shop.objects.get(user=self.shop_owner)
+        info_id = shop.product_infos.get(external_id=1).id
+
+        data['goods'][1]['price'] = 5000
+        data['goods'][2]['parameters']['Цвет'] = 'белый'
+        data['goods'].pop(3)
+        data['goods'].append(dict(data['goods'][0], id=100))
+        result = self.run_import(data)
+
+        self.assertIn(
+            'добавлено 1, обновлено 2, удалено 1, без изменений 7', result
+        )
+        info = shop.product_infos.get(external_id=1)
+        self.assertEqual(info.id, info_id)
+        self.assertEqual(info.price, 5000)
+        self.assertFalse(shop.product_infos.filter(external_id=3).exists())
+        self.assertEqual(
+            shop.product_infos.get(external_id=2).product_parameters.get(
+                parameter__name='Цвет'
+            ).value,
+            'белый'
+        )
+
+    def test_duplicate_goods_same_in_both_modes(self):
+        """Тестирует одинаковую обработку дублей id в обоих режимах"""
+
+        data = make_price_list(4)
+        data['goods'] += [
+            dict(data['goods'][1], price=7000),
+            dict(data['goods'][2], name='Другой товар', price=8000),
+        ]
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        rows = {}
+        for mode in ('incremental', 'replace', 'incremental'):
+            partner_import.apply(
+                args=(payload, self.shop_owner.id),
+                kwargs={'mode': mode, 'force': True}
+            ).get()
+            rows[mode] = sorted(ProductInfo.objects.filter(
+                shop__user=self.shop_owner
+            ).values_list('external_id', 'product__name', 'price'))
+            self.assertEqual(rows[mode], rows['incremental'])
+
+        self.assertEqual(rows['replace'], [
+            (0, 'Товар 0', 1000),
+            (1, 'Товар 1', 7000),
+            (2, 'Другой товар', 8000),
+            (2, 'Товар 2', 1002),
+            (3, 'Товар 3', 1003),
+        ])
+
+    def test_import_progress_status(self):
+        """Тестирует отчёт о ходе импорта через API"""
+
+        payload = json.dumps(make_price_list(20)).encode('utf-8')
+        task = partner_import.apply(args=(payload, self.shop_owner.id))
+
+        client = APIClient()
+        client.force_authenticate(self.shop_owner)
+        response = client.get(f'/api/v1/partners/imports/{task.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['phase'], 'done')
+        self.assertEqual(response.data['rows'], 20)
+        self.assertEqual(response.data['shop'], 'ImportShop')
+        self.assertIn('rows_per_second', response.data)
+
+        other = User.objects.create_user(
+            username='other', email='other@test.com', type='shop'
+        )
+        client.force_authenticate(other)
+        response = client.get(f'/api/v1/partners/imports/{task.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_identical_payload_skipped(self):
+        """Тестирует пропуск прайса с той же контрольной суммой"""
+
+        data = make_price_list(5)
+        self.run_import(data)
+        shop = Shop.objects.get(user=self.shop_owner)
+        self.assertEqual(shop.import_version, 1)
+        self.assertEqual(len(shop.import_checksum), 64)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import(data)
+
+        self.assertTrue(result.startswith('Без изменений'))
+        self.assertLessEqual(len(queries), 3)
+        shop.refresh_from_db()
+        self.assertEqual(shop.import_version, 1)
+
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        result = partner_import.apply(
+            args=(payload, self.shop_owner.id), kwargs={'force': True}
+        ).get()
+        self.assertIn('без изменений 5', result)
+        shop.refresh_from_db()
+        self.assertEqual(shop.import_version, 2)
+
+    def test_unchanged_import_writes_nothing(self):
+        """Тестирует, что повторный импорт без изменений не пишет в БД"""
+
+        data = make_price_list(30)
+        self.run_import(data)
+        data['goods'].reverse()
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.run_import(data)
+
+        self.assertIn('без изменений 30', result)
+        writes = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')
+            and 'backend_shop' not in q['sql']
+        ]
+        self.assertEqual(writes, [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PartnerUpdateSpoolTests(TestCase):
+    """Тесты сохранения загруженного прайса в хранилище"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='spool_test', email='spool@test.com', type='shop'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop_owner)
+
+    @patch('backend.views.partner_import.apply_async')
+    def test_upload_passes_reference(self, mock_apply):
+        """Тестирует, что в Celery уходит ссылка на файл, а не байты"""
+
+        mock_apply.return_value.id = 'task-id'
+        with open('static/price_test.json', 'rb') as f:
+            content = f.read()
+        response = self.client.post('/api/v1/partners/update/', {
+            'price_file': SimpleUploadedFile('price.json', content)
+        })
+
+        self.assertEqual(response.status_code, 202)
+        source, user_id = mock_apply.call_args.args[0]
+        task_id = mock_apply.call_args.kwargs['task_id']
+        self.assertEqual(set(source), {'spool', 'sha256', 'size'})
+        self.assertEqual(source['sha256'], response.data['sha256'])
+        self.assertLess(len(json.dumps(source)), 200)
+
+        result = partner_import.apply(
+            args=(source, user_id), task_id=task_id
+        ).get()
+
+        self.assertIn('Импортировано 1', result)
+        self.assertFalse(get_spool_storage().exists(source['spool']))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMPORT_SHARD_SIZE=4)
+class PartitionedImportTests(TestCase):
+    """Тесты параллельного импорта частями через chord"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='chord_test', email='chord@test.com', type='shop'
+        )
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(
+            setattr, celery_app.conf, 'task_always_eager', False
+        )
+
+    def test_parallel_import_reconciles(self):
+        """Тестирует импорт частями и удаление исчезнувших товаров"""
+
+        data = make_price_list(10)
+        payload = json.dumps(data).encode('utf-8')
+        partner_import.apply(args=(payload, self.shop_owner.id)).get()
+        shop = Shop.objects.get(user=self.shop_owner)
+        info_id = shop.product_infos.get(external_id=5).id
+
+        data['goods'] = data['goods'][2:] + [dict(data['goods'][0], id=50)]
+        data['goods'][0]['price'] = 7
+        payload = json.dumps(data).encode('utf-8')
+        result = partner_import.apply(
+            args=(payload, self.shop_owner.id, 'incremental', True)
+        ).get()
+
+        self.assertIn('разбит на 3 частей', result)
+        self.assertEqual(
+            sorted(shop.product_infos.values_list('external_id', flat=True)),
+            list(range(2, 10)) + [50]
+        )
+        self.assertEqual(shop.product_infos.get(external_id=5).id, info_id)
+        self.assertEqual(shop.product_infos.get(external_id=2).price, 7)
+        self.assertEqual(Product.objects.count(), 7)
+
+    def assertImportCleanedUp(self, run_id):
+        """Блокировка снята, части и id товаров удалены, импорт провален"""
+
+        self.assertFalse(
+            redis_client.exists(f'import_lock:{self.shop_owner.id}')
+        )
+        self.assertFalse(redis_client.exists(f'import_seen:{run_id}'))
+        self.assertEqual(ImportProgress.get(run_id)['status'], 'failed')
+        _, spooled = get_spool_storage().listdir(settings.PRICE_SPOOL_DIR)
+        self.assertEqual(spooled, [])
+
+    def test_failed_shard_releases_lock(self):
+        """Тестирует, что упавшая часть не оставляет блокировку и файлы"""
+
+        payload = json.dumps(make_price_list(10)).encode('utf-8')
+        with patch(
+            'backend.tasks.CatalogImporter.sync_goods',
+            side_effect=RuntimeError('boom')
+        ):
+            result = partner_import.apply(
+                args=(payload, self.shop_owner.id, 'incremental', True),
+                task_id='failed-run'
+            )
+
+        self.assertEqual(result.state, 'FAILURE')
+        self.assertImportCleanedUp('failed-run')
+
+    def test_chord_errback(self):
+        """Тестирует обработчик ошибки chord, как его вызывает воркер"""
+
+        ImportProgress('chord-run').start(self.shop_owner.id, 'write')
+        self.assertTrue(ImportQueue.acquire(self.shop_owner.id, 'chord-run'))
+        redis_client.sadd('import_seen:chord-run', 1)
+        shards = [spool_goods(make_price_list(2)['goods'])]
+
+        fail_partitioned_import.apply(args=(
+            None, ValueError('boom'), None,
+            self.shop_owner.id, 'chord-run', shards
+        )).get()
+
+        self.assertImportCleanedUp('chord-run')
+        self.assertEqual(ImportProgress.get('chord-run')['last_error'], 'boom')
+
+
+class ImportQueueTests(TestCase):
+    """Тесты блокировки импорта и очереди «последний побеждает»"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='queue_test', email='queue@test.com', type='shop'
+        )
+        self.payload = json.dumps(make_price_list(3)).encode('utf-8')
+        self.addCleanup(
+            redis_client.delete,
+            f'import_lock:{self.shop_owner.id}',
+            f'import_latest:{self.shop_owner.id}'
+        )
+
+    def test_older_upload_skipped(self):
+        """Тестирует, что импортируется только последняя загрузка"""
+
+        ImportQueue.enqueue(self.shop_owner.id, 'older')
+        ImportQueue.enqueue(self.shop_owner.id, 'newer')
+
+        result = partner_import.apply(
+            args=(self.payload, self.shop_owner.id), task_id='older'
+        ).get()
+        self.assertIn('Пропущено', result)
+        self.assertFalse(Shop.objects.filter(user=self.shop_owner).exists())
+
+        result = partner_import.apply(
+            args=(self.payload, self.shop_owner.id), task_id='newer'
+        ).get()
+        self.assertIn('Импортировано 3', result)
+        self.assertFalse(
+            redis_client.exists(f'import_lock:{self.shop_owner.id}')
+        )
+        self.assertFalse(
+            redis_client.exists(f'import_latest:{self.shop_owner.id}')
+        )
+
+    def test_locked_import_retries(self):
+        """Тестирует, что импорт ждёт, пока идёт другой импорт магазина"""
+
+        self.assertTrue(ImportQueue.acquire(self.shop_owner.id, 'running'))
+
+        with patch.object(
+            partner_import, 'retry', side_effect=Retry()
+        ) as mock_retry:
+            result = partner_import.apply(
+                args=(self.payload, self.shop_owner.id), task_id='waiting'
+            )
+
+        self.assertEqual(result.state, 'RETRY')
+        self.assertTrue(mock_retry.called)
+        self.assertFalse(Shop.objects.filter(user=self.shop_owner).exists())
+        self.assertEqual(
+            redis_client.get(f'import_lock:{self.shop_owner.id}'), 'running'
+        )
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_lock_wait_exhausted(self):
+        """Тестирует повторы в ожидании блокировки и отказ после последнего"""
+
+        self.assertTrue(ImportQueue.acquire(self.shop_owner.id, 'running'))
+        source = spool_price_file(
+            SimpleUploadedFile('price.json', self.payload)
+        )
+
+        ImportProgress('waiting').start(self.shop_owner.id, 'queued')
+        with patch.object(ImportProgress, 'start') as mock_start:
+            with patch.object(
+                partner_import, 'retry', side_effect=MaxRetriesExceededError()
+            ):
+                result = partner_import.apply(
+                    args=(source, self.shop_owner.id),
+                    task_id='waiting', retries=241
+                ).get()
+
+        mock_start.assert_not_called()
+        self.assertIn('не освободил блокировку', result)
+        self.assertEqual(ImportProgress.get('waiting')['status'], 'failed')
+        self.assertFalse(get_spool_storage().exists(source['spool']))
+
+    def test_stale_upload_skipped_without_lock(self):
+        """Тестирует, что устаревшая загрузка не ждёт блокировку"""
+
+        self.assertTrue(ImportQueue.acquire(self.shop_owner.id, 'running'))
+        ImportQueue.enqueue(self.shop_owner.id, 'newer')
+
+        result = partner_import.apply(
+            args=(self.payload, self.shop_owner.id), task_id='older'
+        ).get()
+        self.assertIn('Пропущено', result)
+
+
+class PartnerExportTests(TestCase):
+    """Тесты потокового экспорта каталога"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='export_test', email='export@test.com', type='shop'
+        )
+        payload = json.dumps(make_price_list(10)).encode('utf-8')
+        partner_import.apply(args=(payload, self.shop_owner.id)).get()
+        self.shop = Shop.objects.get(user=self.shop_owner)
+
+        media = self.settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_export_matches_json_dump(self):
+        """Тестирует, что вывод совпадает с json.dump(indent=2)"""
+
+        output = StringIO()
+        # Категории и товары с параметрами - по запросу к витрине
+        with self.assertNumQueries(2):
+            count = CatalogExporter(self.shop, chunk_size=4).write(output)
+        content = output.getvalue()
+        data = json.loads(content)
+
+        self.assertEqual(count, 10)
+        self.assertEqual(
+            content, json.dumps(data, ensure_ascii=False, indent=2)
+        )
+        self.assertEqual(
+            list(data), ['shop', 'import_version', 'imported_at',
+                         'categories', 'goods']
+        )
+        self.assertEqual([c['id'] for c in data['categories']], [501, 502])
+        self.assertEqual(
+            [g['id'] for g in data['goods']], list(range(10))
+        )
+        self.assertEqual(
+            data['goods'][0]['parameters'], {'Цвет': 'черный', 'Память': '0GB'}
+        )
+
+    def test_export_empty_shop(self):
+        """Тестирует экспорт магазина без товаров"""
+
+        self.shop.product_infos.all().delete()
+        output = StringIO()
+        CatalogExporter(self.shop).write(output)
+
+        data = json.loads(output.getvalue())
+        self.assertEqual(data['goods'], [])
+        self.assertEqual(
+            output.getvalue(), json.dumps(data, ensure_ascii=False, indent=2)
+        )
+
+    def test_partner_export_task(self):
+        """Тестирует сохранение экспорта задачей partner_export"""
+
+        result = partner_export.apply(args=(self.shop.id,)).get()
+
+        self.assertIn('10 товаров', result)
+        path = result.split(settings.EXTERNAL_URL)[1].split(' ')[0]
+        with open(os.path.join(settings.MEDIA_ROOT, path)) as f:
+            self.assertEqual(len(json.load(f)['goods']), 10)
+
+    def test_formats_round_trip(self):
+        """Тестирует экспорт во всех форматах и импорт обратно"""
+
+        expected = list(CatalogExporter(self.shop).goods())
+
+        for fmt in EXPORT_FORMATS:
+            for compression in available_compressions():
+                with self.subTest(fmt=fmt, compression=compression):
+                    result = partner_export.apply(
+                        args=(self.shop.id,),
+                        kwargs={'fmt': fmt, 'compression': compression}
+                    ).get()
+                    path = result.split(settings.EXTERNAL_URL)[1].split()[0]
+                    with open(os.path.join(settings.MEDIA_ROOT, path),
+                              'rb') as f:
+                        payload = f.read()
+
+                    owner = User.objects.create_user(
+                        username=f'{fmt}_{compression}',
+                        email=f'{fmt}_{compression}@test.com', type='shop'
+                    )
+                    result = partner_import.apply(
+                        args=(payload, owner.id)
+                    ).get()
+                    reader = PriceListReader(BytesIO(payload))
+                    copy = Shop.objects.get(user=owner)
+
+                    self.assertIn('Импортировано 10', result)
+                    self.assertEqual(reader.format, fmt)
+                    self.assertEqual(reader.compression, compression)
+                    self.assertEqual(
+                        list(CatalogExporter(copy).goods()), expected
+                    )
+
+    @override_settings(EXPORT_RETENTION_SECONDS=0)
+    def test_export_cached_by_catalog_version(self):
+        """Тестирует кэш экспорта по версии каталога и очистку старых"""
+
+        first = partner_export.apply(args=(self.shop.id,)).get()
+        cached = partner_export.apply(args=(self.shop.id,)).get()
+        path = first.split(settings.EXTERNAL_URL)[1].split()[0]
+
+        self.assertIn('из кэша', cached)
+        self.assertIn(path, cached)
+
+        info = self.shop.product_infos.first()
+        info.quantity += 1
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                info.save(update_fields=['quantity'])
+        # Версия каталога живёт в Redis, строка магазина не блокируется
+        self.assertFalse(any(
+            query['sql'].startswith('UPDATE "backend_shop"')
+            for query in queries.captured_queries
+        ))
+
+        fresh = partner_export.apply(args=(self.shop.id,)).get()
+        self.assertNotIn('из кэша', fresh)
+        self.assertIn(f'catalog_v{export_version(self.shop)}.json', fresh)
+        self.assertFalse(
+            os.path.exists(os.path.join(settings.MEDIA_ROOT, path))
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.product_infos.last().delete()
+        self.assertNotIn(
+            'из кэша', partner_export.apply(args=(self.shop.id,)).get()
+        )
+
+    @override_settings(EXPORT_RETENTION_SECONDS=60)
+    def test_stale_exports_kept_after_superseded(self):
+        """Тестирует, что срок хранения считается с момента устаревания"""
+
+        first = partner_export.apply(args=(self.shop.id,)).get()
+        path = first.split(settings.EXTERNAL_URL)[1].split()[0]
+        path = os.path.join(settings.MEDIA_ROOT, path)
+        # Файл выгружен давно, но устарел только сейчас
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+        self.addCleanup(redis_client.delete, f'export_stale:{self.shop.id}')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_versions(self.shop.id)
+        self.assertIn('удалено 0', cleanup_exports.apply().get())
+        self.assertTrue(os.path.exists(path))
+
+        redis_client.hset(
+            f'export_stale:{self.shop.id}', os.path.basename(path),
+            time.time() - 61
+        )
+        self.assertIn('удалено 1', cleanup_exports.apply().get())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(redis_client.exists(f'export_stale:{self.shop.id}'))
+
+    def test_export_version_survives_redis_flush(self):
+        """Тестирует, что после очистки Redis версия экспорта не повторяется"""
+
+        first = partner_export.apply(args=(self.shop.id,)).get()
+        version = catalog_version(self.shop.id)
+
+        redis_client.delete(CATALOG_VERSIONS_KEY)
+        self.assertGreater(catalog_version(self.shop.id), version)
+        fresh = partner_export.apply(args=(self.shop.id,)).get()
+        self.assertNotIn('из кэша', fresh)
+        self.assertNotEqual(
+            first.split(settings.EXTERNAL_URL)[1].split()[0],
+            fresh.split(settings.EXTERNAL_URL)[1].split()[0]
+        )
+
+    @patch('backend.views.partner_export.delay')
+    def test_export_view_returns_cached_file(self, mock_delay):
+        """Тестирует, что готовый экспорт отдаётся без новой задачи"""
+
+        mock_delay.return_value.id = 'task-id'
+        client = APIClient()
+        client.force_authenticate(self.shop_owner)
+
+        response = client.post(
+            '/api/v1/partners/export/', {'format': 'csv'}
+        )
+        self.assertEqual(response.status_code, 202)
+        mock_delay.assert_called_once_with(
+            self.shop.id, fmt='csv', compression='none'
+        )
+
+        partner_export.apply(args=(self.shop.id, 'csv')).get()
+        response = client.post(
+            '/api/v1/partners/export/', {'format': 'csv'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['url'].endswith('.csv'))
+        self.assertEqual(mock_delay.call_count, 1)
+
+    def test_csv_columns_from_catalog(self):
+        """Тестирует колонки параметров CSV из строк витрины без JOIN"""
+
+        with CaptureQueriesContext(connection) as queries:
+            first = next(CatalogExporter(self.shop).iter_csv())
+        header = next(csv.reader(StringIO(first)))
+        self.assertEqual(
+            header, CSV_COLUMNS + ['param:Память', 'param:Цвет']
+        )
+        self.assertFalse(any(
+            'backend_parameter' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_iter_bytes_counts_bytes(self):
+        """Тестирует, что блок закрывается по числу байт, а не символов"""
+
+        # Кириллица - два байта на символ
+        Product.objects.update(name='Ы' * 80)
+        refresh_catalog_entries()
+        fragments = [
+            fragment.encode('utf-8')
+            for fragment in CatalogExporter(self.shop).iter_format('json')
+        ]
+        expected, block = [], b''
+        for fragment in fragments:
+            block += fragment
+            if len(block) >= 400:
+                expected.append(block)
+                block = b''
+        expected.append(block)
+
+        blocks = list(CatalogExporter(self.shop).iter_bytes('json', 400))
+        self.assertGreater(len(blocks), 2)
+        self.assertEqual(blocks, expected)
+
+    def test_streaming_download(self):
+        """Тестирует потоковую выгрузку, gzip и If-None-Match"""
+
+        client = APIClient()
+        client.force_authenticate(self.shop_owner)
+        url = '/api/v1/partners/export/download/'
+        output = StringIO()
+        CatalogExporter(self.shop).write(output)
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(body.decode('utf-8'), output.getvalue())
+
+        response = client.get(url, {'compression': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(body.decode('utf-8'), output.getvalue())
+
+        etag = response['ETag']
+        response = client.get(
+            url, {'compression': 'gzip'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_versions(self.shop.id)
+        response = client.get(
+            url, {'compression': 'gzip'}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(CHANGES_SAFETY_LAG_SECONDS=0)
+class ProductChangesTests(TestCase):
+    """Тесты ленты изменений товаров"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='changes_test', email='changes@test.com', type='shop'
+        )
+        self.data = make_price_list(6)
+        self.import_price(self.data)
+        self.shop = Shop.objects.get(user=self.shop_owner)
+        self.url = '/api/v1/products/changes/'
+
+    def import_price(self, data):
+        payload = json.dumps(data).encode('utf-8')
+        partner_import.apply(args=(payload, self.shop_owner.id)).get()
+
+    def read_feed(self, cursor=None):
+        """Читает ленту до конца страницами по 4"""
+
+        results = []
+        with override_settings(CHANGES_PAGE_SIZE=4):
+            while True:
+                params = {'shop': self.shop.id}
+                if cursor:
+                    params['since'] = cursor
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 200)
+                results.extend(response.data['results'])
+                cursor = response.data['next_cursor']
+                if not response.data['has_more']:
+                    return results, cursor
+
+    def test_changes_since_cursor(self):
+        """Тестирует, что после курсора приходят только изменения"""
+
+        results, cursor = self.read_feed()
+        self.assertEqual(
+            sorted(r['external_id'] for r in results), list(range(6))
+        )
+        self.assertEqual(
+            results[0]['parameters'], {'Цвет': 'черный', 'Память': '0GB'}
+        )
+
+        results, cursor = self.read_feed(cursor)
+        self.assertEqual(results, [])
+
+        self.data['goods'][1]['price'] = 1
+        self.data['goods'][2]['parameters']['Цвет'] = 'белый'
+        del self.data['goods'][3]
+        self.import_price(self.data)
+
+        results, cursor = self.read_feed(cursor)
+        changes = {(r['op'], r['external_id']) for r in results}
+        self.assertEqual(
+            changes, {('upsert', 1), ('upsert', 2), ('delete', 3)}
+        )
+
+        product = Product.objects.get(product_infos__external_id=0)
+        product.name = 'Переименован'
+        product.save()
+        results, cursor = self.read_feed(cursor)
+        self.assertEqual(
+            sorted(r['external_id'] for r in results),
+            sorted(product.product_infos.values_list(
+                'external_id', flat=True
+            ))
+        )
+
+    def test_cascade_delete_tombstones(self):
+        """Тестирует надгробия при каскадном удалении продуктов и магазина"""
+
+        results, cursor = self.read_feed()
+        Product.objects.filter(
+            product_infos__external_id__in=[0, 1]
+        ).delete()
+        results, cursor = self.read_feed(cursor)
+        self.assertEqual(
+            sorted((r['op'], r['external_id']) for r in results),
+            [('delete', 0), ('delete', 1)]
+        )
+
+        Shop.objects.filter(id=self.shop.id).delete()
+        results, cursor = self.read_feed(cursor)
+        self.assertEqual(
+            sorted(r['external_id'] for r in results), [2, 3, 4, 5]
+        )
+        self.assertEqual({r['op'] for r in results}, {'delete'})
+
+    def test_tombstones_written_in_batches(self):
+        """Тестирует, что надгробия пишутся одной пачкой на удаление"""
+
+        table = ProductInfoTombstone._meta.db_table
+        for infos in (
+            ProductInfo.objects.filter(external_id__in=[0, 1]),
+            Product.objects.filter(product_infos__external_id=2),
+            Shop.objects.filter(id=self.shop.id),
+        ):
+            with self.subTest(model=infos.model.__name__):
+                with CaptureQueriesContext(connection) as queries:
+                    infos.delete()
+                inserts = [
+                    q for q in queries.captured_queries
+                    if q['sql'].startswith('INSERT INTO "%s"' % table)
+                ]
+                self.assertEqual(len(inserts), 1)
+        self.assertEqual(ProductInfoTombstone.objects.count(), 6)
+
+    @override_settings(CHANGES_SAFETY_LAG_SECONDS=60)
+    def test_recent_changes_held_back(self):
+        """Тестирует, что изменения моложе запаса времени не отдаются"""
+
+        results, cursor = self.read_feed()
+        self.assertEqual(results, [])
+        self.assertIsNone(cursor)
+
+        ProductInfo.objects.filter(external_id__in=[0, 1]).update(
+            updated_at=timezone.now() - timedelta(minutes=2)
+        )
+        results, cursor = self.read_feed()
+        self.assertEqual(
+            sorted(r['external_id'] for r in results), [0, 1]
+        )
+
+    def test_invalid_and_expired_cursor(self):
+        """Тестирует ответы на повреждённый и устаревший курсор"""
+
+        response = self.client.get(self.url, {'since': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+        old = timezone.now() - timedelta(days=365)
+        response = self.client.get(
+            self.url, {'since': encode_cursor((old, 'upsert', 1))}
+        )
+        self.assertEqual(response.status_code, 410)
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class ProductPaginationTests(TestCase):
+    """Тесты курсорной пагинации каталога"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shop_owner = User.objects.create_user(
+            username='page_test', email='page@test.com', type='shop'
+        )
+        shop = Shop.objects.create(user=shop_owner, name='PageShop')
+        category = Category.objects.create(name='Тест')
+        product = Product.objects.create(name='PageTest', category=category)
+        ProductInfo.objects.bulk_create([
+            ProductInfo(
+                product=product, shop=shop, external_id=i,
+                model=f'P-{i}', quantity=i % 3,
+                price=1000 + (i % 4) * 10, price_rrc=1500
+            )
+            for i in range(23)
+        ])
+        refresh_catalog_entries()
+
+    def read_all(self, params):
+        """Обходит все страницы по ссылкам next"""
+
+        ids = []
+        response = self.client.get('/api/v1/products/', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_keyset_orderings(self):
+        """Тестирует обход каталога при сортировках с повторами"""
+
+        infos = ProductInfo.objects.all()
+        for ordering, key in (
+            ('price', lambda i: (i.price, i.id)),
+            ('-price', lambda i: (-i.price, -i.id)),
+            ('quantity', lambda i: (i.quantity, i.id)),
+            ('id', lambda i: i.id),
+        ):
+            with self.subTest(ordering=ordering):
+                expected = [i.id for i in sorted(infos, key=key)]
+                ids = self.read_all({'ordering': ordering, 'limit': 5})
+                self.assertEqual(ids, expected)
+
+    def test_deep_page_without_count(self):
+        """Тестирует, что страницы не выполняют COUNT и OFFSET"""
+
+        response = self.client.get('/api/v1/products/', {'limit': 10})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertNotIn('count', response.data)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(response.data['next'])
+        sql = ' '.join(q['sql'] for q in queries).upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+        response = self.client.get(
+            '/api/v1/products/', {'count': 'exact', 'limit': 10}
+        )
+        self.assertEqual(response.data['count'], 23)
+        self.assertFalse(response.data['count_approximate'])
+
+        # Оценка PostgreSQL берётся из статистики таблицы
+        postgres = connection.vendor == 'postgresql'
+        if postgres:
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {CatalogEntry._meta.db_table}')
+        response = self.client.get(
+            '/api/v1/products/', {'count': 'approx', 'limit': 10}
+        )
+        self.assertIsInstance(response.data['count'], int)
+        self.assertEqual(response.data['count_approximate'], postgres)
+        self.assertAlmostEqual(response.data['count'], 23, delta=5)
+
+    def test_invalid_cursor(self):
+        """Тестирует отказ на чужой или повреждённый курсор"""
+
+        response = self.client.get(
+            '/api/v1/products/', {'ordering': 'price', 'limit': 5}
+        )
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+
+        for params in (
+            {'cursor': cursor, 'ordering': 'quantity'},
+            {'cursor': 'garbage'},
+        ):
+            response = self.client.get('/api/v1/products/', params)
+            self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class ProductSearchTests(TestCase):
+    """Тесты полнотекстового поиска по каталогу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shop_owner = User.objects.create_user(
+            username='search_test', email='search@test.com', type='shop'
+        )
+        shop = Shop.objects.create(user=shop_owner, name='SearchShop')
+        category = Category.objects.create(name='Смартфоны')
+        phones = Product.objects.create(
+            name='Смартфон Apple iPhone', category=category,
+            description='Смартфоны с защищённым корпусом'
+        )
+        cables = Product.objects.create(
+            name='Кабель Lightning', category=category,
+            description='Кабели для зарядки'
+        )
+        cls.phones = ProductInfo.objects.bulk_create([
+            ProductInfo(
+                product=phones, shop=shop, external_id=i, model=f'A{i}',
+                quantity=1, price=1000, price_rrc=1500
+            )
+            for i in range(7)
+        ])
+        ProductInfo.objects.create(
+            product=cables, shop=shop, external_id=100, model='L1',
+            quantity=1, price=100, price_rrc=150
+        )
+        refresh_catalog_entries()
+
+    def test_search_pages_by_rank(self):
+        """Тестирует выдачу по q постранично без повторов и пропусков"""
+
+        ids = []
+        response = self.client.get(
+            '/api/v1/products/', {'q': 'iPhone', 'limit': 3}
+        )
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(sorted(ids), sorted(i.id for i in self.phones))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    @skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL')
+    def test_stemming_and_ranking(self):
+        """Тестирует стемминг, поиск по описанию и порядок по релевантности"""
+
+        response = self.client.get('/api/v1/products/', {'q': 'смартфоны'})
+        self.assertEqual(
+            {item['id'] for item in response.data['results']},
+            {i.id for i in self.phones}
+        )
+
+        response = self.client.get('/api/v1/products/', {'q': 'зарядка'})
+        self.assertEqual(len(response.data['results']), 1)
+
+        response = self.client.get('/api/v1/products/', {'q': 'A3'})
+        self.assertEqual(
+            response.data['results'][0]['id'], self.phones[3].id
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/v1/products/', {'q': 'кабель'})
+        self.assertIn('@@', queries[0]['sql'])
+
+
+class ProductSuggestTests(TestCase):
+    """Тесты подсказок по названиям и моделям"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shop_owner = User.objects.create_user(
+            username='suggest_test', email='suggest@test.com', type='shop'
+        )
+        shop = Shop.objects.create(user=shop_owner, name='SuggestShop')
+        category = Category.objects.create(name='Смартфоны')
+        for i, name in enumerate((
+            'Смартфон Apple iPhone 12', 'Смартфон Samsung Galaxy S21',
+            'Телевизор Samsung QE55', 'Кабель Lightning'
+        )):
+            product = Product.objects.create(name=name, category=category)
+            ProductInfo.objects.create(
+                product=product, shop=shop, external_id=i,
+                model=f'MGJ{i}RU', quantity=1, price=100, price_rrc=150
+            )
+        Product.objects.create(name='Смартфон без предложений',
+                               category=category)
+
+    def setUp(self):
+        rebuild_suggest_index.apply()
+
+    def suggest(self, q, limit=None):
+        params = {'q': q}
+        if limit:
+            params['limit'] = limit
+        response = self.client.get('/api/v1/products/suggest/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['text'] for item in response.data['results']]
+
+    def test_prefix_and_word_prefix(self):
+        """Тестирует подсказки по началу названия и по началу слова"""
+
+        self.assertEqual(self.suggest('смартф'), [
+            'Смартфон Apple iPhone 12', 'Смартфон Samsung Galaxy S21'
+        ])
+        self.assertEqual(self.suggest('SAMS'), [
+            'Смартфон Samsung Galaxy S21', 'Телевизор Samsung QE55'
+        ])
+        self.assertEqual(self.suggest('mgj3'), ['MGJ3RU'])
+        self.assertEqual(self.suggest('смартф', limit=1), [
+            'Смартфон Apple iPhone 12'
+        ])
+
+    def test_misspelling(self):
+        """Тестирует подсказки для строки с опечаткой"""
+
+        self.assertEqual(self.suggest('iphne')[:1], [
+            'Смартфон Apple iPhone 12'
+        ])
+        self.assertEqual(self.suggest('телевизр')[:1], [
+            'Телевизор Samsung QE55'
+        ])
+        self.assertEqual(self.suggest('qwzx'), [])
+
+    def test_common_trigrams_skipped(self):
+        """Тестирует, что частые триграммы не объединяются"""
+
+        self.assertIn('Samsung', self.suggest('samsng')[0])
+        with patch('backend.services.SUGGEST_MAX_TRIGRAM_TERMS', 1):
+            # Все триграммы samsng есть минимум в двух терминах
+            self.assertEqual(self.suggest('samsng'), [])
+            self.assertEqual(self.suggest('телевизр')[:1], [
+                'Телевизор Samsung QE55'
+            ])
+
+    def test_rebuild_switches_generation(self):
+        """Тестирует перестроение без запросов к БД при подсказках"""
+
+        generation = redis_client.get(SuggestIndex.GENERATION_KEY)
+        Product.objects.filter(name='Кабель Lightning').update(
+            name='Кабель USB-C'
+        )
+        rebuild_suggest_index.apply()
+
+        self.assertNotEqual(
+            redis_client.get(SuggestIndex.GENERATION_KEY), generation
+        )
+        self.assertEqual(
+            list(redis_client.scan_iter(match=f'suggest:{generation}:*')), []
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('кабель'), ['Кабель USB-C'])
+
+    def test_update_shop_terms(self):
+        """Тестирует обновление терминов одного магазина без перестроения"""
+
+        shop = Shop.objects.get(name='SuggestShop')
+        owner = User.objects.create_user(
+            username='suggest_other', email='other@suggest.com', type='shop'
+        )
+        other = Shop.objects.create(user=owner, name='OtherShop')
+        cable = Product.objects.get(name='Кабель Lightning')
+        ProductInfo.objects.create(
+            product=cable, shop=other, external_id=1,
+            quantity=1, price=100, price_rrc=150
+        )
+        tablet = Product.objects.create(
+            name='Планшет Huawei', category=cable.category
+        )
+        ProductInfo.objects.create(
+            product=tablet, shop=shop, external_id=10,
+            quantity=1, price=100, price_rrc=150
+        )
+        ProductInfo.objects.filter(shop=shop, product=cable).delete()
+        generation = redis_client.get(SuggestIndex.GENERATION_KEY)
+
+        for changed in (other, shop):
+            update_suggest_index.apply(args=(changed.id,))
+        self.assertEqual(
+            redis_client.get(SuggestIndex.GENERATION_KEY), generation
+        )
+        self.assertEqual(self.suggest('план'), ['Планшет Huawei'])
+        # Кабель остался у другого магазина, модель MGJ3RU - нет
+        self.assertEqual(self.suggest('кабель'), ['Кабель Lightning'])
+        self.assertNotIn('MGJ3RU', self.suggest('mgj3'))
+
+        ProductInfo.objects.filter(shop=other).delete()
+        update_suggest_index.apply(args=(other.id,))
+        self.assertNotIn('Кабель Lightning', self.suggest('кабель'))
+
+        # Ключи, добавленные обновлением, удаляются вместе с поколением
+        rebuild_suggest_index.apply()
+        self.assertEqual(
+            list(redis_client.scan_iter(match=f'suggest:{generation}:*')), []
+        )
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class ProductFacetTests(TestCase):
+    """Тесты фасетных фильтров по параметрам товаров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shop_owner = User.objects.create_user(
+            username='facet_test', email='facet@test.com', type='shop'
+        )
+        shop = Shop.objects.create(user=shop_owner, name='FacetShop')
+        cls.category = Category.objects.create(name='Телевизоры')
+        other = Category.objects.create(name='Кабели')
+        tv = Product.objects.create(name='Телевизор', category=cls.category)
+        cable = Product.objects.create(name='Кабель', category=other)
+        cls.color = Parameter.objects.create(name='Цвет')
+        cls.size = Parameter.objects.create(name='Диагональ')
+
+        cls.infos = []
+        for i, (color, size) in enumerate((
+            ('черный', '55'), ('черный', '65'), ('белый', '55'),
+            ('серый', '43'),
+        )):
+            info = ProductInfo.objects.create(
+                product=tv, shop=shop, external_id=i, quantity=1,
+                price=1000, price_rrc=1500
+            )
+            ProductParameter.objects.bulk_create([
+                ProductParameter(
+                    product_info=info, parameter=cls.color, value=color
+                ),
+                ProductParameter(
+                    product_info=info, parameter=cls.size, value=size
+                ),
+            ])
+            cls.infos.append(info)
+
+        info = ProductInfo.objects.create(
+            product=cable, shop=shop, external_id=100, quantity=1,
+            price=100, price_rrc=150
+        )
+        ProductParameter.objects.create(
+            product_info=info, parameter=cls.color, value='черный'
+        )
+        refresh_catalog_entries()
+        refresh_category_facets([cls.category.id, other.id])
+
+    def ids(self, params):
+        response = self.client.get('/api/v1/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_param_filters(self):
+        """Тестирует param[...] с И между параметрами и ИЛИ внутри"""
+
+        infos = self.infos
+        self.assertEqual(
+            self.ids({'param[Цвет]': 'черный', 'param[Диагональ]': '55'}),
+            {infos[0].id}
+        )
+        self.assertEqual(
+            self.ids({
+                'param[Цвет]': ['черный', 'белый'],
+                'category': self.category.id,
+            }),
+            {infos[0].id, infos[1].id, infos[2].id}
+        )
+        self.assertEqual(self.ids({'param[Вес]': '1'}), set())
+
+    def test_facet_counts_from_summary(self):
+        """Тестирует счётчики фасетов без GROUP BY в запросе каталога"""
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/v1/products/', {'category': self.category.id}
+            )
+        self.assertEqual(response.data['facets'], {
+            'Диагональ': {'55': 2, '43': 1, '65': 1},
+            'Цвет': {'черный': 2, 'белый': 1, 'серый': 1},
+        })
+        sql = ' '.join(q['sql'] for q in queries).upper()
+        self.assertNotIn('GROUP BY', sql)
+
+        response = self.client.get('/api/v1/products/')
+        self.assertNotIn('facets', response.data)
+
+    def test_incremental_refresh(self):
+        """Тестирует, что пересчёт пишет только изменившиеся значения"""
+
+        ProductParameter.objects.filter(
+            product_info=self.infos[3], parameter=self.color
+        ).update(value='черный')
+        ProductParameter.objects.filter(
+            product_info=self.infos[1], parameter=self.size
+        ).delete()
+
+        stats = refresh_category_facets([self.category.id])
+        self.assertEqual(
+            stats, {'created': 0, 'updated': 1, 'deleted': 2}
+        )
+        self.assertEqual(
+            CategoryFacet.objects.get(
+                category=self.category, parameter=self.color,
+                value='черный'
+            ).count, 3
+        )
+        self.assertEqual(
+            refresh_category_facets([self.category.id]),
+            {'created': 0, 'updated': 0, 'deleted': 0}
+        )
+
+    def test_concurrent_refresh(self):
+        """Тестирует вставку значений, уже записанных другим пересчётом"""
+
+        CategoryFacet.objects.filter(category=self.category).update(count=9)
+        # Строки параллельного пересчёта не видны под select_for_update
+        with patch.object(
+            QuerySet, 'select_for_update', lambda queryset: queryset.none()
+        ):
+            refresh_category_facets([self.category.id])
+
+        self.assertEqual(facet_summary(self.category.id), {
+            'Диагональ': {'55': 2, '43': 1, '65': 1},
+            'Цвет': {'черный': 2, 'белый': 1, 'серый': 1},
+        })
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class ProductFilterTests(TestCase):
+    """Тесты фильтров каталога и индексов под них"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Тест')
+        other = Category.objects.create(name='Другая')
+        cls.shops = []
+        for name, state in (('Active', 'active'), ('Closed', 'inactive')):
+            owner = User.objects.create_user(
+                username=f'filter_{name}', email=f'{name}@filter.com',
+                type='shop'
+            )
+            cls.shops.append(
+                Shop.objects.create(user=owner, name=name, state=state)
+            )
+        products = [
+            Product.objects.create(name='A', category=category),
+            Product.objects.create(name='B', category=other),
+        ]
+        ProductInfo.objects.bulk_create([
+            ProductInfo(
+                product=products[i % 2], shop=cls.shops[i % 3 == 0],
+                external_id=i, quantity=i % 4, price=100 * i, price_rrc=0
+            )
+            for i in range(1, 41)
+        ])
+        refresh_catalog_entries()
+        cls.category = category
+
+    def ids(self, params):
+        response = self.client.get(
+            '/api/v1/products/', dict(params, limit=200)
+        )
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_filters(self):
+        """Тестирует диапазон цены, наличие, категорию и активность"""
+
+        infos = ProductInfo.objects.all()
+        for params, check in (
+            ({'min_price': 500, 'max_price': 900},
+             lambda i: 500 <= i.price <= 900),
+            ({'in_stock': 'true'}, lambda i: i.quantity > 0),
+            ({'category': self.category.id},
+             lambda i: i.product.category_id == self.category.id),
+            ({'active_shop': 'true'}, lambda i: i.shop.state == 'active'),
+            ({'shop': self.shops[0].id, 'in_stock': 'true',
+              'max_price': 2000},
+             lambda i: i.shop_id == self.shops[0].id and i.quantity > 0
+             and i.price <= 2000),
+            ({'price': 300}, lambda i: i.price == 300),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(
+                    self.ids(params), {i.id for i in infos if check(i)}
+                )
+
+    def plan(self, params, ordering):
+        """План запроса страницы каталога для фильтров params"""
+
+        queryset = CatalogEntryFilter(
+            params, queryset=CatalogEntry.objects.all()
+        ).qs.order_by(*ordering)[:51]
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        # На нескольких строках seq scan и сортировка всегда дешевле
+        # прохода по индексу в нужном порядке
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {CatalogEntry._meta.db_table}')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            return queryset.explain()
+
+    def test_browse_queries_use_indexes(self):
+        """Тестирует, что частые сочетания фильтров идут по индексам"""
+
+        shop = self.shops[0].id
+        for params, ordering, index in (
+            ({'shop': shop, 'in_stock': 'true'}, ('price', 'pk'),
+             'catalog_entry_stock_shop_price'),
+            ({'in_stock': 'true'}, ('price', 'pk'),
+             'catalog_entry_stock_price'),
+            ({'shop': shop}, ('price', 'pk'), 'catalog_entry_shop_price'),
+            ({'shop': shop, 'in_stock': 'true', 'min_price': 500},
+             ('-price', '-pk'), 'catalog_entry_stock_shop_price'),
+        ):
+            with self.subTest(params=params, ordering=ordering):
+                self.assertIn(index, self.plan(params, ordering))
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=60)
+class CatalogResponseCacheTests(TestCase):
+    """Тесты кэша готовых ответов каталога"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Тест')
+        product = Product.objects.create(name='Cached', category=category)
+        cls.infos = []
+        for name in ('CacheA', 'CacheB'):
+            owner = User.objects.create_user(
+                username=name, email=f'{name}@cache.com', type='shop'
+            )
+            shop = Shop.objects.create(user=owner, name=name)
+            cls.infos.append(ProductInfo.objects.create(
+                product=product, shop=shop, external_id=1,
+                quantity=10, price=100, price_rrc=150
+            ))
+
+    def setUp(self):
+        # Записи прошлых тестов в общем Redis становятся недействительны
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_versions()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_skips_orm(self):
+        """Тестирует, что попадание отдаёт те же байты без запросов"""
+
+        miss = self.get('/api/v1/products/', {'limit': 5})
+        self.assertEqual(miss['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            hit = self.get('/api/v1/products/', {'limit': '5'})
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit['Content-Type'], miss['Content-Type'])
+
+    def test_html_not_shared(self):
+        """Тестирует, что HTML BrowsableAPI не попадает в общий кэш"""
+
+        for info in self.infos:
+            self.client.force_login(info.shop.user)
+            response = self.client.get(
+                '/api/v1/products/', HTTP_ACCEPT='text/html'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Cache', response)
+            self.assertContains(response, info.shop.user.username)
+
+    def test_stock_change_invalidates_shop(self):
+        """Тестирует инвалидацию по версии магазина"""
+
+        info, other = self.infos
+        params = {'shop': info.shop_id}
+        detail = f'/api/v1/products/{info.id}/'
+        for url, query in (('/api/v1/products/', params), (detail, None)):
+            self.get(url, query)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.quantity = 3
+            other.save(update_fields=['quantity', 'updated_at'])
+        self.assertEqual(
+            self.get('/api/v1/products/', params)['X-Cache'], 'HIT'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            info.quantity = 5
+            info.save(update_fields=['quantity', 'updated_at'])
+        response = self.get('/api/v1/products/', params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['quantity'], 5)
+        self.assertEqual(self.get(detail).data['quantity'], 5)
+
+    def test_waiting_request_uses_filled_entry(self):
+        """Тестирует, что при занятой блокировке запрос ждёт заполнения"""
+
+        entry = {
+            'versions': read_versions([GLOBAL_VERSION]),
+            'content': b'{"results":[]}',
+            'content_type': 'application/json',
+        }
+        with patch('backend.caching.cache.add', return_value=False), \
+                patch('backend.caching.cached_entry',
+                      side_effect=[None, None, entry]), \
+                self.assertNumQueries(0):
+            response = self.get('/api/v1/products/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json(), {'results': []})
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class ConditionalGetTests(TestCase):
+    """Тесты ETag и 304 для каталога и заказов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Тест')
+        product = Product.objects.create(name='Etag', category=category)
+        owner = User.objects.create_user(
+            username='etag_shop', email='etag@shop.com', type='shop'
+        )
+        shop = Shop.objects.create(user=owner, name='EtagShop')
+        cls.info = ProductInfo.objects.create(
+            product=product, shop=shop, external_id=1,
+            quantity=10, price=100, price_rrc=150
+        )
+        cls.buyer = User.objects.create_user(
+            username='etag_buyer', email='etag@buyer.com'
+        )
+        cls.order = Order.objects.create(user=cls.buyer, state='new')
+        OrderItem.objects.create(
+            order=cls.order, product_info=cls.info, quantity=1
+        )
+
+    def setUp(self):
+        # Набор магазинов заказов кэшируется по id пользователя и версии,
+        # а id в тестовой БД повторяются между классами
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_order_version(self.buyer.id)
+
+    def revalidate(self, url, max_queries, api=None):
+        """Повторный запрос с ETag первого ответа"""
+
+        api = api or self.client
+        response = api.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertLessEqual(len(queries), max_queries)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_catalog_not_modified(self):
+        """Тестирует 304 без основного запроса и сериализации"""
+
+        list_etag = self.revalidate('/api/v1/products/?limit=5', 0)
+        detail_url = f'/api/v1/products/{self.info.id}/'
+        detail_etag = self.revalidate(detail_url, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.info.quantity = 9
+            self.info.save(update_fields=['quantity', 'updated_at'])
+        for url, etag in (
+            ('/api/v1/products/?limit=5', list_etag),
+            (detail_url, detail_etag),
+        ):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_orders_not_modified(self):
+        """Тестирует 304 для заказов и смену ETag при изменении заказа"""
+
+        api = APIClient()
+        api.force_authenticate(self.buyer)
+        etag = self.revalidate('/api/v1/orders/', 0, api)
+
+        other = APIClient()
+        other.force_authenticate(self.info.shop.user)
+        self.assertNotEqual(other.get('/api/v1/orders/')['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.state = 'confirmed'
+            self.order.save()
+        response = api.get('/api/v1/orders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_orders_etag_ignores_other_shops(self):
+        """Тестирует, что ETag заказов зависит только от их магазинов"""
+
+        api = APIClient()
+        api.force_authenticate(self.buyer)
+        etag = self.revalidate('/api/v1/orders/', 0, api)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Shop.objects.create(user=self.buyer, name='Другой магазин')
+        self.assertEqual(
+            api.get('/api/v1/orders/', HTTP_IF_NONE_MATCH=etag).status_code,
+            304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_versions(self.info.shop_id)
+        self.assertEqual(
+            api.get('/api/v1/orders/', HTTP_IF_NONE_MATCH=etag).status_code,
+            200
+        )
+
+    @patch('backend.admin.send_email')
+    def test_orders_etag_after_bulk_changes(self, mock_send_email):
+        """Тестирует смену ETag после действий админки и удаления позиции"""
+
+        api = APIClient()
+        api.force_authenticate(self.buyer)
+        admin = OrderAdmin(Order, site)
+        queryset = Order.objects.filter(id=self.order.id)
+
+        for change in (
+            lambda: admin.confirm_orders(None, queryset),
+            lambda: admin.send_orders(None, queryset),
+            lambda: self.order.ordered_items.all().delete(),
+        ):
+            etag = api.get('/api/v1/orders/')['ETag']
+            with patch.object(OrderAdmin, 'message_user'), \
+                    self.captureOnCommitCallbacks(execute=True):
+                change()
+            response = api.get('/api/v1/orders/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        mock_send_email.delay.assert_called_once_with([self.order.id])
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=60)
+class ProductDocumentTests(TestCase):
+    """Тесты документа карточки товара"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Тест')
+        owner = User.objects.create_user(
+            username='doc_shop', email='doc@shop.com', type='shop'
+        )
+        cls.shop = Shop.objects.create(user=owner, name='DocShop')
+        cls.infos = []
+        for external_id, params in ((1, 1), (2, 6)):
+            product = Product.objects.create(
+                name=f'Doc{external_id}', category=category
+            )
+            info = ProductInfo.objects.create(
+                product=product, shop=cls.shop, external_id=external_id,
+                quantity=10, price=100, price_rrc=150
+            )
+            for index in range(params):
+                parameter = Parameter.objects.create(
+                    name=f'Doc{external_id}-{index}'
+                )
+                ProductParameter.objects.create(
+                    product_info=info, parameter=parameter, value=str(index)
+                )
+            cls.infos.append(info)
+
+    def setUp(self):
+        # Строки setUpTestData общие для тестов класса, как и их документы
+        cache.delete_many([document_key(info.id) for info in self.infos])
+        # Ответы с теми же id могли остаться от других тестов
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_versions()
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(
+            setattr, celery_app.conf, 'task_always_eager', False
+        )
+
+    def get(self, info):
+        response = self.client.get(f'/api/v1/products/{info.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_fixed_queries(self):
+        """Тестирует, что число запросов не зависит от числа параметров"""
+
+        counts = []
+        for info in self.infos:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(info)
+            counts.append(len(queries))
+            self.assertEqual(
+                len(response.data['parameters']),
+                info.product_parameters.count()
+            )
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], 3)
+
+    def test_document_hit(self):
+        """Тестирует отдачу документа из кэша без построения"""
+
+        info = self.infos[1]
+        miss = self.get(info)
+        with patch('backend.documents.build_document') as build:
+            with CaptureQueriesContext(connection) as queries:
+                hit = self.get(info)
+        build.assert_not_called()
+        self.assertLessEqual(len(queries), 1)
+        self.assertEqual(hit.json(), miss.json())
+
+    def test_invalidation(self):
+        """Тестирует инвалидацию по строке, параметрам и магазину"""
+
+        info, other = self.infos
+        self.get(info)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.quantity = 3
+            other.save(update_fields=['quantity', 'updated_at'])
+        with patch('backend.documents.build_document') as build:
+            self.get(info)
+        build.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            parameter = info.product_parameters.get()
+            parameter.value = 'новое'
+            parameter.save()
+        self.assertEqual(
+            self.get(info).data['parameters'][0]['value'], 'новое'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.name = 'Переименован'
+            self.shop.save()
+        self.assertEqual(self.get(info).data['shop']['name'], 'Переименован')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            info.delete()
+        response = self.client.get(f'/api/v1/products/{info.id}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogEntryTests(TestCase):
+    """Тесты синхронизации витрины каталога"""
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='entry_test', email='entry@test.com', type='shop'
+        )
+        self.payload = make_price_list(10)
+        self.run_import()
+        self.shop = Shop.objects.get(user=self.shop_owner)
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(
+            setattr, celery_app.conf, 'task_always_eager', False
+        )
+
+    def run_import(self):
+        payload = json.dumps(self.payload).encode('utf-8')
+        partner_import.apply(args=(payload, self.shop_owner.id)).get()
+
+    def assertCatalogInSync(self):
+        infos = ProductInfo.objects.select_related(
+            'product__category', 'shop'
+        ).prefetch_related(Prefetch(
+            'product_parameters',
+            queryset=ProductParameter.objects.select_related(
+                'parameter'
+            ).order_by(*PARAMETER_ORDERING)
+        ))
+        entries = {
+            entry.pk: CatalogEntrySerializer(entry).data
+            for entry in CatalogEntry.objects.all()
+        }
+        self.assertEqual(entries, {
+            info.id: ProductInfoSerializer(info).data for info in infos
+        })
+
+    def test_import_sync(self):
+        """Тестирует, что импорт пересобирает строки витрины"""
+
+        self.assertEqual(CatalogEntry.objects.count(), 10)
+        self.assertCatalogInSync()
+
+        goods = self.payload['goods']
+        goods[0]['price'] = 1
+        goods[1]['parameters']['Цвет'] = 'белый'
+        del goods[2]
+        self.run_import()
+        self.assertEqual(CatalogEntry.objects.count(), 9)
+        self.assertCatalogInSync()
+
+    def test_single_changes(self):
+        """Тестирует списание остатка, правку продукта и магазина"""
+
+        info = ProductInfo.objects.filter(quantity__gt=0).first()
+        info.quantity -= 1
+        info.save(update_fields=['quantity', 'updated_at'])
+        self.assertEqual(
+            CatalogEntry.objects.get(pk=info.pk).quantity, info.quantity
+        )
+
+        product = info.product
+        product.name = 'Переименован'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertCatalogInSync()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.name = 'Новое имя'
+            self.shop.save()
+        self.assertCatalogInSync()
+
+        api = APIClient()
+        api.force_authenticate(self.shop_owner)
+        api.post('/api/v1/partners/state/', {'state': 'inactive'})
+        self.assertEqual(
+            set(CatalogEntry.objects.values_list('shop_state', flat=True)),
+            {'inactive'}
+        )
+
+        info.delete()
+        self.assertFalse(CatalogEntry.objects.filter(pk=info.pk).exists())
+
+    def test_parameter_changes(self):
+        """Тестирует удаление значения, переименование и удаление параметра"""
+
+        info = ProductInfo.objects.first()
+        info.product_parameters.get(parameter__name='Цвет').delete()
+        self.assertCatalogInSync()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            parameter = Parameter.objects.get(name='Память')
+            parameter.name = 'Объём памяти'
+            parameter.save()
+            category = info.product.category
+            category.name = 'Переименована'
+            category.save()
+        self.assertCatalogInSync()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            parameter.delete()
+        self.assertCatalogInSync()
+        self.assertEqual(CatalogEntry.objects.get(pk=info.pk).parameters, [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportBenchmarkTests(TestCase):
+    """Тесты генератора синтетических прайсов и бенчмарка импорта"""
+
+    def test_generated_price_list_is_readable(self):
+        """Тестирует, что синтетический прайс читается в обоих форматах"""
+
+        for fmt in ('yaml', 'json'):
+            with self.subTest(fmt=fmt):
+                f = BytesIO()
+                write_price_list(f, 25, fmt)
+                f.seek(0)
+                reader = PriceListReader(f)
+                goods = list(reader.goods())
+
+                self.assertEqual(reader.format, fmt)
+                self.assertEqual(len(reader.categories), 5)
+                self.assertEqual(len(goods), 25)
+                self.assertEqual(goods[0], next(generate_goods(1)))
+
+    def test_benchmark_command_report(self):
+        """Тестирует JSON-отчёт команды benchmark_import"""
+
+        out = StringIO()
+        call_command(
+            'benchmark_import', '--sizes', '20', stdout=out, stderr=StringIO()
+        )
+        report = json.loads(out.getvalue())
+
+        initial, update = report['results']
+        self.assertEqual(initial['goods'], 20)
+        self.assertIn('Импортировано 20', initial['report'])
+        self.assertIn('обновлено 2', update['report'])
+        for key in ('wall_seconds', 'queries', 'peak_rss_kb'):
+            self.assertGreater(initial[key], 0)
+        self.assertFalse(
+            User.objects.filter(email__endswith='@benchmark.local').exists()
+        )
+
+    @skipUnless(
+        os.path.exists('/proc/self/clear_refs'), 'Нужен Linux /proc'
+    )
+    def test_peak_rss_per_run(self):
+        """Тестирует, что пиковый RSS не включает прошлые прогоны"""
+
+        buffer = bytearray(256 * 1024 * 1024)
+        lifetime_peak = read_memory_kb('VmHWM')
+        del buffer
+
+        with measure_memory() as memory:
+            pass
+        self.assertLess(
+            memory['peak_rss_kb'], lifetime_peak - 128 * 1024
+        )
+        self.assertIsNotNone(memory['rss_delta_kb'])
+
+
+@override_settings(CATALOG_CACHE_TIMEOUT=0)
+class SerializationBenchmarkTests(TestCase):
+    """Тесты быстрого режима сериализации каталога и его бенчмарка"""
+
+    def test_flat_matches_model_mode(self):
+        """Тестирует, что страница списка совпадает с режимом моделей"""
+
+        owner = User.objects.create_user(
+            username='flat_test', email='flat@test.com', type='shop'
+        )
+        payload = json.dumps(make_price_list(12)).encode('utf-8')
+        partner_import.apply(args=(payload, owner.id)).get()
+
+        response = self.client.get('/api/v1/products/', {'limit': 200})
+        self.assertEqual(response.status_code, 200)
+        expected = CatalogEntrySerializer(
+            CatalogEntry.objects.order_by('pk'), many=True
+        ).data
+        self.assertEqual(response.json()['results'], json.loads(
+            JSONRenderer().render(expected)
+        ))
+        # Порядок ключей jsonb не должен попадать в ответ
+        self.assertEqual(
+            list(response.json()['results'][0]['parameters'][0]),
+            ['parameter', 'value']
+        )
+
+    def test_benchmark_command_report(self):
+        """Тестирует JSON-отчёт команды benchmark_serialization"""
+
+        out = StringIO()
+        call_command(
+            'benchmark_serialization', '--goods', '20', '--page-size', '10',
+            '--repeat', '2', stdout=out, stderr=StringIO()
+        )
+        result = json.loads(out.getvalue())['result']
+
+        self.assertEqual(result['page_size'], 10)
+        self.assertTrue(result['identical'])
+        self.assertEqual(
+            set(result['ms_per_page']), {'nested', 'model', 'flat'}
+        )
+        self.assertFalse(
+            User.objects.filter(email__endswith='@benchmark.local').exists()
+        )
+
+
+class PriceListHandler(BaseHTTPRequestHandler):
+    """Локальный HTTP-поставщик прайса с поддержкой ETag"""
+
+    body = b''
+    etag = '"v1"'
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PriceFetchTests(TestCase):
+    """Тесты условной загрузки прайса по URL"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open('static/price_test.json', 'rb') as f:
+            PriceListHandler.body = f.read()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PriceListHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/price.json'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            username='fetch_test', email='fetch@test.com', type='shop'
+        )
+        self.addCleanup(
+            redis_client.delete, f'price_source:{self.shop_owner.id}'
+        )
+        PriceListHandler.requests_seen = []
+
+    def test_not_modified_skips_import(self):
+        """Тестирует, что 304 от источника не запускает импорт"""
+
+        result = partner_import.apply(
+            args=(self.url, self.shop_owner.id)
+        ).get()
+        self.assertIn('Импортировано 1', result)
+
+        result = partner_import.apply(
+            args=(self.url, self.shop_owner.id)
+        ).get()
+
+        self.assertIn('304', result)
+        self.assertEqual(
+            PriceListHandler.requests_seen[-1].get('If-None-Match'), '"v1"'
+        )
+
+    @override_settings(IMPORT_MAX_DOWNLOAD_BYTES=10)
+    def test_size_cap(self):
+        """Тестирует отказ при превышении лимита размера"""
+
+        result = partner_import.apply(
+            args=(self.url, self.shop_owner.id)
+        ).get()
+
+        self.assertIn('Ошибка чтения', result)
+        self.assertFalse(Shop.objects.filter(user=self.shop_owner).exists())
+
+
+class PriceListReaderTests(TestCase):
+    """Тесты потокового чтения прайс-листа"""
+
+    def read(self, content, **kwargs):
+        reader = PriceListReader(BytesIO(content.encode('utf-8')), **kwargs)
+        return reader, list(reader.goods())
+
+    def test_json_streaming_small_chunks(self):
+        """Тестирует разбор JSON через буфер меньше одного товара"""
+
+        data = make_price_list(25)
+        reader, goods = self.read(
+            json.dumps(data, ensure_ascii=False, indent=2), chunk_size=7
+        )
+
+        self.assertEqual(reader.format, 'json')
+        self.assertEqual(reader.shop, 'ImportShop')
+        self.assertEqual(reader.categories, data['categories'])
+        self.assertEqual(goods, data['goods'])
+
+    def test_goods_before_header(self):
+        """Тестирует файл, где goods идут раньше shop и categories"""
+
+        data = make_price_list(5)
+        content = json.dumps({
+            'goods': data['goods'],
+            'categories': data['categories'],
+            'shop': data['shop'],
+        })
+        reader, goods = self.read(content, chunk_size=16)
+
+        self.assertEqual(reader.shop, 'ImportShop')
+        self.assertEqual(goods, data['goods'])
+
+    def test_yaml_streaming(self):
+        """Тестирует потоковый разбор демо-прайса в YAML"""
+
+        with open('static/shop.yaml', 'rb') as f:
+            reader = PriceListReader(f)
+            goods = list(reader.goods())
+
+        self.assertEqual(reader.format, 'yaml')
+        self.assertEqual(reader.shop, 'YAML Тестовый Магазин')
+        self.assertEqual(reader.categories[0]['id'], 999)
+        self.assertEqual(goods[0]['parameters']['memory'], '1TB')
+
+    def test_unicode_line_separators(self):
+        """Тестирует U+2028, U+2029 и U+0085 внутри значений NDJSON и CSV"""
+
+        data = make_price_list(3)
+        data['goods'][0]['name'] = 'Товар\u2028первый'
+        data['goods'][1]['model'] = 'M\u2029\x85-1'
+        data['goods'][2]['parameters']['Цвет'] = 'черный\nбелый'
+
+        ndjson = '\ufeff' + ''.join(
+            json.dumps(line, ensure_ascii=False) + '\n'
+            for line in [{'shop': data['shop'],
+                          'categories': data['categories']}] + data['goods']
+        )
+        reader, goods = self.read(ndjson)
+        self.assertEqual(reader.format, 'ndjson')
+        self.assertEqual(goods, data['goods'])
+
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator='\r\n')
+        writer.writerow(CSV_COLUMNS + ['param:Цвет', 'param:Память'])
+        for good in data['goods']:
+            writer.writerow([
+                data['shop'], good['id'], good['name'], good['category'],
+                'Смартфоны', good['model'], good['price'],
+                good['price_rrc'], good['quantity'],
+                good['parameters']['Цвет'], good['parameters']['Память'],
+            ])
+        reader, goods = self.read('\ufeff' + buffer.getvalue())
+        self.assertEqual(reader.format, 'csv')
+        self.assertEqual(goods, data['goods'])
+
+    def test_missing_shop(self):
+        """Тестирует ошибку при отсутствии поля shop"""
+
+        with self.assertRaises(ValueError):
+            self.read('{"goods": []}')
+
+
 class OrderTests(TestCase):
     """Тесты создания заказа и прав доступа"""
 
@@ -23,6 +23,16 @@ urlpatterns = [
         views.PartnerUpdate.as_view(),
         name='partner_update'
     ),
+    path(
+        'partners/imports/',
+        views.PartnerImportList.as_view(),
+        name='partner_imports'
+    ),
+    path(
+        'partners/imports/<str:task_id>/',
+        views.PartnerImportStatus.as_view(),
+        name='partner_import_status'
+    ),
     path(
         'partners/orders/',
         views.PartnerOrders.as_view(),
@@ -34,6 +44,16 @@ urlpatterns = [
         name='partner_state'
     ),
     path('products/', views.ProductListView.as_view()),
+    path(
+        'products/changes/',
+        views.ProductChangesView.as_view(),
+        name='product_changes'
+    ),
+    path(
+        'products/suggest/',
+        views.ProductSuggestView.as_view(),
+        name='product_suggest'
+    ),
     path('products/<int:pk>/', views.ProductDetailView.as_view()),
     path(
         'orders/create/',
@@ -53,5 +73,14 @@ urlpatterns = [
     ),
     path('admin/stats/', views.admin_stats, name='admin-stats'),
     path('admin/low-stock/', views.low_stock_list, name='admin-low-stock'),
-    path('api/v1/partners/export/', views.PartnerExport.as_view())
+    path(
+        'partners/export/',
+        views.PartnerExport.as_view(),
+        name='partner_export'
+    ),
+    path(
+        'partners/export/download/',
+        views.PartnerExportDownload.as_view(),
+        name='partner_export_download'
+    ),
 ]
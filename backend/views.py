@@ -1,6 +1,16 @@
+import os
+import uuid
+
 from django.db import transaction
 from django.db.models import Prefetch
+from django.http import (
+    Http404,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags
 
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import (
@@ -18,22 +28,76 @@ from rest_framework.generics import (
 )
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.throttling import AnonRateThrottle
+from rest_framework.throttling import AnonRateThrottle, ScopedRateThrottle
 from rest_framework.views import APIView
 
-from backend.models import Contact, Order, OrderItem, ProductInfo, Shop
+from backend.caching import (
+    bump_catalog_versions,
+    cache_catalog_response,
+    conditional_get,
+    etag_matches,
+    list_dependencies,
+    list_etag,
+    make_etag,
+    not_modified,
+    order_etag,
+)
+from backend.changes import CursorExpired, changes_since
+from backend.compression import iter_compressed
+from backend.documents import document_version, product_document
+from backend.exporter import (
+    CatalogExporter,
+    export_etag,
+    export_path,
+    export_url,
+    export_version,
+    find_cached_export,
+)
+from backend.facets import ParameterFacetFilter, facet_summary
+from backend.filters import CatalogEntryFilter
+from backend.models import (
+    CatalogEntry,
+    Contact,
+    Order,
+    OrderItem,
+    ProductInfo,
+    Shop,
+)
+from backend.pagination import KeysetPagination
+from backend.search import FullTextSearchFilter
 from backend.serializers import (
+    CATALOG_ENTRY_VALUES,
     BasketSerializer,
+    CatalogEntrySerializer,
     ContactSerializer,
     OrderSerializer,
+    PartnerExportSerializer,
     PartnerUpdateSerializer,
-    ProductInfoSerializer,
 )
-from backend.services import BasketService, redis_client
+from backend.services import (
+    BasketService,
+    ImportProgress,
+    ImportQueue,
+    SuggestIndex,
+    redis_client,
+)
+from backend.storage import spool_price_file
 from backend.tasks import partner_export, partner_import, send_email
 from users.models import User
 
 LOW_STOCK_THRESHOLD = 10
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+EXPORT_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'yaml': 'application/yaml',
+}
+COMPRESSION_CONTENT_TYPES = {
+    'gzip': 'application/gzip',
+    'zstd': 'application/zstd',
+}
 
 
 class HealthCheckSerializer(serializers.Serializer):
@@ -89,7 +153,8 @@ class PartnerUpdate(APIView):
     """
     Обновление прайса от поставщика (JSON/YAML).
     Принимает URL прайса или загруженный файл.
-    Запускает асинхронную задачу импорта через Celery.
+    Файл сохраняется в хранилище, в Celery передаётся только ссылка.
+    Новая загрузка отменяет ещё не начатые импорты магазина.
     """
 
     serializer_class = PartnerUpdateSerializer
@@ -109,20 +174,73 @@ class PartnerUpdate(APIView):
         price_file = serializer.validated_data.get('price_file')
 
         if price_file:
-            file_content = b''
-            for chunk in price_file.chunks():
-                file_content += chunk
-
-            task = partner_import.delay(file_content, request.user.id)
-
+            source = spool_price_file(price_file)
         else:
-            task = partner_import.delay(url, request.user.id)
+            source = url
+
+        task_id = str(uuid.uuid4())
+        ImportQueue.enqueue(request.user.id, task_id)
+        task = partner_import.apply_async(
+            (source, request.user.id),
+            {
+                'mode': serializer.validated_data['mode'],
+                'parallel': serializer.validated_data['parallel'],
+                'force': serializer.validated_data['force'],
+            },
+            task_id=task_id
+        )
 
-        return Response({
+        response = {
             'status': True,
             'task_id': task.id,
+            'status_url': f'/api/v1/partners/imports/{task.id}/',
             'message': 'Импорт запущен в фоне!'
-        }, status=202)
+        }
+        if price_file:
+            response['sha256'] = source['sha256']
+        return Response(response, status=202)
+
+
+@extend_schema_view(
+    get=extend_schema(tags=['Поставщики'], responses={200: OpenApiTypes.ANY})
+)
+class PartnerImportStatus(APIView):
+    """
+    Ход импорта прайса: фаза (queued, download, parse, write, reconcile),
+    обработано строк, строк в секунду, время и ошибки.
+    Магазин видит только свои импорты, администратор - все.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        progress = ImportProgress.get(task_id)
+        if not progress or not (
+            request.user.is_staff or progress['user_id'] == request.user.id
+        ):
+            return Response({'error': 'Импорт не найден'}, status=404)
+        return Response(progress)
+
+
+@extend_schema_view(
+    get=extend_schema(tags=['Поставщики'], responses={200: OpenApiTypes.ANY})
+)
+class PartnerImportList(APIView):
+    """
+    Выполняющиеся импорты, от самых старых.
+    idle_seconds показывает, как давно импорт не обновлялся.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        imports = ImportProgress.active()
+        if not request.user.is_staff:
+            imports = [
+                progress for progress in imports
+                if progress['user_id'] == request.user.id
+            ]
+        return Response(imports)
 
 
 @extend_schema_view(
@@ -145,25 +263,46 @@ class PartnerUpdate(APIView):
 class ProductListView(ListAPIView):
     """
     Список товаров с фильтрацией, поиском и сортировкой.
-    Поддерживает фильтрацию по цене, количеству, магазину.
-    Поиск по названию продукта и модели.
+    Читается только витрина CatalogEntry, без соединений; страница
+    выбирается через values() и сериализуется быстрым режимом
+    CatalogEntrySerializer.
+    Фильтры CatalogEntryFilter: цена (точно, min_price, max_price),
+    количество, магазин, категория, in_stock, active_shop.
+    Поиск по названию продукта и модели (search), полнотекстовый
+    поиск по названию, модели, описанию и параметрам (q).
+    Фасеты: param[<имя>]=<значение>, при фильтре category в ответ
+    добавляется facets - число товаров категории по значениям.
+    Пагинация курсорная (KeysetPagination): ordering=price, -price,
+    quantity, -quantity, id, -id, rank; размер страницы - limit.
+    Готовые ответы кэшируются до изменения каталога (caching),
+    ETag из версий каталога позволяет получать 304 по If-None-Match.
     """
 
     throttle_classes = [AnonRateThrottle]
-    queryset = ProductInfo.objects.select_related(
-        'product__category', 'shop'
-    ).prefetch_related(
-        Prefetch('product_parameters__parameter')
-    )
-    serializer_class = ProductInfoSerializer
+    queryset = CatalogEntry.objects.all()
+    serializer_class = CatalogEntrySerializer
+    page_values = CATALOG_ENTRY_VALUES
+    pagination_class = KeysetPagination
     filter_backends = [
         DjangoFilterBackend,
         filters.SearchFilter,
-        filters.OrderingFilter
+        FullTextSearchFilter,
+        ParameterFacetFilter,
     ]
-    filterset_fields = ['price', 'quantity', 'shop']
-    search_fields = ['product__name', 'model']
-    ordering_fields = ['price', 'quantity']
+    filterset_class = CatalogEntryFilter
+    search_fields = ['product_name', 'model']
+
+    @conditional_get(list_etag)
+    @cache_catalog_response(list_dependencies)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        category = self.request.query_params.get('category', '')
+        if category.isdigit():
+            response.data['facets'] = facet_summary(int(category))
+        return response
 
 
 @extend_schema_view(
@@ -259,18 +398,103 @@ class BasketClearView(APIView):
 @extend_schema_view(
     get=extend_schema(
         tags=['Товары'],
-        responses={200: ProductInfoSerializer}
+        parameters=[
+            OpenApiParameter('since', str, description='Курсор'),
+            OpenApiParameter('shop', int, description='ID магазина'),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 410: OpenApiTypes.OBJECT}
+    )
+)
+class ProductChangesView(APIView):
+    """
+    Лента изменений товаров после курсора since: созданные
+    и изменённые (op=upsert) и удалённые (op=delete) товары.
+    В следующий запрос передаётся next_cursor, пока has_more.
+    Для устаревшего курсора - 410, нужна полная выгрузка.
+    """
+
+    throttle_classes = [AnonRateThrottle]
+
+    def get(self, request):
+        shop_id = request.query_params.get('shop')
+        if shop_id is not None and not shop_id.isdigit():
+            return Response({'error': 'shop должен быть числом'}, status=400)
+
+        try:
+            changes = changes_since(
+                request.query_params.get('since'),
+                int(shop_id) if shop_id else None
+            )
+        except CursorExpired as e:
+            return Response({'error': str(e)}, status=410)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(changes)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        tags=['Товары'],
+        parameters=[
+            OpenApiParameter('q', str, description='Начало ввода'),
+            OpenApiParameter('limit', int, description='Число подсказок'),
+        ],
+        responses={200: OpenApiTypes.OBJECT}
+    )
+)
+class ProductSuggestView(APIView):
+    """
+    Подсказки названий и моделей товаров по началу ввода
+    с учётом опечаток. Отвечает из индекса SuggestIndex в Redis,
+    который перестраивается после каждого импорта прайса.
+    """
+
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'suggest'
+
+    def get(self, request):
+        limit = request.query_params.get('limit', '')
+        if limit.isdigit() and int(limit) > 0:
+            limit = min(int(limit), SUGGEST_MAX_LIMIT)
+        else:
+            limit = SUGGEST_DEFAULT_LIMIT
+
+        results = SuggestIndex.suggest(
+            request.query_params.get('q', ''), limit
+        )
+        return Response({'results': results})
+
+
+@extend_schema_view(
+    get=extend_schema(
+        tags=['Товары'],
+        responses={200: CatalogEntrySerializer}
     )
 )
 class ProductDetailView(APIView):
-    """Детальная информация о товаре"""
+    """
+    Детальная информация о товаре.
+    Отдаётся из кэшированного документа карточки (backend.documents):
+    при попадании - один запрос по первичному ключу за версией,
+    при промахе - ещё один за строкой витрины.
+    """
 
     throttle_classes = [AnonRateThrottle]
 
     def get(self, request, pk):
-        product_info = get_object_or_404(ProductInfo, pk=pk)
-        serializer = ProductInfoSerializer(product_info)
-        return Response(serializer.data)
+        version = document_version(pk)
+        if version is None:
+            raise Http404
+        etag = make_etag(request.accepted_renderer.format, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        data = product_document(pk, version)
+        if data is None:
+            raise Http404
+        response = Response(data)
+        response['ETag'] = etag
+        return response
 
 
 @extend_schema_view(
@@ -407,7 +631,7 @@ class OrderCreateView(APIView):
                 qty = int(qty_str)
 
                 product_info.quantity -= qty
-                product_info.save(update_fields=['quantity'])
+                product_info.save(update_fields=['quantity', 'updated_at'])
 
                 OrderItem.objects.create(
                     order=order,
@@ -432,11 +656,15 @@ class OrderCreateView(APIView):
     )
 )
 class OrderListView(ListAPIView):
-    """Список заказов пользователя."""
+    """Список заказов пользователя. Поддерживает If-None-Match."""
 
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(order_etag)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Order.objects.none()
@@ -460,11 +688,15 @@ class OrderListView(ListAPIView):
     )
 )
 class OrderDetailView(RetrieveAPIView):
-    """Детальная информация о заказе."""
+    """Детальная информация о заказе. Поддерживает If-None-Match."""
 
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(order_etag)
+    def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
     def get_object(self):
         order = get_object_or_404(
             Order.objects.select_related('contact').prefetch_related(
@@ -549,7 +781,14 @@ class PartnerState(APIView):
 
     def post(self, request):
         state = request.data.get('state')
-        Shop.objects.filter(user=request.user).update(state=state)
+        shops = Shop.objects.filter(user=request.user)
+        shop_ids = list(shops.values_list('id', flat=True))
+        shops.update(state=state)
+        # update() минует сигналы, статус в витрине меняется здесь же
+        CatalogEntry.objects.filter(shop_id__in=shop_ids).update(
+            shop_state=state, updated_at=timezone.now()
+        )
+        bump_catalog_versions(*shop_ids)
         return Response({'status': True})
 
 
@@ -642,27 +881,95 @@ def low_stock_list(request):
 @extend_schema_view(
     post=extend_schema(
         tags=['Поставщики'],
-        request={
-            'application/json': {
-                'type': 'object',
-                'properties': {
-                    'shop_id': {'type': 'integer'}
-                }
-            }
-        },
+        request=PartnerExportSerializer,
         responses={202: OpenApiTypes.ANY}
     )
 )
 class PartnerExport(APIView):
-    """Экспорт прайса магазина в фоновом режиме"""
+    """
+    Экспорт прайса магазина в фоновом режиме.
+    Форматы json, ndjson, csv, yaml со сжатием gzip или zstd,
+    любой из них можно загрузить обратно через partners/update.
+    Если каталог не менялся с прошлого экспорта, сразу
+    возвращается ссылка на готовый файл.
+    """
 
+    serializer_class = PartnerExportSerializer
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         if request.user.type != 'shop':
             return Response({'error': 'Только магазины'}, status=403)
-        task = partner_export.delay(request.user.shop.id)
+
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        fmt = serializer.validated_data['format']
+        compression = serializer.validated_data['compression']
+
+        shop = request.user.shop
+        version = export_version(shop)
+        cached = find_cached_export(shop, version, fmt, compression)
+        if cached:
+            return Response({
+                'url': export_url(cached),
+                'catalog_version': version,
+                'message': 'Каталог не менялся, экспорт готов'
+            }, 200)
+
+        task = partner_export.delay(
+            shop.id, fmt=fmt, compression=compression
+        )
         return Response({
             'task_id': task.id,
             'message': 'Экспорт запущен!'
         }, 202)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        tags=['Поставщики'],
+        parameters=[PartnerExportSerializer],
+        responses={200: OpenApiTypes.BINARY, 304: None}
+    )
+)
+class PartnerExportDownload(APIView):
+    """
+    Потоковая выгрузка прайса магазина прямо из БД, без Celery и диска.
+    Параметры format и compression как у PartnerExport.
+    ETag зависит от версии каталога, при совпадении If-None-Match - 304.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if request.user.type != 'shop':
+            return Response({'error': 'Только магазины'}, status=403)
+
+        serializer = PartnerExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        fmt = serializer.validated_data['format']
+        compression = serializer.validated_data['compression']
+
+        shop = request.user.shop
+        version = export_version(shop)
+        etag = export_etag(shop, version, fmt, compression)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        exporter = CatalogExporter(shop)
+        response = StreamingHttpResponse(
+            iter_compressed(exporter.iter_bytes(fmt), compression),
+            content_type=(
+                COMPRESSION_CONTENT_TYPES.get(compression)
+                or EXPORT_CONTENT_TYPES[fmt]
+            )
+        )
+        filename = os.path.basename(
+            export_path(shop, version, fmt, compression)
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
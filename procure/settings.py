@@ -178,6 +178,7 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
         'user': '1000/hour',
+        'suggest': os.getenv('SUGGEST_THROTTLE_RATE', '60/minute'),
     },
     'DEFAULT_PAGINATION_CLASS': (
         'rest_framework.pagination.PageNumberPagination'
@@ -263,6 +264,31 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
+CELERY_BEAT_SCHEDULE = {
+    'cleanup-exports': {
+        'task': 'backend.tasks.cleanup_exports',
+        'schedule': int(os.getenv('EXPORT_CLEANUP_INTERVAL_SECONDS', '3600')),
+    },
+}
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_SHARD_SIZE = int(os.getenv('IMPORT_SHARD_SIZE', '20000'))
+IMPORT_MAX_DOWNLOAD_BYTES = int(
+    os.getenv('IMPORT_MAX_DOWNLOAD_BYTES', str(2 * 1024 ** 3))
+)
+IMPORT_FETCH_RETRIES = int(os.getenv('IMPORT_FETCH_RETRIES', '3'))
+IMPORT_FETCH_BACKOFF = float(os.getenv('IMPORT_FETCH_BACKOFF', '0.5'))
+IMPORT_LOCK_TIMEOUT = int(os.getenv('IMPORT_LOCK_TIMEOUT', '3600'))
+PRICE_SPOOL_STORAGE = os.getenv('PRICE_SPOOL_STORAGE', 'default')
+PRICE_SPOOL_DIR = 'price_spool'
+EXPORT_RETENTION_SECONDS = int(os.getenv('EXPORT_RETENTION_SECONDS', '86400'))
+CHANGES_RETENTION_DAYS = int(os.getenv('CHANGES_RETENTION_DAYS', '30'))
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', '500'))
+# Больше самой долгой транзакции записи товаров (импорт одного шарда)
+CHANGES_SAFETY_LAG_SECONDS = int(
+    os.getenv('CHANGES_SAFETY_LAG_SECONDS', '60')
+)
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
 
 INTERNAL_URL = os.getenv('INTERNAL_URL')
 EXTERNAL_URL = os.getenv('EXTERNAL_URL')